@@ -0,0 +1,131 @@
+"""Admission control for conversion pipelines: a concurrency cap with a bounded wait queue."""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Assumed pipeline latency until one has been observed
+DEFAULT_LATENCY_SECONDS = 30.0
+
+
+class AdmissionRejected(Exception):
+    """The wait queue is full; retry after the given number of seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Conversion queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _percentile(samples, pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class AdmissionController:
+    """Run at most max_concurrent pipelines, queueing at most max_queue more.
+
+    Callers that find the queue full are rejected with a Retry-After estimate
+    derived from the observed pipeline latency. Slots are handed over to
+    waiters in FIFO order.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 32):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.latency_ewma: Optional[float] = None
+        self.wait_times: Deque[float] = deque(maxlen=500)
+        self.stats = {"admitted": 0, "rejected": 0, "completed": 0}
+
+    def retry_after(self, extra_waiting: int = 0) -> int:
+        """Seconds until a new request would likely get a slot."""
+        latency = self.latency_ewma or DEFAULT_LATENCY_SECONDS
+        rounds = (len(self.waiters) + extra_waiting + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * latency))
+
+    def ensure_capacity(self, extra_waiting: int = 0):
+        """Reject now if a new pipeline would not fit in the wait queue.
+
+        extra_waiting counts work queued elsewhere (e.g. pending jobs) that will
+        compete for the same slots.
+        """
+        if self.active >= self.max_concurrent and len(self.waiters) + extra_waiting >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise AdmissionRejected(self.retry_after(extra_waiting))
+
+    def ensure_backlog(self, backlog: int, max_backlog: int, workers: int):
+        """Reject now if max_backlog jobs are already queued or running.
+
+        Jobs reach the pipeline slots only through their own workers, so they
+        never fill the slots or the wait queue; their backlog is bounded here
+        instead, with Retry-After estimated from how fast the workers drain it.
+        """
+        if backlog >= max_backlog:
+            self.stats["rejected"] += 1
+            latency = self.latency_ewma or DEFAULT_LATENCY_SECONDS
+            raise AdmissionRejected(max(1, math.ceil((backlog + 1) / max(1, workers) * latency)))
+
+    async def acquire(self, bounded: bool = True):
+        """Wait for a slot. Unbounded callers are already limited elsewhere and never rejected."""
+        if self.active < self.max_concurrent and not self.waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            self.wait_times.append(0.0)
+            return
+        if bounded and len(self.waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise AdmissionRejected(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        queued_at = time.perf_counter()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            else:
+                self.waiters.remove(waiter)
+            raise
+        self.stats["admitted"] += 1
+        self.wait_times.append(time.perf_counter() - queued_at)
+
+    def release(self):
+        # Hand the slot straight to the next waiter, keeping active unchanged
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def run(self, factory: Callable[[], Awaitable[T]], bounded: bool = True) -> T:
+        """Run factory() inside a slot and record how long it took."""
+        await self.acquire(bounded)
+        started = time.perf_counter()
+        try:
+            return await factory()
+        finally:
+            self.release()
+            latency = time.perf_counter() - started
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            self.stats["completed"] += 1
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "queue_depth": len(self.waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "pipeline_latency_ewma_s": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "wait_p50_s": _percentile(self.wait_times, 50),
+            "wait_p95_s": _percentile(self.wait_times, 95),
+        }
@@ -0,0 +1,184 @@
+"""Split long transcripts into token-budgeted windows and merge per-window output."""
+import hashlib
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Rough English average; good enough for budgeting prompt size
+CHARS_PER_TOKEN = 4
+
+# Seconds between inline "[MM:SS]" markers in window text
+MARKER_INTERVAL = 30
+
+# Share of the token budget a window is filled to before it may end
+MIN_WINDOW_SHARE = 0.7
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format an offset in seconds as MM:SS (or H:MM:SS for long videos)."""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def split_into_windows(segments: List[Dict], max_tokens: int) -> List[Dict]:
+    """Group transcript segments into consecutive windows of at most max_tokens.
+
+    Windows never split a segment. Each window's text carries "[MM:SS]" markers
+    so the model can attribute timestamps to the sections it produces, and each
+    window has a hash of its transcript text (without timings) so regeneration
+    can tell which windows changed.
+
+    Boundaries are content-defined: a window ends at the segment with the
+    lowest text hash among those that would fill it to between
+    MIN_WINDOW_SHARE and all of the budget. An edit to the transcript only
+    moves the boundaries near it, so the windows after it usually come out
+    the same.
+    """
+    entries = [(segment, segment["text"].strip()) for segment in segments]
+    entries = [(segment, text) for segment, text in entries if text]
+    # Markers as they fall in one continuous stream; a window has at most one
+    # more (the one it opens with), which is held back from the budget
+    costs = []
+    last_marker = None
+    for segment, text in entries:
+        start = segment.get("start", 0.0)
+        if last_marker is None or start - last_marker >= MARKER_INTERVAL:
+            text = f"[{format_timestamp(start)}] {text}"
+            last_marker = start
+        costs.append(estimate_tokens(text))
+    max_tokens -= estimate_tokens("[0:00:00] ")
+    min_tokens = int(max_tokens * MIN_WINDOW_SHARE)
+
+    windows = []
+    first = 0
+    while first < len(entries):
+        tokens, cut, cut_hash = 0, None, None
+        last = first
+        while last < len(entries) and (last == first or tokens + costs[last] <= max_tokens):
+            tokens += costs[last]
+            if tokens >= min_tokens:
+                boundary_hash = zlib.crc32(entries[last][1].encode("utf-8"))
+                if cut is None or boundary_hash < cut_hash:
+                    cut, cut_hash = last, boundary_hash
+            last += 1
+        # The rest of the transcript fits in this window
+        end = last if last == len(entries) or cut is None else cut + 1
+        windows.append(_make_window(len(windows), entries[first:end], entries[end][0] if end < len(entries) else None))
+        first = end
+    return windows
+
+
+def _make_window(index: int, entries: List[Tuple[Dict, str]], next_segment: Optional[Dict]) -> Dict:
+    parts = []
+    last_marker = None
+    for segment, text in entries:
+        start = segment.get("start", 0.0)
+        if last_marker is None or start - last_marker >= MARKER_INTERVAL:
+            text = f"[{format_timestamp(start)}] {text}"
+            last_marker = start
+        parts.append(text)
+    if next_segment is not None:
+        end = next_segment.get("start", 0.0)
+    else:
+        last = entries[-1][0]
+        end = last.get("start", 0.0) + last.get("duration", 0.0)
+    return {
+        "index": index,
+        "start": entries[0][0].get("start", 0.0),
+        "end": end,
+        "text": " ".join(parts),
+        "hash": hashlib.sha256("\n".join(text for _, text in entries).encode("utf-8")).hexdigest()[:24],
+    }
+
+
+def merge_partial_courses(partials: List[Dict]) -> Dict:
+    """Reduce per-window course fragments into one ordered course.
+
+    Fragments are taken in window order, sections are renumbered globally,
+    adjacent sections with the same title (a topic spanning a window boundary)
+    are folded together, and visualization references are remapped from
+    window-local section orders to the global ones.
+    """
+    sections: List[Dict] = []
+    visualizations: List[Dict] = []
+
+    for partial in sorted(partials, key=lambda p: p["window"]):
+        local_to_global = {}
+        local_sections = sorted(partial.get("sections", []), key=lambda s: s.get("order", 0))
+        for local_order, section in enumerate(local_sections, start=1):
+            key = str(section.get("order", local_order))
+            previous = sections[-1] if sections else None
+            if previous and previous["title"].strip().lower() == section["title"].strip().lower():
+                previous["content"] = f"{previous['content']}\n\n{section['content']}"
+                local_to_global[key] = previous["order"]
+                continue
+            merged = {
+                "title": section["title"],
+                "content": section["content"],
+                "timestamp": section.get("timestamp"),
+                "order": len(sections) + 1,
+            }
+            sections.append(merged)
+            local_to_global[key] = merged["order"]
+
+        for vis in partial.get("visualizations", []):
+            related = local_to_global.get(str(vis.get("related_section_id")))
+            if related is None:
+                continue
+            visualizations.append({**vis, "related_section_id": str(related)})
+
+    return {"sections": sections, "visualizations": visualizations}
+
+
+class WindowOrderedEmitter:
+    """Release items produced by concurrently generated windows in window order.
+
+    Items from the earliest unfinished window go out immediately; items from
+    later windows are held until every window before them has finished.
+    """
+
+    def __init__(self, window_count: int, emit: Callable[[Dict], None]):
+        self.emit = emit
+        self.held: List[List[Dict]] = [[] for _ in range(window_count)]
+        self.finished = [False] * window_count
+        self.current = 0
+
+    def add(self, window: int, item: Dict):
+        if window == self.current:
+            self.emit(item)
+        else:
+            self.held[window].append(item)
+
+    def finish(self, window: int):
+        self.finished[window] = True
+        while self.current < len(self.finished) and self.finished[self.current]:
+            self.current += 1
+            if self.current < len(self.held):
+                for item in self.held[self.current]:
+                    self.emit(item)
+                self.held[self.current] = []
+
+
+class StageTimer:
+    """Collect wall-clock durations (in ms) of named pipeline stages."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 2)
@@ -0,0 +1,181 @@
+"""Rate limiting, circuit breaking and retries around Gemini calls."""
+import asyncio
+import functools
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+@functools.lru_cache(maxsize=None)
+def retryable_errors() -> Tuple[type, ...]:
+    """Upstream errors worth retrying: throttling and transient server failures."""
+    # Imported on first failure, so loading this module doesn't pull in the Google SDK
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+        ConnectionError,
+        TimeoutError,
+    )
+
+
+class CircuitOpenError(Exception):
+    """Gemini is failing; calls are refused until the breaker half-opens."""
+
+    def __init__(self, retry_in: float):
+        super().__init__(f"Gemini circuit is open, retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    """Continuously refilling bucket of `rate_per_minute` units, holding up to a minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Take amount units, sleeping until they are available; returns the time waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        # The lock keeps waiters in FIFO order
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self.tokens -= amount
+        return waited
+
+    def snapshot(self) -> Dict:
+        self._refill()
+        return {"available": round(self.tokens, 1), "capacity": self.capacity}
+
+
+class CircuitBreaker:
+    """Open after `failure_threshold` consecutive failures, half-open after `reset_seconds`.
+
+    While half-open a single trial call is let through; its outcome closes or
+    re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(remaining)
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self.trial_in_flight:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.reset_seconds)
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+
+    def release_trial(self):
+        """The trial ended without an outcome (e.g. cancelled); the next call becomes the trial."""
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.stats["opened"] += 1
+                logger.warning(f"Gemini circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+class GeminiGuard:
+    """Apply the RPM/TPM quota, the circuit breaker and jittered retries to a Gemini call."""
+
+    def __init__(self, requests_per_minute: float = 60, tokens_per_minute: float = 120000,
+                 failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_cap: float = 8.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "throttled_seconds": 0.0}
+
+    async def call(self, factory: Callable[[], Awaitable[T]], tokens: int = 0, retry: bool = True) -> T:
+        """Await factory() under the quota and breaker, retrying transient errors.
+
+        tokens is the estimated prompt plus output size charged against the
+        tokens-per-minute quota. Calls that can't safely be repeated (e.g. a
+        stream that already produced output) pass retry=False.
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                self.stats["throttled_seconds"] += await self.requests.acquire(1)
+                self.stats["throttled_seconds"] += await self.tokens.acquire(tokens)
+                self.stats["calls"] += 1
+                result = await factory()
+            except Exception as e:
+                self.breaker.record_failure()
+                self.stats["failures"] += 1
+                if not retry or attempt >= self.max_retries or not isinstance(e, retryable_errors()):
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                # Full jitter: sleep anywhere up to the exponential bound
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                logger.warning(f"Gemini call failed ({type(e).__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled while throttled or in flight: no outcome to record,
+                # but a half-open trial must not stay taken
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "throttled_seconds": round(self.stats["throttled_seconds"], 2),
+            "requests_bucket": self.requests.snapshot(),
+            "tokens_bucket": self.tokens.snapshot(),
+            "breaker": self.breaker.snapshot(),
+        }
@@ -0,0 +1,150 @@
+"""Async YouTube Data API client with pooled connections, batched lookups and a TTL cache."""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from http_cache import HotCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://www.googleapis.com/youtube/v3"
+
+# videos.list accepts at most 50 ids per call, and costs one quota unit however many it gets
+MAX_BATCH_SIZE = 50
+
+# Preferred thumbnail sizes, largest first
+THUMBNAIL_SIZES = ("maxres", "standard", "high", "medium", "default")
+
+
+def parse_video(item: Dict) -> Dict:
+    """Course-facing metadata from a videos.list item."""
+    snippet = item.get("snippet", {})
+    thumbnails = snippet.get("thumbnails", {})
+    thumbnail = next((thumbnails[size]["url"] for size in THUMBNAIL_SIZES if size in thumbnails), None)
+    return {
+        "title": snippet.get("title", ""),
+        "description": snippet.get("description", ""),
+        "thumbnail_url": thumbnail or f"https://img.youtube.com/vi/{item['id']}/maxresdefault.jpg",
+        "channel_title": snippet.get("channelTitle"),
+        "published_at": snippet.get("publishedAt"),
+        "duration": item.get("contentDetails", {}).get("duration"),
+    }
+
+
+class YouTubeMetadataClient:
+    """Look up video metadata, coalescing concurrent lookups into batched videos.list calls.
+
+    Ids requested within batch_window seconds of each other (or until 50 are
+    waiting) go out in one request over a shared keep-alive connection pool.
+    Callers asking for an id that is already waiting or in flight share its
+    result. Found videos are cached for cache_ttl seconds; unknown or private
+    videos resolve to None.
+    """
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_API_URL, batch_window: float = 0.01,
+                 cache_size: int = 10000, cache_ttl: float = 3600, max_connections: int = 10,
+                 timeout: float = 10.0, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.batch_window = batch_window
+        self.max_connections = max_connections
+        self.timeout = timeout
+        # transport lets tests and benchmarks point the client at a local stand-in
+        self.transport = transport
+        self.cache = HotCache(cache_size, cache_ttl)
+        self.http: Optional[httpx.AsyncClient] = None
+        self.futures: Dict[str, asyncio.Future] = {}
+        self.pending: List[str] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Task] = set()
+        self.stats = {"api_calls": 0, "videos_requested": 0, "coalesced": 0, "failures": 0}
+
+    def _client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+        return self.http
+
+    async def get(self, video_id: str) -> Optional[Dict]:
+        metadata = self.cache.get(video_id)
+        if metadata is not None:
+            return metadata
+        future = self.futures.get(video_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.futures[video_id] = loop.create_future()
+            self.pending.append(video_id)
+            if len(self.pending) >= MAX_BATCH_SIZE:
+                self._dispatch()
+            elif self.flush_handle is None:
+                self.flush_handle = loop.call_later(self.batch_window, self._dispatch)
+        else:
+            self.stats["coalesced"] += 1
+        # A cancelled caller must not cancel the lookup for everyone sharing it
+        return await asyncio.shield(future)
+
+    def _dispatch(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending:
+            batch, self.pending = self.pending[:MAX_BATCH_SIZE], self.pending[MAX_BATCH_SIZE:]
+            task = asyncio.ensure_future(self._fetch(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _fetch(self, video_ids: List[str]):
+        self.stats["api_calls"] += 1
+        self.stats["videos_requested"] += len(video_ids)
+        try:
+            response = await self._client().get("/videos", params={
+                "part": "snippet,contentDetails",
+                "id": ",".join(video_ids),
+                "key": self.api_key,
+                "maxResults": MAX_BATCH_SIZE,
+            })
+            response.raise_for_status()
+            found = {item["id"]: parse_video(item) for item in response.json().get("items", [])}
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error(f"YouTube metadata lookup for {len(video_ids)} video(s) failed: {str(e)}")
+            for video_id in video_ids:
+                future = self.futures.pop(video_id)
+                if not future.done():
+                    future.set_exception(e)
+                    # Don't warn about failures nobody was left waiting for
+                    future.exception()
+            return
+
+        for video_id in video_ids:
+            metadata = found.get(video_id)
+            if metadata is not None:
+                self.cache.put(video_id, metadata)
+            future = self.futures.pop(video_id)
+            if not future.done():
+                future.set_result(metadata)
+
+    async def close(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        for task in list(self.tasks):
+            task.cancel()
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "in_flight": len(self.futures),
+            "cache": self.cache.snapshot(),
+        }
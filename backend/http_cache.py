@@ -0,0 +1,75 @@
+"""HTTP caching helpers: strong ETags, conditional GET and an in-process hot cache."""
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def course_etag(course: Dict) -> str:
+    """Strong ETag from the course id and its content version."""
+    return f'"{course["id"]}-v{course.get("version", 1)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the current ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def modified_since(if_modified_since: Optional[str], modified: float) -> bool:
+    """Whether a resource changed after an If-Modified-Since date (true when the header is unusable)."""
+    if not if_modified_since:
+        return True
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (AttributeError, TypeError, ValueError):
+        return True
+    # HTTP dates have whole-second precision
+    return int(modified) > since
+
+
+class HotCache:
+    """Small LRU of rendered responses with a per-entry time to live.
+
+    The TTL bounds how long a worker can serve a copy that another worker has
+    since replaced.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, key: str):
+        self.entries.pop(key, None)
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "entries": len(self.entries), "max_entries": self.max_entries}
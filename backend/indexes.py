@@ -0,0 +1,160 @@
+"""Declare, reconcile and inspect the Mongo indexes the backend relies on."""
+import logging
+from typing import Dict, List, Optional
+
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Index options that make two indexes on the same keys different
+COMPARED_OPTIONS = ("unique", "expireAfterSeconds", "sparse", "partialFilterExpression")
+
+
+def _differences(existing: Dict, wanted: Dict) -> List[str]:
+    differences = []
+    if "text" in wanted["key"].values():
+        # Text indexes are stored under _fts/_ftsx, with their fields in the weights
+        if dict(existing.get("weights", {})) != wanted.get("weights"):
+            differences.append("key")
+    elif [tuple(k) for k in existing["key"]] != list(wanted["key"].items()):
+        differences.append("key")
+    for option in COMPARED_OPTIONS:
+        if existing.get(option) != wanted.get(option):
+            differences.append(option)
+    return differences
+
+
+def _model_from_info(name: str, info: Dict) -> IndexModel:
+    """An IndexModel recreating an existing index from its index_information() entry."""
+    options = {option: info[option] for option in COMPARED_OPTIONS if option in info}
+    if "weights" in info:
+        keys = [(field, "text") for field in info["weights"]]
+        options.update({option: info[option] for option in ("weights", "default_language", "language_override")
+                        if option in info})
+    else:
+        keys = [tuple(key) for key in info["key"]]
+    return IndexModel(keys, name=name, **options)
+
+
+async def _duplicate_key(collection, wanted: Dict) -> Optional[Dict]:
+    """A key value held by more than one document, which would block a unique index."""
+    fields = list(wanted["key"])
+    pipeline = []
+    if wanted.get("partialFilterExpression"):
+        pipeline.append({"$match": wanted["partialFilterExpression"]})
+    if wanted.get("sparse"):
+        pipeline.append({"$match": {"$or": [{field: {"$exists": True}} for field in fields]}})
+    pipeline += [
+        {"$group": {"_id": {field.replace(".", "_"): f"${field}" for field in fields}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 1},
+    ]
+    async for group in collection.aggregate(pipeline, allowDiskUse=True):
+        return group["_id"]
+    return None
+
+
+def _degrade(collection_name: str, statuses: Dict[str, str], models: List[IndexModel], error: Exception):
+    """Report indexes that could not be reconciled because of a driver error."""
+    for model in models:
+        statuses[model.document["name"]] = f"degraded: {str(error)}"
+    logger.error(f"Index reconciliation for {collection_name} skipped {len(models)} index(es): {str(error)}")
+
+
+async def reconcile_indexes(db, required: Dict[str, List[IndexModel]]) -> Dict[str, Dict[str, str]]:
+    """Make each collection's managed indexes match the declared ones.
+
+    Missing indexes are created; a changed TTL is applied in place with collMod,
+    and any other changed option rebuilds the index. A rebuild into a unique
+    index is skipped (and reported) while duplicate keys would block it, and
+    a rebuild whose create fails puts the previous index back, so a bad
+    declaration never leaves the collection without one. Indexes that aren't
+    declared are left alone.
+
+    Mongo being unreachable (or any other driver error that isn't a command
+    failure) never raises: the collection's remaining indexes are reported as
+    "degraded" and reconciliation moves on, so the app still starts. Returns
+    {collection: {index name: status}}.
+    """
+    report: Dict[str, Dict[str, str]] = {}
+    for collection_name, models in required.items():
+        collection = db[collection_name]
+        statuses = report.setdefault(collection_name, {})
+        try:
+            existing = await collection.index_information()
+        except OperationFailure:
+            # Collection does not exist yet
+            existing = {}
+        except PyMongoError as e:
+            _degrade(collection_name, statuses, models, e)
+            continue
+
+        for position, model in enumerate(models):
+            wanted = model.document
+            name = wanted["name"]
+            current = existing.get(name)
+            try:
+                if current is None:
+                    await collection.create_indexes([model])
+                    statuses[name] = "created"
+                    continue
+                differences = _differences(current, wanted)
+                if not differences:
+                    statuses[name] = "ok"
+                elif differences == ["expireAfterSeconds"] and "expireAfterSeconds" in current:
+                    await db.command("collMod", collection_name, index={
+                        "name": name, "expireAfterSeconds": wanted["expireAfterSeconds"],
+                    })
+                    statuses[name] = "ttl_updated"
+                else:
+                    duplicate = await _duplicate_key(collection, wanted) if wanted.get("unique") else None
+                    if duplicate is not None:
+                        statuses[name] = f"conflict: duplicate key {duplicate} blocks the unique index"
+                        logger.error(f"Index {collection_name}.{name} left as it is: duplicate key {duplicate}")
+                        continue
+                    await collection.drop_index(name)
+                    try:
+                        await collection.create_indexes([model])
+                    except Exception as e:
+                        try:
+                            await collection.create_indexes([_model_from_info(name, current)])
+                        except PyMongoError as restore_error:
+                            statuses[name] = f"degraded: rebuild failed ({str(e)}) and the previous index " \
+                                             f"could not be restored ({str(restore_error)})"
+                            logger.error(f"Index {collection_name}.{name} is missing: {statuses[name]}")
+                            continue
+                        logger.error(f"Index {collection_name}.{name} restored after its rebuild failed")
+                        raise
+                    statuses[name] = "rebuilt"
+            except OperationFailure as e:
+                # e.g. duplicates that block a unique index; the app still runs
+                statuses[name] = f"failed: {e.details.get('errmsg', str(e)) if e.details else str(e)}"
+                logger.error(f"Index {collection_name}.{name} could not be built: {str(e)}")
+            except PyMongoError as e:
+                # Lost the server (or similar): the rest of this collection would fail the same way
+                _degrade(collection_name, statuses, models[position:], e)
+                break
+
+        changed = {name: status for name, status in statuses.items() if status != "ok"}
+        if changed:
+            logger.info(f"Index reconciliation for {collection_name}: {changed}")
+    return report
+
+
+def plan_stages(explain: Dict) -> List[str]:
+    """Flatten the stages of the winning plan in an explain() result."""
+    planner = explain.get("queryPlanner", {})
+    plan = planner.get("winningPlan", {})
+    # Slot-based engine wraps the classic plan tree
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", []))
+    return stages
@@ -0,0 +1,239 @@
+"""Persistent course-generation jobs drained by an in-process worker pool."""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo import IndexModel, ReturnDocument
+
+from metrics import aggregate_timings, collected_timings
+
+logger = logging.getLogger(__name__)
+
+# Job states, in pipeline order
+JOB_QUEUED = "queued"
+JOB_FETCHING_TRANSCRIPT = "fetching_transcript"
+JOB_GENERATING = "generating"
+JOB_STORED = "stored"
+JOB_FAILED = "failed"
+
+ACTIVE_STATES = [JOB_QUEUED, JOB_FETCHING_TRANSCRIPT, JOB_GENERATING]
+RUNNING_STATES = [JOB_FETCHING_TRANSCRIPT, JOB_GENERATING]
+
+# Rough progress reported to pollers for each state
+JOB_PROGRESS = {
+    JOB_QUEUED: 0.0,
+    JOB_FETCHING_TRANSCRIPT: 0.1,
+    JOB_GENERATING: 0.4,
+    JOB_STORED: 1.0,
+    JOB_FAILED: 1.0,
+}
+
+# Called by a job handler to advance the job to another running state
+SetStatus = Callable[[str], Awaitable[None]]
+JobHandler = Callable[[Dict, SetStatus], Awaitable[str]]
+
+
+class JobQueue:
+    """Drain jobs stored in a Mongo collection with a fixed number of workers.
+
+    Newly submitted jobs are handed to the local workers through an asyncio queue.
+    A worker claims a job atomically before running it and keeps a lease on it
+    while it runs, so jobs whose lease expires (the owning process crashed) are
+    re-queued by whichever process notices first. Queued jobs nobody has
+    claimed within a lease period (the process that queued them is gone) are
+    picked up the same way. Finished jobs are removed by a TTL index
+    retention_seconds after they finish.
+    """
+
+    def __init__(self, collection, handler: JobHandler, concurrency: int = 2,
+                 lease_seconds: int = 60, max_attempts: int = 3, retention_seconds: int = 7 * 24 * 3600):
+        self.collection = collection
+        self.handler = handler
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Set[str] = set()
+        self.running = 0
+        # Submissions admitted but not yet on the local queue
+        self.reserved = 0
+        self.tasks: List[asyncio.Task] = []
+
+    def index_models(self) -> List[IndexModel]:
+        return [
+            IndexModel("id", unique=True),
+            # find_active and the stale-lease and unclaimed-job scans
+            IndexModel([("video_id", 1), ("status", 1)]),
+            IndexModel([("status", 1), ("lease_expires_at", 1)]),
+            IndexModel([("status", 1), ("updated_at", 1)]),
+            # Retention of stored and failed jobs
+            IndexModel("finished_at", expireAfterSeconds=self.retention_seconds),
+        ]
+
+    async def start(self):
+        """Resume unfinished jobs and start the workers and the lease reaper."""
+        await self.requeue_stale()
+        self.tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+        self.tasks.append(asyncio.ensure_future(self._reaper()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def submit(self, job: Dict) -> Dict:
+        """Persist a new job and hand it to the local workers."""
+        job = {**job, "status": JOB_QUEUED, "progress": JOB_PROGRESS[JOB_QUEUED]}
+        await self.collection.insert_one(dict(job))
+        self._enqueue(job["id"])
+        return job
+
+    def reserve(self):
+        """Count a submission against the backlog before its insert is awaited.
+
+        Call it in the same step as the backlog check, then release() once
+        submit() has returned or failed, so concurrent submissions cannot all
+        pass the check while their inserts are in flight.
+        """
+        self.reserved += 1
+
+    def release(self):
+        self.reserved -= 1
+
+    def backlog(self) -> int:
+        """Jobs this process has queued, is running, or is about to queue."""
+        return self.queue.qsize() + self.running + self.reserved
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self.pending:
+            self.pending.add(job_id)
+            self.queue.put_nowait(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def find_active(self, video_id: str) -> Optional[Dict]:
+        return await self.collection.find_one(
+            {"video_id": video_id, "status": {"$in": ACTIVE_STATES}}, {"_id": 0}
+        )
+
+    async def requeue_stale(self):
+        """Queue jobs whose lease has expired, and queued jobs left unclaimed for a lease period.
+
+        Jobs still queued by a live process are left to it, so a scan only
+        touches jobs that lost their owner.
+        """
+        now = datetime.utcnow()
+        stale = {"status": {"$in": RUNNING_STATES}, "lease_expires_at": {"$lt": now}}
+        expired = [job["id"] async for job in self.collection.find(stale, {"id": 1})]
+        if expired:
+            await self.collection.update_many({**stale, "id": {"$in": expired}}, {"$set": {
+                "status": JOB_QUEUED,
+                "progress": JOB_PROGRESS[JOB_QUEUED],
+                "worker_id": None,
+                "updated_at": now,
+            }})
+        unclaimed = {"status": JOB_QUEUED, "updated_at": {"$lt": now - timedelta(seconds=self.lease_seconds)}}
+        job_ids = expired + [job["id"] async for job in self.collection.find(unclaimed, {"id": 1})]
+        for job_id in job_ids:
+            self._enqueue(job_id)
+        if job_ids:
+            logger.info(f"Queued {len(job_ids)} unfinished job(s) on {self.worker_id}")
+
+    async def _claim(self, job_id: str) -> Optional[Dict]:
+        """Atomically take ownership of a queued job."""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"id": job_id, "status": JOB_QUEUED},
+            {
+                "$set": {
+                    "status": JOB_FETCHING_TRANSCRIPT,
+                    "progress": JOB_PROGRESS[JOB_FETCHING_TRANSCRIPT],
+                    "worker_id": self.worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _update(self, job_id: str, fields: Dict):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"id": job_id, "worker_id": self.worker_id},
+            {"$set": {**fields, "updated_at": now,
+                      "lease_expires_at": now + timedelta(seconds=self.lease_seconds)}},
+        )
+
+    async def _heartbeat(self, job_id: str):
+        """Keep extending the lease of a running job."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self._update(job_id, {})
+
+    async def _run(self, job: Dict):
+        job_id = job["id"]
+
+        async def set_status(status: str):
+            await self._update(job_id, {"status": status, "progress": JOB_PROGRESS[status]})
+
+        if job["attempts"] > self.max_attempts:
+            await self._update(job_id, {"status": JOB_FAILED, "progress": JOB_PROGRESS[JOB_FAILED],
+                                        "error": "Too many attempts", "finished_at": datetime.utcnow()})
+            return
+
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+        started = time.perf_counter()
+        # Pipeline stage timings of this attempt, kept on the job since no request waits for it
+        with collected_timings() as timings:
+            try:
+                course_id = await self.handler(job, set_status)
+                outcome = {"status": JOB_STORED, "progress": JOB_PROGRESS[JOB_STORED], "course_id": course_id}
+            except asyncio.CancelledError:
+                heartbeat.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Job {job_id} for video {job['video_id']} failed: {str(e)}")
+                outcome = {"status": JOB_FAILED, "progress": JOB_PROGRESS[JOB_FAILED], "error": str(e)}
+        heartbeat.cancel()
+        timings.append(("total", (time.perf_counter() - started) * 1000))
+        await self._update(job_id, {**outcome, "timings": aggregate_timings(timings),
+                                    "finished_at": datetime.utcnow()})
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            self.pending.discard(job_id)
+            try:
+                job = await self._claim(job_id)
+                # Another worker or process already took it
+                if job is not None:
+                    self.running += 1
+                    try:
+                        await self._run(job)
+                    finally:
+                        self.running -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker error on job {job_id}: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self.requeue_stale()
+            except Exception as e:
+                logger.error(f"Error re-queueing stale jobs: {str(e)}")
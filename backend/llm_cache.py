@@ -0,0 +1,96 @@
+"""Content-addressed cache of raw LLM responses with a memory and a Mongo tier."""
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import IndexModel
+
+logger = logging.getLogger(__name__)
+
+
+class LLMResponseCache:
+    """Cache model responses keyed on a hash of (model, generation config, prompt).
+
+    Lookups go to an in-memory LRU bounded by total response size first, then to
+    a Mongo collection whose entries expire through a TTL index. Persistent hits
+    are promoted into memory.
+    """
+
+    def __init__(self, collection, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: int = 30 * 24 * 3600):
+        self.collection = collection
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.size_bytes = 0
+        self.stats = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0, "writes": 0}
+
+    @staticmethod
+    def make_key(model_name: str, generation_config: Dict, prompt: str) -> str:
+        payload = json.dumps([model_name, generation_config, prompt], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def index_models(self) -> List[IndexModel]:
+        return [
+            IndexModel("key", unique=True),
+            IndexModel("created_at", expireAfterSeconds=self.ttl_seconds),
+        ]
+
+    async def get(self, key: str) -> Optional[str]:
+        response = self.entries.get(key)
+        if response is not None:
+            self.entries.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return response
+
+        try:
+            doc = await self.collection.find_one({"key": key}, {"_id": 0, "response": 1})
+        except Exception as e:
+            logger.error(f"LLM cache lookup failed: {str(e)}")
+            doc = None
+        if doc is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["persistent_hits"] += 1
+        self._remember(key, doc["response"])
+        return doc["response"]
+
+    async def put(self, key: str, response: str):
+        self._remember(key, response)
+        self.stats["writes"] += 1
+        try:
+            await self.collection.update_one(
+                {"key": key},
+                {"$set": {"response": response, "created_at": datetime.utcnow()}},
+                upsert=True,
+            )
+        except Exception as e:
+            # The memory tier still holds it; persistence is best effort
+            logger.error(f"LLM cache write failed: {str(e)}")
+
+    def _remember(self, key: str, response: str):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size_bytes -= len(self.entries.pop(key).encode("utf-8"))
+        self.entries[key] = response
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size_bytes -= len(evicted.encode("utf-8"))
+            self.stats["evictions"] += 1
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats["memory_hits"] + self.stats["persistent_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["persistent_hits"]
+        return {
+            **self.stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "entries": len(self.entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,441 @@
+"""Tolerant, incremental extraction of course JSON from model output."""
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+NUMBER = re.compile(r"-?\d+(\.\d+)?([eE][+-]?\d+)?")
+BARE_WORD = re.compile(r"[A-Za-z_$][\w$-]*")
+LITERALS = {"true": True, "false": False, "null": None}
+# Python spellings the model sometimes slips into
+PYTHON_LITERALS = {"True": True, "False": False, "None": None}
+ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# What may follow the closing quote of a string
+STRING_END = set(",:}]")
+
+
+class _Truncated(Exception):
+    """The text ended inside a value; partial is what was parsed of it."""
+
+    def __init__(self, partial: Any):
+        self.partial = partial
+
+
+class TolerantJSONParser:
+    """Single-pass recursive-descent parser for the JSON models actually write.
+
+    Accepts leading prose and code fences, comments, trailing, missing and
+    doubled commas, unquoted keys and values, single quotes, Python literals,
+    raw control characters and unescaped quotes inside strings, and mismatched
+    closing brackets. Each deviation is recorded in repairs. When the text
+    ends early, arrays keep every element that was complete and drop the one
+    that was cut off, and objects keep their complete members.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.position = 0
+        self.repairs: List[str] = []
+
+    def parse(self) -> Tuple[Any, bool]:
+        """The first top-level object or array in the text, and whether it was complete."""
+        start = self.text.find("{")
+        if start < 0:
+            return None, False
+        self.position = start
+        try:
+            return self._value(), True
+        except _Truncated as e:
+            return e.partial, False
+
+    def _repair(self, kind: str):
+        self.repairs.append(kind)
+
+    def _skip(self):
+        text = self.text
+        while self.position < len(text):
+            char = text[self.position]
+            if char.isspace():
+                self.position += 1
+            elif text.startswith("//", self.position) or char == "#":
+                end = text.find("\n", self.position)
+                self.position = len(text) if end < 0 else end + 1
+                self._repair("comment")
+            elif text.startswith("/*", self.position):
+                end = text.find("*/", self.position + 2)
+                self.position = len(text) if end < 0 else end + 2
+                self._repair("comment")
+            else:
+                return
+
+    def _peek(self) -> Optional[str]:
+        self._skip()
+        return self.text[self.position] if self.position < len(self.text) else None
+
+    def _value(self) -> Any:
+        char = self._peek()
+        if char is None:
+            raise _Truncated(None)
+        if char == "{":
+            return self._object()
+        if char == "[":
+            return self._array()
+        if char in "\"'":
+            return self._string()
+        return self._scalar()
+
+    def _object(self) -> Dict:
+        result: Dict = {}
+        self.position += 1
+        while True:
+            char = self._peek()
+            if char is None:
+                raise _Truncated(result)
+            if char == "}":
+                self.position += 1
+                return result
+            if char == "]":
+                self._repair("mismatched bracket")
+                self.position += 1
+                return result
+            if char == ",":
+                self._repair("extra comma")
+                self.position += 1
+                continue
+
+            if char in "\"'":
+                key = self._string()
+            else:
+                match = BARE_WORD.match(self.text, self.position)
+                if not match:
+                    # Not a key; skip the character and look again
+                    self._repair("stray character")
+                    self.position += 1
+                    continue
+                self._repair("unquoted key")
+                key = match.group()
+                self.position = match.end()
+            char = self._peek()
+            if char is None:
+                raise _Truncated(result)
+            if char == ":":
+                self.position += 1
+            else:
+                self._repair("missing colon")
+            try:
+                result[key] = self._value()
+            except _Truncated as e:
+                if e.partial is not None:
+                    result[key] = e.partial
+                raise _Truncated(result)
+
+            char = self._peek()
+            if char is None:
+                raise _Truncated(result)
+            if char == ",":
+                self.position += 1
+                if self._peek() == "}":
+                    self._repair("trailing comma")
+            elif char not in "}]":
+                self._repair("missing comma")
+
+    def _array(self) -> List:
+        items: List = []
+        self.position += 1
+        while True:
+            char = self._peek()
+            if char is None:
+                raise _Truncated(items)
+            if char == "]":
+                self.position += 1
+                return items
+            if char == "}":
+                self._repair("mismatched bracket")
+                self.position += 1
+                return items
+            if char == ",":
+                self._repair("extra comma")
+                self.position += 1
+                continue
+            try:
+                items.append(self._value())
+            except _Truncated:
+                # The element that was cut off is dropped
+                raise _Truncated(items)
+
+            char = self._peek()
+            if char is None:
+                raise _Truncated(items)
+            if char == ",":
+                self.position += 1
+                if self._peek() == "]":
+                    self._repair("trailing comma")
+            elif char not in "]}":
+                self._repair("missing comma")
+
+    def _string(self) -> str:
+        text = self.text
+        quote = text[self.position]
+        if quote == "'":
+            self._repair("single quotes")
+        self.position += 1
+        parts = []
+        start = self.position
+        while self.position < len(text):
+            char = text[self.position]
+            if char == "\\":
+                parts.append(text[start:self.position])
+                escape = text[self.position + 1:self.position + 2]
+                if escape == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[self.position + 2:self.position + 6]):
+                    parts.append(chr(int(text[self.position + 2:self.position + 6], 16)))
+                    self.position += 6
+                elif escape in ESCAPES:
+                    parts.append(ESCAPES[escape])
+                    self.position += 2
+                elif not escape:
+                    break
+                else:
+                    self._repair("invalid escape")
+                    parts.append(escape)
+                    self.position += 2
+                start = self.position
+                continue
+            if char == quote:
+                # A quote followed by anything but a delimiter is part of the text
+                following = self.position + 1
+                while following < len(text) and text[following] in " \t\r":
+                    following += 1
+                if (following >= len(text) or text[following] in STRING_END or text[following] == "\n"
+                        or text.startswith(("//", "/*"), following)):
+                    parts.append(text[start:self.position])
+                    self.position += 1
+                    return "".join(parts)
+                self._repair("unescaped quote")
+            elif char < " " and char not in "\t":
+                # Raw newlines and other control characters are kept as they are
+                if char == "\n":
+                    self._repair("raw newline")
+            self.position += 1
+        parts.append(text[start:self.position])
+        raise _Truncated(None)
+
+    def _scalar(self) -> Any:
+        text = self.text
+        match = NUMBER.match(text, self.position)
+        if match and self._ends_value(match.end()):
+            self.position = match.end()
+            number = match.group()
+            return float(number) if match.group(1) or match.group(2) else int(number)
+        match = BARE_WORD.match(text, self.position)
+        if match and self._ends_value(match.end()):
+            word = match.group()
+            if word in LITERALS or word in PYTHON_LITERALS:
+                if word in PYTHON_LITERALS:
+                    self._repair("python literal")
+                self.position = match.end()
+                return LITERALS.get(word, PYTHON_LITERALS.get(word))
+        # Anything else up to the next delimiter is an unquoted string
+        end = self.position
+        while end < len(text) and text[end] not in ",}]\n" and not text.startswith(("//", "/*"), end):
+            end += 1
+        if end >= len(text):
+            raise _Truncated(None)
+        self._repair("unquoted value")
+        value = text[self.position:end].strip()
+        self.position = end
+        return value
+
+    def _ends_value(self, index: int) -> bool:
+        while index < len(self.text) and self.text[index] in " \t\r":
+            index += 1
+        return index >= len(self.text) or self.text[index] in ",}]\n" or self.text.startswith(("//", "/*"), index)
+
+
+def parse_tolerant(text: str) -> Tuple[Any, bool, List[str]]:
+    """Parse possibly malformed or truncated JSON: (value, complete, repairs)."""
+    parser = TolerantJSONParser(text)
+    value, complete = parser.parse()
+    return value, complete, parser.repairs
+
+
+class ParsedCourse(NamedTuple):
+    """Course content recovered from one model response."""
+    sections: List[Dict]
+    visualizations: List[Dict]
+    # The response parsed to its end
+    complete: bool
+    repairs: List[str]
+    # Elements that parsed but weren't sections or visualizations
+    invalid: int
+
+    @property
+    def clean(self) -> bool:
+        return self.complete and not self.repairs and not self.invalid
+
+
+def parse_course(text: str, validate_section, validate_visualization) -> ParsedCourse:
+    """Recover every complete, valid section and visualization from a model response.
+
+    validate_* take an element and return its normalized form, or None when
+    it isn't valid.
+    """
+    value, complete, repairs = parse_tolerant(text)
+    if not isinstance(value, dict):
+        return ParsedCourse([], [], False, repairs, 0)
+    invalid = 0
+    sections = []
+    for position, element in enumerate(value.get("sections") or [], start=1):
+        section = validate_section(element, position) if isinstance(element, dict) else None
+        if section is None:
+            invalid += 1
+        else:
+            sections.append(section)
+    visualizations = []
+    for element in value.get("visualizations") or []:
+        visualization = validate_visualization(element) if isinstance(element, dict) else None
+        if visualization is None:
+            invalid += 1
+        else:
+            visualizations.append(visualization)
+    return ParsedCourse(sections, visualizations, complete, repairs, invalid)
+
+
+def continuation_prompt(prompt: str, sections: List[Dict]) -> str:
+    """Ask again for only what a cut-off or malformed answer is missing."""
+    if not sections:
+        return (f"{prompt}\n"
+                "Your previous answer could not be read. Respond with only the JSON object described above.")
+    done = "\n".join(
+        f"{section['order']}. {section['title']} ({section.get('timestamp') or 'no timestamp'})" for section in sections
+    )
+    return (
+        f"{prompt}\n"
+        "Your previous answer was cut off or malformed after these sections:\n"
+        f"{done}\n"
+        "Do not repeat them. Respond with only the JSON object described above, containing the sections "
+        f"that come after them, numbered from {len(sections) + 1}, and any visualization."
+    )
+
+
+def merge_continuation(content: Dict, more: ParsedCourse) -> Dict:
+    """Append a continuation's new sections to the content so far, renumbered after it."""
+    sections = [dict(section) for section in content["sections"]]
+    known_titles = {section["title"].strip().lower() for section in sections}
+    renumbered = {}
+    for section in more.sections:
+        if section["title"].strip().lower() in known_titles:
+            continue
+        renumbered[str(section["order"])] = len(sections) + 1
+        sections.append({**section, "order": len(sections) + 1})
+    visualizations = list(content["visualizations"])
+    for visualization in more.visualizations:
+        related = renumbered.get(str(visualization["related_section_id"]))
+        if related is not None:
+            visualizations.append({**visualization, "related_section_id": str(related)})
+    return {"sections": sections, "visualizations": visualizations}
+
+
+class ParseStats:
+    """Counts of how model responses parsed, for /api/stats."""
+
+    def __init__(self):
+        self.stats = {
+            "responses": 0, "clean": 0, "repaired": 0, "partial": 0, "failed": 0,
+            "recovered_sections": 0, "invalid_elements": 0, "continuations": 0, "continued_sections": 0,
+        }
+        self.repairs: Dict[str, int] = {}
+
+    def record(self, parsed: ParsedCourse) -> str:
+        """Count a parsed response and return its outcome."""
+        if parsed.clean:
+            outcome = "clean"
+        elif not parsed.sections:
+            outcome = "failed"
+        elif parsed.complete and not parsed.invalid:
+            outcome = "repaired"
+        else:
+            outcome = "partial"
+        self.stats["responses"] += 1
+        self.stats[outcome] += 1
+        if outcome != "clean":
+            # Sections a strict json.loads of the response would have lost
+            self.stats["recovered_sections"] += len(parsed.sections)
+        self.stats["invalid_elements"] += parsed.invalid
+        for kind in set(parsed.repairs):
+            self.repairs[kind] = self.repairs.get(kind, 0) + 1
+        return outcome
+
+    def snapshot(self) -> Dict:
+        responses = self.stats["responses"]
+        usable = responses - self.stats["failed"]
+        return {
+            **self.stats,
+            "success_rate": round(usable / responses, 4) if responses else None,
+            "repairs": dict(self.repairs),
+        }
+
+
+class CourseStreamParser:
+    """Yield each element of the top-level arrays of a JSON object as it completes.
+
+    The model answers with {"sections": [...], "visualizations": [...]}, possibly
+    wrapped in prose or code fences. Feeding the text chunk by chunk returns
+    (array name, element) pairs as soon as an element's closing brace arrives,
+    without waiting for the rest of the response.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None
+        self.current_key = None
+        self.array_key = None
+        self.element_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict]]:
+        self.buffer += chunk
+        completed = []
+        text = self.buffer
+        for index in range(self.position, len(text)):
+            char = text[index]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_string = text[self.string_start + 1:index]
+                continue
+
+            if self.depth == 0:
+                # Skip anything before the top-level object
+                if char == "{":
+                    self.depth = 1
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = index
+            elif char == ":" and self.depth == 1:
+                self.current_key = self.last_string
+            elif char in "{[":
+                if self.depth == 1 and char == "[":
+                    self.array_key = self.current_key
+                elif self.depth == 2 and char == "{" and self.array_key:
+                    self.element_start = index
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 2 and char == "}" and self.element_start is not None:
+                    element, complete, _ = parse_tolerant(text[self.element_start:index + 1])
+                    if complete and isinstance(element, dict):
+                        completed.append((self.array_key, element))
+                    self.element_start = None
+                elif self.depth == 1 and char == "]":
+                    self.array_key = None
+        self.position = len(text)
+        return completed
@@ -0,0 +1,176 @@
+"""Pipeline stage and Mongo timing, exported to Prometheus and as Server-Timing headers."""
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from pymongo import monitoring
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Buckets from sub-millisecond lookups up to multi-minute LLM generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "course_pipeline_stage_seconds", "Duration of conversion pipeline stages", ["stage"], buckets=LATENCY_BUCKETS,
+)
+MONGO_SECONDS = Histogram(
+    "mongo_command_seconds", "Duration of Mongo commands", ["collection", "command"], buckets=LATENCY_BUCKETS,
+)
+LLM_JSON_RESPONSES = Counter(
+    "llm_json_responses_total", "Model responses by how they parsed: clean, repaired, partial or failed", ["outcome"],
+)
+LLM_JSON_RECOVERED_SECTIONS = Counter(
+    "llm_json_recovered_sections_total", "Sections recovered from malformed or truncated model responses",
+)
+LLM_JSON_CONTINUATIONS = Counter(
+    "llm_json_continuations_total", "Follow-up requests for the sections missing from a response", ["outcome"],
+)
+
+# (name, milliseconds) entries recorded while serving the current request
+request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def record(name: str, seconds: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds * 1000))
+
+
+def record_entries(entries: List[Tuple[str, float]]):
+    """Add (name, milliseconds) entries measured elsewhere, e.g. by a shared task, to the current timings."""
+    timings = request_timings.get()
+    if timings is not None:
+        timings.extend(entries)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        record(stage, elapsed)
+
+
+def instrumented(stage: str):
+    """Decorator timing a sync or async function as a pipeline stage."""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timed_stage(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed_stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Time every command sent through the client it is registered on.
+
+    Motor runs commands on its executor with a copy of the caller's context,
+    so the durations also land in the current request's Server-Timing.
+    """
+
+    def __init__(self):
+        self.collections: Dict[int, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self.collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def _finished(self, event):
+        collection = self.collections.pop(event.request_id, "")
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.labels(collection, event.command_name).observe(seconds)
+        record(f"mongo_{event.command_name}", seconds)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+@contextmanager
+def collected_timings(timings: Optional[List[Tuple[str, float]]] = None):
+    """Collect the timings of the enclosed work, including tasks it starts, into a fresh (or the given) list.
+
+    For work outside an HTTP request, such as job workers, or work shared by several of them.
+    """
+    if timings is None:
+        timings = []
+    token = request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        request_timings.reset(token)
+
+
+def aggregate_timings(timings: List[Tuple[str, float]]) -> Dict[str, Dict[str, float]]:
+    """Total milliseconds and number of entries per name, in first-recorded order."""
+    totals: Dict[str, Dict[str, float]] = {}
+    for name, milliseconds in timings:
+        total = totals.setdefault(name, {"ms": 0.0, "calls": 0})
+        total["ms"] += milliseconds
+        total["calls"] += 1
+    return {name: {"ms": round(total["ms"], 2), "calls": total["calls"]} for name, total in totals.items()}
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """Aggregate repeated entries into one Server-Timing metric per name."""
+    metrics = []
+    for name, total in aggregate_timings(timings).items():
+        metric = f"{name};dur={total['ms']:.2f}"
+        if total["calls"] > 1:
+            metric += f';desc="{total["calls"]} calls"'
+        metrics.append(metric)
+    return ", ".join(metrics)
+
+
+class ServerTimingMiddleware:
+    """Collect timings during each HTTP request and send them as a Server-Timing header.
+
+    Only work finished before the response headers go out is included, which
+    for streamed responses means the stages before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                entries = timings + [("total", (time.perf_counter() - started) * 1000)]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(entries).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_timings.reset(token)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
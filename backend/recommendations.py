@@ -0,0 +1,225 @@
+"""Related-course recommendations from an incrementally maintained TF-IDF index."""
+import asyncio
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from search import stem
+
+WORD = re.compile(r"[a-z][a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "about above after again all also and any are because been before being below between both but can could "
+    "did does doing down during each few for from further had has have having her here hers him his how into "
+    "its itself just more most not now off once only other our out over own same she should some such than "
+    "that the their them then there these they this those through too under until very was were what when "
+    "where which while who whom why will with would you your".split()
+)
+
+# Only a query's highest-weighted terms are scored, and only until this many
+# postings have been visited; the skipped terms are common ones that barely
+# change the ranking
+MAX_QUERY_TERMS = 64
+MAX_SCORED_POSTINGS = 200000
+
+# Fields needed to index a course
+RELATED_PROJECTION = {"_id": 0, "id": 1, "title": 1, "sections.title": 1, "sections.content": 1}
+
+
+def term_counts(course: Dict) -> Dict[str, int]:
+    """Stemmed term frequencies of a course's title and section text."""
+    parts = [course.get("title", "")]
+    for section in course.get("sections", []):
+        parts.append(section.get("title", ""))
+        parts.append(section.get("content", ""))
+    counts: Dict[str, int] = Counter()
+    # Stem each distinct word once
+    for word, count in Counter(WORD.findall(" ".join(parts).lower())).items():
+        if word not in STOPWORDS:
+            counts[stem(word)] += count
+    return counts
+
+
+def _grow(array: np.ndarray, size: int) -> np.ndarray:
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class RelatedCourseIndex:
+    """Cosine similarity over sublinear TF-IDF vectors, kept as an inverted index.
+
+    Postings are held term-sorted (CSC) in NumPy arrays, plus a tail of
+    postings added since the last compaction. Adding a course only appends to
+    the tail; once the tail outgrows compact_ratio of the sorted postings it is
+    merged in on a worker thread, which also refreshes document norms with the
+    current IDF. A query scores every course in one bincount over the postings
+    of its top terms.
+    """
+
+    def __init__(self, compact_ratio: float = 0.1, min_compact_postings: int = 50000):
+        self.compact_ratio = compact_ratio
+        self.min_compact_postings = min_compact_postings
+        self.term_ids: Dict[str, int] = {}
+        self.df = np.zeros(1024, dtype=np.int32)
+        self.course_ids: List[str] = []
+        self.doc_index: Dict[str, int] = {}
+        self.norms = np.ones(1024, dtype=np.float32)
+        self.alive = np.zeros(1024, dtype=bool)
+        self.live_docs = 0
+        # Compacted postings: those of term t are post_*[indptr[t]:indptr[t + 1]]
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_weights = np.zeros(0, dtype=np.float32)
+        # (terms, docs, weights) chunks added since the last compaction
+        self.tail: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.tail_postings = 0
+        self._tail_arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self.compacting = False
+        self.ready = False
+        self.stats = {"queries": 0, "compactions": 0}
+
+    def __contains__(self, course_id: str) -> bool:
+        return course_id in self.doc_index
+
+    def _idf(self, terms: np.ndarray) -> np.ndarray:
+        return np.log((1 + self.live_docs) / (1 + self.df[terms])) + 1
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.term_ids)
+        return term_id
+
+    def add(self, course_id: str, counts: Dict[str, int]):
+        """Index a course's term counts; re-adding a course replaces its old entry."""
+        previous = self.doc_index.get(course_id)
+        if previous is not None:
+            self.alive[previous] = False
+            self.live_docs -= 1
+        doc = len(self.course_ids)
+        self.course_ids.append(course_id)
+        self.doc_index[course_id] = doc
+        self.norms = _grow(self.norms, doc + 1)
+        self.alive = _grow(self.alive, doc + 1)
+        self.alive[doc] = True
+        self.live_docs += 1
+        if not counts:
+            return
+
+        terms = np.fromiter((self._term_id(term) for term in counts), dtype=np.int32, count=len(counts))
+        weights = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        self.df = _grow(self.df, len(self.term_ids))
+        self.df[terms] += 1
+        self.norms[doc] = np.linalg.norm(weights * self._idf(terms)) or 1.0
+        self.tail.append((terms, np.full(len(terms), doc, dtype=np.int32), weights))
+        self.tail_postings += len(terms)
+        self._tail_arrays = None
+
+    def needs_compaction(self) -> bool:
+        threshold = max(self.min_compact_postings, self.compact_ratio * len(self.post_docs))
+        return not self.compacting and self.tail_postings >= threshold
+
+    def _tail(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._tail_arrays is None:
+            if self.tail:
+                self._tail_arrays = tuple(np.concatenate(parts) for parts in zip(*self.tail))
+            else:
+                empty = np.zeros(0, dtype=np.int32)
+                self._tail_arrays = (empty, empty, np.zeros(0, dtype=np.float32))
+        return self._tail_arrays
+
+    def _merge(self, chunks: int):
+        """Merge the first `chunks` tail chunks into the sorted postings (runs off the event loop)."""
+        old_terms = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        tail = self.tail[:chunks]
+        terms = np.concatenate([old_terms] + [chunk[0] for chunk in tail])
+        docs = np.concatenate([self.post_docs] + [chunk[1] for chunk in tail])
+        weights = np.concatenate([self.post_weights] + [chunk[2] for chunk in tail])
+        # Replaced courses' postings are dropped here
+        keep = self.alive[docs]
+        terms, docs, weights = terms[keep], docs[keep], weights[keep]
+        order = np.argsort(terms, kind="stable")
+        terms, docs, weights = terms[order], docs[order], weights[order]
+
+        vocabulary = int(terms.max()) + 1 if len(terms) else 0
+        indptr = np.zeros(vocabulary + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=vocabulary), out=indptr[1:])
+        doc_count = int(docs.max()) + 1 if len(docs) else 0
+        norms = np.sqrt(np.bincount(docs, weights=(weights * self._idf(terms)) ** 2, minlength=doc_count))
+        norms[norms == 0] = 1.0
+        return indptr, docs, weights, norms.astype(np.float32)
+
+    async def compact(self):
+        if self.compacting or not self.tail:
+            return
+        self.compacting = True
+        chunks = len(self.tail)
+        try:
+            merged = await asyncio.get_running_loop().run_in_executor(None, self._merge, chunks)
+        finally:
+            self.compacting = False
+        self.indptr, self.post_docs, self.post_weights, norms = merged
+        self.norms[:len(norms)] = norms
+        del self.tail[:chunks]
+        self.tail_postings = sum(len(chunk[0]) for chunk in self.tail)
+        self._tail_arrays = None
+        self.stats["compactions"] += 1
+
+    def related(self, counts: Dict[str, int], k: int = 6, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """The k courses most similar to the given term counts, as (course id, cosine) pairs."""
+        self.stats["queries"] += 1
+        known = [(self.term_ids[term], count) for term, count in counts.items() if term in self.term_ids]
+        doc_count = len(self.course_ids)
+        if not known or not doc_count:
+            return []
+        terms = np.array([term for term, _ in known], dtype=np.int32)
+        query = (1 + np.log(np.array([count for _, count in known], dtype=np.float32))) * self._idf(terms)
+        query_norm = np.linalg.norm(query)
+        top = np.argsort(-query)[:MAX_QUERY_TERMS]
+        terms, query = terms[top], query[top]
+        # Each posting contributes query weight x idf x document weight
+        factors = query * self._idf(terms)
+
+        # A term's postings name each course at most once, so scatter-adds don't collide
+        scores = np.zeros(doc_count, dtype=np.float32)
+        visited = 0
+        for term, factor in zip(terms, factors):
+            if term + 1 < len(self.indptr):
+                start, end = self.indptr[term], self.indptr[term + 1]
+                if visited and visited + end - start > MAX_SCORED_POSTINGS:
+                    continue
+                visited += end - start
+                scores[self.post_docs[start:end]] += self.post_weights[start:end] * factor
+        tail_terms, tail_docs, tail_weights = self._tail()
+        if len(tail_terms):
+            order = np.argsort(terms)
+            sorted_terms = terms[order]
+            mask = np.isin(tail_terms, sorted_terms)
+            if mask.any():
+                positions = np.searchsorted(sorted_terms, tail_terms[mask])
+                # Tail courses may repeat across terms, so accumulate with bincount
+                scores += np.bincount(tail_docs[mask], weights=tail_weights[mask] * factors[order][positions],
+                                      minlength=doc_count)[:doc_count].astype(np.float32)
+        scores /= self.norms[:doc_count] * query_norm
+        scores[~self.alive[:doc_count]] = 0
+        if exclude in self.doc_index:
+            scores[self.doc_index[exclude]] = 0
+        k = min(k, doc_count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.course_ids[doc], round(float(scores[doc]), 4)) for doc in top if scores[doc] > 0]
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "ready": self.ready,
+            "courses": self.live_docs,
+            "terms": len(self.term_ids),
+            "postings": len(self.post_docs),
+            "tail_postings": self.tail_postings,
+        }
@@ -0,0 +1,65 @@
+"""Per-window generation results kept with each course, so regeneration only pays for changed windows."""
+import json
+import logging
+import zlib
+from datetime import datetime
+from typing import Dict, List
+
+from bson.binary import Binary
+from pymongo import IndexModel
+
+from chunking import format_timestamp
+from transcripts import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+def shift_partial(partial: Dict, seconds: float) -> Dict:
+    """A stored window result moved by the given number of seconds.
+
+    The window's text hasn't changed, but edits earlier in the transcript may
+    have moved it; its section timestamps move with it.
+    """
+    if not seconds:
+        return partial
+    sections = []
+    for section in partial.get("sections", []):
+        offset = parse_timestamp(section.get("timestamp"))
+        if offset is not None:
+            section = {**section, "timestamp": format_timestamp(max(0.0, offset + seconds))}
+        sections.append(section)
+    return {**partial, "sections": sections}
+
+
+class WindowResultStore:
+    """The model output for each transcript window of a course, keyed by the window's text hash.
+
+    Results are stored as one compressed document per video, written
+    alongside every version of its course.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def index_models(self) -> List[IndexModel]:
+        return [IndexModel("video_id", unique=True)]
+
+    async def get(self, video_id: str) -> Dict[str, Dict]:
+        doc = await self.collection.find_one({"video_id": video_id}, {"_id": 0, "windows": 1})
+        if doc is None:
+            return {}
+        windows = json.loads(zlib.decompress(doc["windows"]).decode("utf-8"))
+        return {window["hash"]: window for window in windows}
+
+    async def put(self, video_id: str, version: int, windows: List[Dict]):
+        packed = zlib.compress(json.dumps(windows, separators=(",", ":")).encode("utf-8"), 6)
+        await self.collection.update_one(
+            {"video_id": video_id},
+            {"$set": {
+                "version": version,
+                "windows": Binary(packed),
+                "window_count": len(windows),
+                "updated_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
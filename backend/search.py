@@ -0,0 +1,93 @@
+"""Full-text course search: the text index and highlighting of the best matching section."""
+import re
+from typing import Dict, List, Optional, Set
+
+from pymongo import TEXT, IndexModel
+
+# Relative weight of a match in each indexed field
+SEARCH_WEIGHTS = {
+    "title": 10,
+    "sections.title": 5,
+    "description": 3,
+    "sections.content": 1,
+}
+
+# Characters of section content returned around the first match
+SNIPPET_CHARS = 200
+
+WORD = re.compile(r"\w+")
+# Suffixes dropped so highlighting roughly follows Mongo's English stemming
+SUFFIXES = ("ations", "ation", "ingly", "ings", "ing", "edly", "ed", "ies", "es", "s", "ly")
+
+
+def text_index_model() -> IndexModel:
+    return IndexModel(
+        [(field, TEXT) for field in SEARCH_WEIGHTS],
+        weights=SEARCH_WEIGHTS,
+        default_language="english",
+        name="course_text",
+    )
+
+
+def stem(word: str) -> str:
+    word = word.lower()
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            if suffix == "s" and word.endswith("ss"):
+                break
+            if suffix == "ies":
+                return word[:-3] + "y"
+            return word[:-len(suffix)]
+    return word
+
+
+def search_terms(query: str) -> Set[str]:
+    """Stemmed terms of a $text query, leaving out negated terms."""
+    terms = set()
+    for token in query.replace('"', " ").split():
+        if token.startswith("-"):
+            continue
+        terms.update(stem(word) for word in WORD.findall(token))
+    return terms
+
+
+def _matches(text: str, terms: Set[str]) -> List[List[int]]:
+    return [[m.start(), m.end()] for m in WORD.finditer(text) if stem(m.group()) in terms]
+
+
+def highlight(sections: List[Dict], terms: Set[str]) -> Optional[Dict]:
+    """Pick the section matching the most terms and cut a snippet around its first match.
+
+    Title matches count three times as much as content matches. Match offsets
+    are relative to the snippet so clients can mark them without parsing HTML.
+    """
+    best, best_score = None, 0
+    for section in sections:
+        title_matches = _matches(section.get("title", ""), terms)
+        content_matches = _matches(section.get("content", ""), terms)
+        score = 3 * len(title_matches) + len(content_matches)
+        if score > best_score:
+            best, best_score = (section, content_matches), score
+    if best is None:
+        return None
+
+    section, content_matches = best
+    content = section.get("content", "")
+    start = 0
+    if content_matches:
+        # Keep a little context before the first match
+        start = max(0, content_matches[0][0] - SNIPPET_CHARS // 4)
+        # Don't start mid-word
+        while 0 < start < len(content) and content[start - 1].isalnum():
+            start -= 1
+    end = min(len(content), start + SNIPPET_CHARS)
+    return {
+        "section_id": section.get("id"),
+        "title": section.get("title"),
+        "timestamp": section.get("timestamp"),
+        "order": section.get("order"),
+        "snippet": content[start:end],
+        "matches": [[s - start, e - start] for s, e in content_matches if s >= start and e <= end],
+        "truncated_before": start > 0,
+        "truncated_after": end < len(content),
+    }
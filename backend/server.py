@@ -1,46 +1,252 @@
-from fastapi import FastAPI, APIRouter, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 import re
-import requests
+import asyncio
+import functools
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Dict, Optional, Any, Literal, Tuple, Union
+from collections import deque
 import uuid
 import json
+import orjson
+import httpx
 from datetime import datetime
-import google.generativeai as genai
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from jobs import JobQueue, JOB_FETCHING_TRANSCRIPT, JOB_GENERATING
+from chunking import StageTimer, WindowOrderedEmitter, estimate_tokens, format_timestamp, merge_partial_courses, split_into_windows
+from llm_json import CourseStreamParser, ParsedCourse, ParseStats, continuation_prompt, merge_continuation, parse_course
+from llm_cache import LLMResponseCache
+from transcripts import TranscriptStore, pack_segments, resolve_timestamp
+from regeneration import WindowResultStore, shift_partial
+from status_checks import StatusCheckBuffer
+from indexes import plan_stages, reconcile_indexes
+from search import highlight, search_terms, text_index_model
+from recommendations import RELATED_PROJECTION, RelatedCourseIndex, term_counts
+from visualizations import VARIANT_WIDTHS, VisualizationRenderer, visualization_spec
+from thumbnails import (
+    DEFAULT_UPSTREAM_URL as THUMBNAIL_UPSTREAM_URL, THUMBNAIL_FORMATS, THUMBNAIL_WIDTHS, VIDEO_ID, BadSourceImage,
+    DiskLRUCache, ThumbnailProxy,
+)
+from http_cache import HotCache, course_etag, etag_matches, http_date, modified_since
+from admission import AdmissionController, AdmissionRejected
+from external_integrations.gemini import GeminiGuard
+from external_integrations.youtube import DEFAULT_API_URL, YouTubeMetadataClient
+from metrics import (
+    LLM_JSON_CONTINUATIONS, LLM_JSON_RECOVERED_SECTIONS, LLM_JSON_RESPONSES, MongoCommandTimer, ServerTimingMiddleware,
+    collected_timings, instrumented, metrics_endpoint, record_entries, timed_stage,
+)
+from pymongo import IndexModel
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Every Mongo command is timed into /metrics and the request's Server-Timing
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandTimer()])
 db = client[os.environ['DB_NAME']]
 
 # Optional Gemini configuration (will be used if API key is provided)
 gemini_api_key = os.environ.get('GEMINI_API_KEY')
 youtube_api_key = os.environ.get('YOUTUBE_API_KEY')
 
-# Configure Gemini if API key is available
-if gemini_api_key and gemini_api_key != "YOUR_GEMINI_API_KEY":
-    genai.configure(api_key=gemini_api_key)
-    generation_config = {
-        "temperature": 0.7,
-        "top_p": 0.95,
-        "top_k": 40,
-        "max_output_tokens": 4096,
-    }
-    has_gemini = True
+# Gemini is used if an API key is available; the SDK itself is only loaded on
+# first use (see gemini_model)
+has_gemini = bool(gemini_api_key) and gemini_api_key != "YOUR_GEMINI_API_KEY"
+generation_config = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 4096,
+}
+
+# Quota, circuit breaker and retries for every Gemini call. The token budget
+# charged per call is the prompt estimate plus the maximum output size.
+gemini_guard = GeminiGuard(
+    requests_per_minute=float(os.environ.get('GEMINI_RPM', '60')),
+    tokens_per_minute=float(os.environ.get('GEMINI_TPM', '120000')),
+    failure_threshold=int(os.environ.get('GEMINI_BREAKER_FAILURES', '5')),
+    reset_seconds=float(os.environ.get('GEMINI_BREAKER_RESET_SECONDS', '30')),
+    max_retries=int(os.environ.get('GEMINI_MAX_RETRIES', '3')),
+)
+gemini_request_options = {"timeout": float(os.environ.get('GEMINI_TIMEOUT_SECONDS', '60'))}
+
+# Long transcripts are generated in windows of this many (estimated) tokens,
+# with at most window_concurrency windows of one video in flight at once
+transcript_window_tokens = int(os.environ.get('TRANSCRIPT_WINDOW_TOKENS', '6000'))
+# Follow-up requests for the sections missing from a cut-off or unreadable response
+llm_continuation_attempts = int(os.environ.get('LLM_CONTINUATION_ATTEMPTS', '1'))
+window_concurrency = int(os.environ.get('WINDOW_CONCURRENCY', '4'))
+# Courses change only when regenerated: caches keep them for a long time but
+# revalidate against the versioned ETag once the short max-age is up, and
+# popular ones are kept rendered in-process for a few seconds
+course_cache_control = (
+    f"public, max-age={int(os.environ.get('COURSE_CACHE_MAX_AGE', '60'))}, "
+    f"stale-while-revalidate={int(os.environ.get('COURSE_CACHE_STALE_SECONDS', '604800'))}"
+)
+hot_courses = HotCache(
+    max_entries=int(os.environ.get('HOT_COURSE_CACHE_SIZE', '256')),
+    ttl_seconds=float(os.environ.get('HOT_COURSE_TTL_SECONDS', '10')),
+)
+# TF-IDF index behind related-course recommendations, loaded at startup and
+# extended as this worker stores new courses
+related_index = RelatedCourseIndex()
+
+# Visualization rendering processes, and the in-process LRU of served images
+visualization_renderer = VisualizationRenderer(
+    db.visualizations, max_workers=int(os.environ.get('VISUALIZATION_WORKERS', '2')),
+)
+visualization_images = HotCache(
+    max_entries=int(os.environ.get('VISUALIZATION_CACHE_SIZE', '128')),
+    ttl_seconds=float(os.environ.get('VISUALIZATION_CACHE_TTL_SECONDS', '3600')),
+)
+# Rendered images never change under their address
+VISUALIZATION_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Resized video thumbnails, fetched once and kept in an LRU disk cache opened at startup
+thumbnail_cache_dir = ROOT_DIR / os.environ.get('THUMBNAIL_CACHE_DIR', 'thumbnail_cache')
+thumbnail_cache_max_bytes = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+thumbnail_proxy = ThumbnailProxy(
+    upstream_url=os.environ.get('THUMBNAIL_UPSTREAM_URL', THUMBNAIL_UPSTREAM_URL),
+    max_connections=int(os.environ.get('THUMBNAIL_MAX_CONNECTIONS', '10')),
+)
+thumbnail_cache_control = f"public, max-age={int(os.environ.get('THUMBNAIL_CACHE_MAX_AGE', '86400'))}"
+
+# Status checks are kept for this long before the TTL index removes them
+status_check_ttl_seconds = int(os.environ.get('STATUS_CHECK_TTL_SECONDS', str(7 * 24 * 3600)))
+# Status checks are written in batches of up to this many, at least this often
+status_checks = StatusCheckBuffer(
+    db.status_checks,
+    ttl_seconds=status_check_ttl_seconds,
+    max_batch=int(os.environ.get('STATUS_CHECK_BATCH_SIZE', '500')),
+    flush_seconds=float(os.environ.get('STATUS_CHECK_FLUSH_SECONDS', '2')),
+    max_pending=int(os.environ.get('STATUS_CHECK_MAX_PENDING', '10000')),
+)
+# Batch conversions: videos generated concurrently and courses per bulk insert
+batch_concurrency = int(os.environ.get('BATCH_CONCURRENCY', '4'))
+batch_write_size = int(os.environ.get('BATCH_WRITE_SIZE', '25'))
+# Longest a finished course waits for others to share its bulk insert, and videos per batch request
+batch_write_delay = float(os.environ.get('BATCH_WRITE_DELAY_SECONDS', '0.25'))
+batch_max_videos = int(os.environ.get('BATCH_MAX_VIDEOS', '100'))
+# Per-stage timings of recent generations, to track cost against transcript length
+generation_timings = deque(maxlen=50)
+# Time-to-first-section and total latency of recent streamed conversions
+streaming_timings = deque(maxlen=50)
+
+# Video metadata comes from the YouTube Data API when a key is configured;
+# concurrent lookups are batched and results cached in-process
+if youtube_api_key and youtube_api_key != "YOUR_YOUTUBE_API_KEY":
+    youtube_metadata = YouTubeMetadataClient(
+        youtube_api_key,
+        base_url=os.environ.get('YOUTUBE_API_URL', DEFAULT_API_URL),
+        cache_size=int(os.environ.get('YOUTUBE_METADATA_CACHE_SIZE', '10000')),
+        cache_ttl=float(os.environ.get('YOUTUBE_METADATA_TTL_SECONDS', '3600')),
+        max_connections=int(os.environ.get('YOUTUBE_MAX_CONNECTIONS', '10')),
+    )
 else:
-    has_gemini = False
+    youtube_metadata = None
+
+# Transcripts are fetched from YouTube once and then read from the store
+transcript_store = TranscriptStore(db.transcripts)
+# Per-window model output of each course, reused when it is regenerated
+window_results = WindowResultStore(db.course_windows)
+
+# Cache of raw model responses, so identical prompts are only paid for once
+gemini_model_name = "gemini-pro"
+llm_cache = LLMResponseCache(
+    db.llm_cache,
+    max_bytes=int(os.environ.get('LLM_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl_seconds=int(os.environ.get('LLM_CACHE_TTL_SECONDS', str(30 * 24 * 3600))),
+)
+
+# Execution layer for blocking upstream calls. The YouTube transcript client and
+# the Gemini SDK are synchronous, so they run in a shared I/O thread pool while
+# each upstream gets its own concurrency cap.
+io_worker_threads = int(os.environ.get('IO_WORKER_THREADS', '16'))
+upstream_limits = {
+    "youtube_transcript": int(os.environ.get('TRANSCRIPT_CONCURRENCY', '8')),
+    "gemini": int(os.environ.get('GEMINI_CONCURRENCY', '4')),
+}
+io_executor = ThreadPoolExecutor(max_workers=io_worker_threads, thread_name_prefix="upstream-io")
+upstream_semaphores = {name: asyncio.Semaphore(limit) for name, limit in upstream_limits.items()}
+
+async def run_blocking(upstream: str, func, *args, **kwargs):
+    """Run a blocking upstream call in the I/O pool, bounded by that upstream's limit."""
+    async with upstream_semaphores[upstream]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+# The Gemini SDK and the transcript client are slow to import, so workers and
+# tests that never generate a course don't load them. Both are resolved on first
+# use, from the I/O pool so the import doesn't stall the event loop.
+@functools.lru_cache(maxsize=None)
+def gemini_model():
+    """Configure the Gemini SDK and build the model shared by every call."""
+    import google.generativeai as genai
+    genai.configure(api_key=gemini_api_key)
+    return genai.GenerativeModel(gemini_model_name)
+
+@functools.lru_cache(maxsize=None)
+def transcript_client():
+    from youtube_transcript_api import YouTubeTranscriptApi
+    return YouTubeTranscriptApi
+
+def fetch_transcript(video_id: str) -> List[Dict]:
+    return transcript_client().get_transcript(video_id)
+
+# Single-flight coalescing of conversions: concurrent requests for the same video
+# share one in-progress pipeline instead of each paying for a Gemini call.
+inflight_conversions: Dict[str, asyncio.Task] = {}
+inflight_submissions: Dict[str, asyncio.Task] = {}
+# Stage timings being recorded by each of those tasks, for everyone awaiting it
+shared_timings: Dict[asyncio.Task, List[Tuple[str, float]]] = {}
+pipeline_stats = {
+    "pipeline_runs": 0, "coalesced_requests": 0,
+    "regenerations": 0, "unchanged_regenerations": 0, "reused_windows": 0, "generated_windows": 0,
+}
+
+async def single_flight(key: str, factory, inflight: Dict[str, asyncio.Task] = inflight_conversions):
+    """Run factory() once per key; concurrent callers await the same result.
+
+    The shared run collects its stage timings on its own, and every caller adds
+    them to its request's or job's timings once it stops waiting, not just the
+    caller that started it.
+    """
+    task = inflight.get(key)
+    if task is None:
+        collected: List[Tuple[str, float]] = []
+        
+        async def run():
+            with collected_timings(collected):
+                return await factory()
+        
+        task = asyncio.ensure_future(run())
+        inflight[key] = task
+        shared_timings[task] = collected
+        
+        def finished(done: asyncio.Task):
+            inflight.pop(key, None)
+            shared_timings.pop(done, None)
+        
+        task.add_done_callback(finished)
+    else:
+        pipeline_stats["coalesced_requests"] += 1
+    timings = shared_timings.get(task, [])
+    try:
+        # Shield so a disconnecting client does not cancel the pipeline for everyone else
+        return await asyncio.shield(task)
+    finally:
+        record_entries(timings)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -57,8 +263,18 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+class StatusCheckSummary(BaseModel):
+    client_name: str
+    count: int
+    first_seen: datetime
+    last_seen: datetime
+
 class YouTubeInput(BaseModel):
     video_url: str
+    # Skip cached model responses and pay for fresh generation
+    bypass_cache: bool = False
+    # Refresh an existing course from the current transcript, regenerating only what changed
+    regenerate: bool = False
 
 class CourseSection(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -83,8 +299,46 @@ class Course(BaseModel):
     sections: List[CourseSection] = []
     visualizations: List[CourseVisualization] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # Bumped by every regeneration; part of the ETag
+    version: int = 1
+    updated_at: Optional[datetime] = None
+
+class CourseSummary(BaseModel):
+    id: str
+    video_id: str
+    title: str
+    description: str
+    thumbnail_url: str
+    created_at: datetime
+
+class BatchConvertInput(BaseModel):
+    # YouTube URLs or bare 11-character video ids
+    videos: List[str] = Field(..., min_length=1, max_length=batch_max_videos)
+    bypass_cache: bool = False
+
+class StageTiming(BaseModel):
+    ms: float
+    calls: int
+
+class ConversionJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    video_id: str
+    bypass_cache: bool = False
+    regenerate: bool = False
+    status: str = "queued"
+    progress: float = 0.0
+    course_id: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    # Milliseconds and call count per pipeline stage of the last attempt, once it finished
+    timings: Optional[Dict[str, StageTiming]] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Set once the job is stored or failed; the job is removed JOB_RETENTION_SECONDS later
+    finished_at: Optional[datetime] = None
 
 # Helper functions
+@instrumented("extract_video_id")
 def extract_video_id(url: str) -> str:
     """Extract YouTube video ID from various URL formats."""
     youtube_regex = (
@@ -96,13 +350,19 @@ def extract_video_id(url: str) -> str:
         return None
     return match.group(6)
 
+@instrumented("fetch_video_metadata")
 async def fetch_video_metadata(video_id: str) -> Dict:
     """Fetch video metadata using YouTube API."""
-    # This is a mock - in real implementation we'd use the YouTube Data API
-    # We'd need to ask for a YouTube API key for a full implementation
-    api_url = f"https://www.googleapis.com/youtube/v3/videos?id={video_id}&key=YOUR_API_KEY&part=snippet"
+    if youtube_metadata is not None:
+        try:
+            metadata = await youtube_metadata.get(video_id)
+            if metadata is not None:
+                return metadata
+            logger.warning(f"No metadata found for video {video_id}")
+        except Exception as e:
+            logger.error(f"Error fetching metadata for video {video_id}: {str(e)}")
     
-    # For now, we'll just use a placeholder with the thumbnail
+    # Without an API key (or if the lookup fails), use a placeholder with the thumbnail
     mock_data = {
         "title": f"Video: {video_id}",
         "description": "This is a placeholder description for the video.",
@@ -110,43 +370,58 @@ async def fetch_video_metadata(video_id: str) -> Dict:
     }
     return mock_data
 
-async def get_video_transcript(video_id: str) -> str:
-    """Get transcript of a YouTube video."""
+@instrumented("get_video_transcript")
+async def get_video_transcript(video_id: str) -> List[Dict]:
+    """Get the timestamped transcript segments of a YouTube video."""
+    try:
+        segments = await transcript_store.get(video_id)
+        if segments is not None:
+            return segments
+    except Exception as e:
+        logger.error(f"Error reading stored transcript for video {video_id}: {str(e)}")
+    try:
+        segments = await run_blocking("youtube_transcript", fetch_transcript, video_id)
+    except Exception as e:
+        from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
+        if isinstance(e, (TranscriptsDisabled, NoTranscriptFound)):
+            # If transcript is not available, return no segments
+            logger.warning(f"Transcript not available for video {video_id}: {str(e)}")
+        else:
+            logger.error(f"Error fetching transcript for video {video_id}: {str(e)}")
+        return []
     try:
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-        full_transcript = " ".join([item["text"] for item in transcript_list])
-        return full_transcript
-    except (TranscriptsDisabled, NoTranscriptFound) as e:
-        # If transcript is not available, return an empty string
-        logger.warning(f"Transcript not available for video {video_id}: {str(e)}")
-        return ""
+        await transcript_store.put(video_id, segments)
     except Exception as e:
-        logger.error(f"Error fetching transcript for video {video_id}: {str(e)}")
-        return ""
+        logger.error(f"Error storing transcript for video {video_id}: {str(e)}")
+    return segments
 
-# This function would use Gemini API to process course content
-async def process_with_gemini(transcript: str, video_metadata: Dict) -> Dict:
-    """Process the video transcript with Gemini to create a structured course."""
-    
-    if has_gemini and transcript:
-        try:
-            # Use Gemini to process the transcript
-            model = genai.GenerativeModel("gemini-pro")
-            prompt = f"""
+def build_course_prompt(video_metadata: Dict, window: Dict, window_count: int) -> str:
+    """Build the generation prompt for one transcript window."""
+    if window_count == 1:
+        scope = "Please analyze the following video transcript and create a structured course with clear sections."
+        section_count = "4-8 logical sections"
+    else:
+        scope = (
+            f"The transcript is long, so you are given part {window['index'] + 1} of {window_count} "
+            f"(from {format_timestamp(window['start'])} to {format_timestamp(window['end'])}). "
+            "Create course sections covering only this part; other parts are handled separately."
+        )
+        section_count = "1-3 logical sections"
+    return f"""
             You are an expert educator who specializes in creating structured educational content.
             
-            Please analyze the following video transcript and create a structured course with clear sections.
+            {scope}
             
             Video Title: {video_metadata['title']}
             Video Description: {video_metadata['description']}
             
-            Transcript:
-            {transcript[:10000]}  # Truncate if too long
+            Transcript (with [MM:SS] markers):
+            {window['text']}
             
             Create a structured course with the following:
-            1. 4-8 logical sections, each with a title and detailed content
-            2. Each section should have a timestamp if you can identify when in the video that section starts
-            3. Also create one visualization idea for the course (a diagram or chart that would help illustrate a key concept)
+            1. {section_count}, each with a title and detailed content
+            2. Each section should have a timestamp taken from the nearest [MM:SS] marker where that section starts
+            3. Also create one visualization idea if there is a key concept a diagram or chart would help illustrate
             
             Format your response as a JSON object with the following structure:
             {{
@@ -170,27 +445,223 @@ async def process_with_gemini(transcript: str, video_metadata: Dict) -> Dict:
             
             Ensure the content is educational, well-structured, and enhances learning.
             """
+
+def validate_section(element: Dict, position: int) -> Optional[Dict]:
+    """A section from model output checked against CourseSection, or None if it isn't one."""
+    element = {"order": position, **element}
+    if isinstance(element.get("content"), list):
+        # Content written as a list of paragraphs
+        element["content"] = "\n\n".join(str(part) for part in element["content"])
+    try:
+        return CourseSection(**element).dict(exclude={"id"})
+    except (ValidationError, TypeError):
+        return None
+
+def validate_visualization(element: Dict) -> Optional[Dict]:
+    """A visualization from model output checked against CourseVisualization, or None if it isn't one."""
+    related = element.get("related_section_id")
+    if isinstance(related, (int, float)) and not isinstance(related, bool):
+        element = {**element, "related_section_id": str(int(related))}
+    try:
+        return CourseVisualization(**element).dict(include={"title", "description", "related_section_id"})
+    except (ValidationError, TypeError):
+        return None
+
+parse_stats = ParseStats()
+
+@instrumented("parse_json")
+def parse_course_response(response_text: str, record: bool = True) -> ParsedCourse:
+    """Recover every complete, valid section and visualization from a model response."""
+    parsed = parse_course(response_text, validate_section, validate_visualization)
+    if record:
+        outcome = parse_stats.record(parsed)
+        LLM_JSON_RESPONSES.labels(outcome).inc()
+        if outcome != "clean":
+            LLM_JSON_RECOVERED_SECTIONS.inc(len(parsed.sections))
+    return parsed
+
+async def call_gemini(model, prompt: str, on_text=None) -> str:
+    """The model's response text for a prompt.
+
+    With on_text, the model output is streamed and each chunk of text is passed
+    to on_text (on the event loop) as it arrives.
+    """
+    call_tokens = estimate_tokens(prompt) + generation_config["max_output_tokens"]
+    if on_text is None:
+        response = await gemini_guard.call(lambda: run_blocking(
+            "gemini", model.generate_content, prompt,
+            generation_config=generation_config, request_options=gemini_request_options,
+        ), tokens=call_tokens)
+        return response.text
+    
+    loop = asyncio.get_running_loop()
+    chunks = []
+    
+    def consume_stream():
+        stream = model.generate_content(
+            prompt, generation_config=generation_config, request_options=gemini_request_options, stream=True,
+        )
+        for chunk in stream:
+            chunks.append(chunk.text)
+            loop.call_soon_threadsafe(on_text, chunk.text)
+    
+    # Chunks already handed to on_text can't be taken back, so no retries
+    await gemini_guard.call(lambda: run_blocking("gemini", consume_stream), tokens=call_tokens, retry=False)
+    return "".join(chunks)
+
+async def generate_json(model, prompt: str, bypass_cache: bool = False, on_text=None) -> Dict:
+    """Generate the course JSON for a prompt, going through the response cache.
+
+    Malformed responses are repaired as far as they can be. When a response is
+    cut off or unreadable, the model is asked again for only the sections after
+    the last one recovered; those follow-ups aren't streamed to on_text.
+    """
+    cache_key = llm_cache.make_key(gemini_model_name, generation_config, prompt)
+    response_text = None if bypass_cache else await llm_cache.get(cache_key)
+    if response_text is not None:
+        if on_text:
+            on_text(response_text)
+        parsed = parse_course_response(response_text, record=False)
+        return {"sections": parsed.sections, "visualizations": parsed.visualizations}
+    
+    response_text = await call_gemini(model, prompt, on_text)
+    parsed = first = parse_course_response(response_text)
+    content = {"sections": parsed.sections, "visualizations": parsed.visualizations}
+    for _ in range(llm_continuation_attempts):
+        if parsed.complete and parsed.sections:
+            break
+        known = len(content["sections"])
+        parsed = parse_course_response(await call_gemini(model, continuation_prompt(prompt, content["sections"])))
+        content = merge_continuation(content, parsed)
+        added = len(content["sections"]) - known
+        parse_stats.stats["continuations"] += 1
+        parse_stats.stats["continued_sections"] += added
+        LLM_JSON_CONTINUATIONS.labels("recovered" if added else "empty").inc()
+    
+    if not content["sections"]:
+        raise ValueError("No valid course sections found in response")
+    if parsed.complete:
+        # Repaired responses are cached in their repaired form; cut-off ones aren't kept
+        await llm_cache.put(cache_key, response_text if first.clean else json.dumps(content))
+    return content
+
+class CourseGenerationError(Exception):
+    """No course content could be generated and placeholder content wasn't wanted."""
+
+# This function would use Gemini API to process course content
+@instrumented("process_with_gemini")
+async def process_with_gemini(segments: List[Dict], video_metadata: Dict, bypass_cache: bool = False, on_section=None,
+                              reuse: Optional[Dict[str, Dict]] = None, fallback: bool = True) -> Dict:
+    """Process the video transcript with Gemini to create a structured course.
+
+    Long transcripts are split into token-budgeted windows that are generated
+    concurrently (map) and then merged into one ordered section list (reduce).
+    With on_section, generation is streamed and each section is passed to
+    on_section as soon as it can be parsed, in transcript order.
+    
+    reuse maps window text hashes to stored window results; those windows are
+    taken from it instead of being generated. The result's "windows" holds the
+    output of every window that produced sections, for storing with the course.
+    
+    When nothing could be generated, mock data is returned, or with
+    fallback=False CourseGenerationError is raised.
+    """
+    def mock_data(reason: str) -> Dict:
+        if not fallback:
+            raise CourseGenerationError(reason)
+        return get_mock_data()
+    
+    
+    if has_gemini and segments:
+        timer = StageTimer()
+        try:
+            # Use Gemini to process the transcript
+            model = await asyncio.get_running_loop().run_in_executor(io_executor, gemini_model)
+            with timer.stage("windowing"):
+                windows = split_into_windows(segments, transcript_window_tokens)
+            semaphore = asyncio.Semaphore(window_concurrency)
+            emitter = WindowOrderedEmitter(len(windows), on_section) if on_section else None
             
-            response = model.generate_content(prompt, generation_config=generation_config)
-            try:
-                # Try to parse the response as JSON
-                response_text = response.text
-                # Find the JSON part if there's any text before or after
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    return json.loads(json_str)
-                raise ValueError("No valid JSON found in response")
-            except Exception as e:
-                # If parsing fails, fall back to mock data
-                logger.error(f"Error parsing Gemini response: {str(e)}")
-                return get_mock_data()
+            async def generate_window(window: Dict) -> Dict:
+                stored = reuse.get(window["hash"]) if reuse else None
+                if stored is not None:
+                    partial = shift_partial(stored, window["start"] - stored["start"])
+                    if emitter:
+                        for section in partial["sections"]:
+                            emitter.add(window["index"], section)
+                        emitter.finish(window["index"])
+                    return {**partial, "window": window["index"], "reused": True}
+                
+                on_text = None
+                streamed = set()
+                if emitter:
+                    parser = CourseStreamParser()
+                    
+                    def on_text(text: str):
+                        for array, item in parser.feed(text):
+                            if array == "sections":
+                                section = validate_section(item, len(streamed) + 1)
+                                if section is not None:
+                                    streamed.add(section["title"].strip().lower())
+                                    emitter.add(window["index"], section)
+                
+                async with semaphore:
+                    prompt = build_course_prompt(video_metadata, window, len(windows))
+                    try:
+                        partial = await generate_json(model, prompt, bypass_cache, on_text)
+                        if emitter:
+                            # Sections recovered only from the whole response or a follow-up request
+                            for section in partial["sections"]:
+                                if section["title"].strip().lower() not in streamed:
+                                    emitter.add(window["index"], section)
+                        return {**partial, "window": window["index"]}
+                    except Exception as e:
+                        # A failed window only loses its own sections
+                        logger.error(f"Error generating window {window['index']} of {len(windows)}: {str(e)}")
+                        return {"sections": [], "visualizations": [], "window": window["index"]}
+                    finally:
+                        if emitter:
+                            emitter.finish(window["index"])
+            
+            with timer.stage("map"):
+                partials = await asyncio.gather(*[generate_window(window) for window in windows])
+            with timer.stage("reduce"):
+                course_content = merge_partial_courses(partials)
+            
+            reused = sum(1 for partial in partials if partial.get("reused"))
+            pipeline_stats["reused_windows"] += reused
+            pipeline_stats["generated_windows"] += len(windows) - reused
+            generation_timings.append({
+                "title": video_metadata["title"],
+                "transcript_chars": sum(len(segment["text"]) for segment in segments),
+                "windows": len(windows),
+                "reused_windows": reused,
+                "timings_ms": timer.timings,
+            })
+            logger.info(f"Generated {len(course_content['sections'])} sections from {len(windows)} window(s) "
+                        f"({reused} reused) in {timer.timings}")
+            
+            if course_content["sections"]:
+                # Failed windows are left out, so the next regeneration retries them
+                course_content["windows"] = [
+                    {
+                        "hash": window["hash"],
+                        "start": window["start"],
+                        "end": window["end"],
+                        "sections": partial.get("sections", []),
+                        "visualizations": partial.get("visualizations", []),
+                    }
+                    for window, partial in zip(windows, partials) if partial.get("sections")
+                ]
+                return course_content
+            return mock_data("No transcript window produced any sections")
+        except CourseGenerationError:
+            raise
         except Exception as e:
             logger.error(f"Error using Gemini API: {str(e)}")
-            return get_mock_data()
+            return mock_data(f"Error using Gemini API: {str(e)}")
     
-    return get_mock_data()
+    return mock_data("Gemini is not available" if not has_gemini else "The video has no transcript")
 
 def get_mock_data():
     """Return mock data when Gemini API is not available or fails."""
@@ -224,7 +695,7 @@ def get_mock_data():
     mock_visualizations = [
         {
             "title": "Concept Map",
-            "image_url": None,  # In a real implementation, we'd generate and store an image
+            "image_url": None,
             "description": "A visual representation of the main concepts covered in this video.",
             "related_section_id": "2"
         }
@@ -235,13 +706,36 @@ def get_mock_data():
         "visualizations": mock_visualizations
     }
 
-async def process_course_content(video_id: str, video_metadata: Dict) -> Course:
-    """Create a course object from the video content."""
+async def build_course(video_id: str, video_metadata: Dict, set_status=None, bypass_cache: bool = False, on_section=None,
+                       segments: Optional[List[Dict]] = None, reuse: Optional[Dict[str, Dict]] = None,
+                       fallback: bool = True) -> Tuple[Course, List[Dict]]:
+    """Generate a course object from the video content without storing it.
+
+    Returns the course and its per-window results (see process_with_gemini).
+    """
     # Get the video transcript
-    transcript = await get_video_transcript(video_id)
+    if segments is None:
+        if set_status:
+            await set_status(JOB_FETCHING_TRANSCRIPT)
+        segments = await get_video_transcript(video_id)
+    segment_starts = sorted(segment["start"] for segment in segments)
+    
+    # Streamed sections get the same timestamp resolution as the final course
+    if on_section and segments:
+        emit_section = on_section
+        on_section = lambda section: emit_section(
+            {**section, "timestamp": resolve_timestamp(section.get("timestamp"), segment_starts)}
+        )
     
     # Process with Gemini (currently using mock data)
-    processed_content = await process_with_gemini(transcript, video_metadata)
+    if set_status:
+        await set_status(JOB_GENERATING)
+    processed_content = await process_with_gemini(segments, video_metadata, bypass_cache, on_section, reuse, fallback)
+    
+    # Point section timestamps at real segment starts instead of trusting the model
+    if segments:
+        for section in processed_content["sections"]:
+            section["timestamp"] = resolve_timestamp(section.get("timestamp"), segment_starts)
     
     # Create course object
     course = Course(
@@ -252,13 +746,349 @@ async def process_course_content(video_id: str, video_metadata: Dict) -> Course:
         sections=[CourseSection(**section) for section in processed_content["sections"]],
         visualizations=[CourseVisualization(**vis) for vis in processed_content["visualizations"]]
     )
+    await render_visualizations(course)
+    return course, processed_content.get("windows", [])
+
+def visualization_url(digest: str, variant: str = "md") -> str:
+    return f"/api/visualizations/{digest}/{variant}.png"
+
+async def render_visualizations(course: Course):
+    """Draw the course's visualizations and point their image URLs at the stored renderings."""
+    if not course.visualizations:
+        return
+    sections = [section.dict() for section in course.sections]
+    specs = [visualization_spec(vis.dict(), sections) for vis in course.visualizations]
+    with timed_stage("render_visualizations"):
+        digests = await asyncio.gather(
+            *(visualization_renderer.render(spec) for spec in specs), return_exceptions=True,
+        )
+    for vis, digest in zip(course.visualizations, digests):
+        if isinstance(digest, Exception):
+            # A course without a picture is still a course
+            logger.error(f"Error rendering visualization for video {course.video_id}: {str(digest)}")
+            continue
+        vis.image_url = visualization_url(digest)
+
+def index_related_course(course: Dict):
+    """Add a newly stored course to the related-courses index."""
+    related_index.add(course["id"], term_counts(course))
+    if related_index.needs_compaction():
+        asyncio.ensure_future(related_index.compact())
+
+async def process_course_content(video_id: str, video_metadata: Dict, set_status=None, bypass_cache: bool = False, on_section=None,
+                                 batched: bool = False) -> Course:
+    """Create a course object from the video content and store it.
+
+    With batched, the course is inserted together with the others finishing
+    around the same time (see CourseWriter).
+    """
+    course, windows = await build_course(video_id, video_metadata, set_status, bypass_cache, on_section)
+    
+    # Store in database; the unique video_id index is the cross-worker backstop
+    course_dict = course.dict()
+    try:
+        with timed_stage("insert_course"):
+            if batched:
+                await course_writer.write(course_dict)
+            else:
+                await db.courses.insert_one(course_dict)
+    except DuplicateKeyError:
+        existing_course = await db.courses.find_one({"video_id": video_id})
+        logger.info(f"Course for video {video_id} was created concurrently, returning stored copy")
+        return Course(**existing_course)
+    
+    index_related_course(course_dict)
+    await store_window_results(video_id, course.version, windows)
+    return course
+
+async def store_window_results(video_id: str, version: int, windows: List[Dict]):
+    """Keep a course's per-window results for regeneration; losing them only makes it cost more."""
+    if not windows:
+        return
+    try:
+        await window_results.put(video_id, version, windows)
+    except Exception as e:
+        logger.error(f"Error storing window results for video {video_id}: {str(e)}")
+
+async def regenerate_course(video_id: str, set_status=None, bypass_cache: bool = False) -> Course:
+    """Refresh a stored course from the video's current transcript and metadata.
+
+    The transcript is fetched again and split into windows; windows whose text
+    is unchanged since the last generation reuse their stored results, and
+    only the others go to the model. If nothing could be generated,
+    CourseGenerationError fails the job and the stored course is left as it
+    is. Sections that come out identical keep their ids. The new version replaces the stored course in one write,
+    conditional on the version it was built from, so readers switch from one
+    complete version to the next and concurrent regenerations can't interleave.
+    """
+    existing_course = await db.courses.find_one({"video_id": video_id}, {"_id": 0})
+    if not existing_course:
+        return await convert_new_video(video_id, set_status, bypass_cache)
+    
+    pipeline_stats["regenerations"] += 1
+    if set_status:
+        await set_status(JOB_FETCHING_TRANSCRIPT)
+    # The stored transcript is what is being refreshed, so go to YouTube
+    try:
+        segments = await run_blocking("youtube_transcript", fetch_transcript, video_id)
+    except Exception as e:
+        from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound
+        if isinstance(e, (TranscriptsDisabled, NoTranscriptFound)):
+            # Captions were removed since the course was generated; keep the course as it is
+            logger.warning(f"Transcript not available for video {video_id}: {str(e)}")
+            raise CourseGenerationError(f"Transcript not available for video {video_id}") from e
+        raise
+    stored_segments = await transcript_store.get(video_id)
+    video_metadata = await fetch_video_metadata(video_id)
+    current = existing_course.get("version", 1)
+    # Compared packed, since stored offsets are rounded to milliseconds
+    if stored_segments is not None and pack_segments(segments) == pack_segments(stored_segments) and all(
+        existing_course.get(field) == video_metadata[field] for field in ("title", "description", "thumbnail_url")
+    ):
+        pipeline_stats["unchanged_regenerations"] += 1
+        logger.info(f"Course for video {video_id} is up to date at version {current}")
+        return Course(**existing_course)
+    
+    reuse = await window_results.get(video_id)
+    # A failed generation must not replace a real course with placeholder sections
+    course, windows = await build_course(video_id, video_metadata, set_status, bypass_cache,
+                                         segments=segments, reuse=reuse, fallback=False)
+    
+    # Unchanged sections keep their ids
+    section_ids = {(section["title"], section["content"]): section["id"] for section in existing_course["sections"]}
+    for section in course.sections:
+        section.id = section_ids.get((section.title, section.content), section.id)
+    course.id = existing_course["id"]
+    course.created_at = existing_course["created_at"]
+    course.version = current + 1
+    course.updated_at = datetime.utcnow()
     
-    # Store in database
     course_dict = course.dict()
-    await db.courses.insert_one(course_dict)
+    # Courses stored before versioning have no version field, which {"version": None} matches
+    with timed_stage("replace_course"):
+        result = await db.courses.replace_one({"id": course.id, "version": existing_course.get("version")}, course_dict)
+    if result.matched_count == 0:
+        # Another regeneration got there first; its version stands
+        logger.info(f"Course for video {video_id} was regenerated concurrently, returning stored copy")
+        return Course(**await db.courses.find_one({"video_id": video_id}, {"_id": 0}))
     
+    # Publish the new version to this worker's readers straight away
+    hot_courses.put(course.id, (course_etag(course_dict), orjson.dumps(course_dict)))
+    index_related_course(course_dict)
+    await store_window_results(video_id, course.version, windows)
+    try:
+        await transcript_store.put(video_id, segments)
+    except Exception as e:
+        logger.error(f"Error storing transcript for video {video_id}: {str(e)}")
+    logger.info(f"Regenerated course for video {video_id} as version {course.version}: "
+                f"{len(windows)} window(s), {sum(1 for w in windows if w['hash'] in reuse)} reused")
     return course
 
+async def convert_new_video(video_id: str, set_status=None, bypass_cache: bool = False, on_section=None,
+                            batched: bool = False) -> Course:
+    """Run the full conversion pipeline for a video that has no stored course."""
+    # Another worker may have finished this video while we were waiting
+    existing_course = await db.courses.find_one({"video_id": video_id})
+    if existing_course:
+        return Course(**existing_course)
+    
+    pipeline_stats["pipeline_runs"] += 1
+    
+    # Fetch video metadata (title, description, thumbnail)
+    video_metadata = await fetch_video_metadata(video_id)
+    
+    # Process the video content and create a course
+    return await process_course_content(video_id, video_metadata, set_status, bypass_cache, on_section, batched)
+
+async def run_conversion_job(job: Dict, set_status) -> str:
+    """Job handler: convert the job's video and return the stored course id."""
+    video_id = job["video_id"]
+    bypass_cache = job.get("bypass_cache", False)
+    convert = regenerate_course if job.get("regenerate") else convert_new_video
+    # Job workers are already bounded by JOB_CONCURRENCY, so they wait rather than being rejected
+    course = await single_flight(video_id, lambda: admission.run(
+        lambda: convert(video_id, set_status, bypass_cache), bounded=False
+    ))
+    return course.id
+
+def resolve_video_id(video: str) -> Optional[str]:
+    """Accept either a YouTube URL or a bare video id."""
+    video = video.strip()
+    if re.fullmatch(r'[A-Za-z0-9_-]{11}', video):
+        return video
+    return extract_video_id(video)
+
+class CourseWriter:
+    """Insert courses finished by concurrent pipelines with shared insert_many calls.
+
+    A course handed to write() is inserted with those that arrive within
+    max_delay of the first of them, at most max_batch per call. Each writer
+    waits for its own course's outcome: DuplicateKeyError if another request
+    stored the video first. The write goes ahead even if the caller is
+    cancelled, since the course has already been paid for.
+    """
+
+    def __init__(self, collection, max_batch: int, max_delay: float):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending: List[Tuple[Dict, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    async def write(self, course: Dict):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((course, future))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.max_delay, self._flush)
+        await future
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.ensure_future(self._insert(batch))
+
+    async def _insert(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        errors: Dict[int, Exception] = {}
+        try:
+            await self.collection.insert_many([course for course, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                errors[error["index"]] = (
+                    DuplicateKeyError(error.get("errmsg", "duplicate key"), error["code"])
+                    if error.get("code") == 11000 else RuntimeError(error.get("errmsg", "Course write failed"))
+                )
+        except Exception as e:
+            errors = {index: e for index in range(len(batch))}
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in errors:
+                future.set_exception(errors[index])
+            else:
+                future.set_result(None)
+
+course_writer = CourseWriter(db.courses, max_batch=batch_write_size, max_delay=batch_write_delay)
+
+async def convert_batch(videos: List[str], bypass_cache: bool = False):
+    """Convert many videos, yielding a status dict per video as each completes.
+
+    Existing courses are resolved with a single $in query and the rest run
+    through a bounded concurrent pipeline. Each video shares any conversion
+    of it already in flight, and finished courses are written together by
+    the CourseWriter. If the client goes away, videos still waiting for the
+    pipeline are dropped, while the ones being generated are finished and
+    stored.
+    """
+    video_ids = []
+    for video in videos:
+        video_id = resolve_video_id(video)
+        if not video_id:
+            yield {"video": video, "status": "invalid"}
+        elif video_id not in video_ids:
+            video_ids.append(video_id)
+    
+    existing = {
+        doc["video_id"]: doc["id"]
+        async for doc in db.courses.find({"video_id": {"$in": video_ids}}, {"_id": 0, "video_id": 1, "id": 1})
+    }
+    for video_id, course_id in existing.items():
+        yield {"video_id": video_id, "status": "exists", "course_id": course_id}
+    
+    semaphore = asyncio.Semaphore(batch_concurrency)
+    
+    async def generate(video_id: str):
+        async with semaphore:
+            try:
+                course = await single_flight(video_id, lambda: admission.run(
+                    lambda: convert_new_video(video_id, bypass_cache=bypass_cache, batched=True)
+                ))
+                return video_id, course, None
+            except AdmissionRejected as e:
+                return video_id, None, str(e)
+            except Exception as e:
+                logger.error(f"Batch conversion of video {video_id} failed: {str(e)}")
+                return video_id, None, str(e)
+    
+    tasks = [asyncio.ensure_future(generate(video_id)) for video_id in video_ids if video_id not in existing]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            video_id, course, error = await next_done
+            if course is None:
+                yield {"video_id": video_id, "status": "failed", "error": error}
+            else:
+                yield {"video_id": video_id, "status": "stored", "course_id": course.id}
+    finally:
+        # The client went away; don't start generating for nobody. Pipelines
+        # already running are shielded by single_flight and still store their course.
+        for task in tasks:
+            task.cancel()
+
+# Course listings are ordered newest first, with id as the tie-breaker so that
+# keyset pagination is stable; backed by the (created_at, id) index
+COURSE_LIST_SORT = [("created_at", -1), ("id", -1)]
+COURSE_SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "video_id": 1, "title": 1, "description": 1, "thumbnail_url": 1, "created_at": 1,
+}
+
+def encode_course_cursor(course: Dict) -> str:
+    """Opaque cursor pointing just past the given course in listing order."""
+    position = json.dumps([course["created_at"].isoformat(), course["id"]])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+def decode_course_cursor(cursor: str) -> Dict:
+    """Turn a cursor into the query for the courses that come after it."""
+    try:
+        created_at, course_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        created_at = datetime.fromisoformat(created_at)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": course_id}},
+    ]}
+
+# Global cap on conversion pipelines running in this process, with a bounded
+# wait queue; beyond it new conversions are turned away with 429
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get('PIPELINE_CONCURRENCY', '8')),
+    max_queue=int(os.environ.get('PIPELINE_QUEUE_SIZE', '32')),
+)
+
+# Course generation jobs, drained by an in-process worker pool
+job_queue = JobQueue(
+    db.jobs,
+    run_conversion_job,
+    concurrency=int(os.environ.get('JOB_CONCURRENCY', '2')),
+    lease_seconds=int(os.environ.get('JOB_LEASE_SECONDS', '60')),
+    retention_seconds=int(os.environ.get('JOB_RETENTION_SECONDS', str(7 * 24 * 3600))),
+)
+# Jobs queued or running in this process before new submissions get 429
+job_backlog_limit = int(os.environ.get('JOB_MAX_BACKLOG', '64'))
+
+async def submit_conversion_job(video_id: str, bypass_cache: bool = False, regenerate: bool = False) -> ConversionJob:
+    """Return the active job for a video, or queue a new one."""
+    active_job = await job_queue.find_active(video_id)
+    if active_job:
+        return ConversionJob(**active_job)
+    # Jobs waiting for a worker compete for the same pipeline slots
+    admission.ensure_capacity(extra_waiting=job_queue.queue.qsize() + job_queue.reserved)
+    # ...but only JOB_CONCURRENCY of them at a time, so the job backlog needs its own bound
+    admission.ensure_backlog(job_queue.backlog(), job_backlog_limit, job_queue.concurrency)
+    # Take the slot before awaiting the insert, or concurrent submissions all pass the check
+    job_queue.reserve()
+    try:
+        job = ConversionJob(video_id=video_id, bypass_cache=bypass_cache, regenerate=regenerate)
+        await job_queue.submit(job.dict())
+    finally:
+        job_queue.release()
+    return job
+
 # API Routes
 @api_router.get("/")
 async def root():
@@ -268,49 +1098,326 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    # Written with the next batch
+    if not status_checks.add(status_obj.dict()):
+        raise HTTPException(status_code=503, detail="Too many status checks waiting to be written")
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.get("/status", response_model=List[StatusCheckSummary])
+async def get_status_checks(
+    window_seconds: int = Query(3600, ge=1, le=status_check_ttl_seconds),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Ping count and first/last-seen time per client over the last window_seconds, latest first."""
+    return await status_checks.summary(window_seconds, limit)
+
+@api_router.get("/indexes")
+async def get_indexes(explain: bool = False):
+    """Index build status from startup, optionally with the plans of the hot queries."""
+    result = {"indexes": index_report}
+    if explain:
+        plans = {}
+        for name, cursor in hot_queries().items():
+            stages = plan_stages(await cursor.explain())
+            plans[name] = {"stages": stages, "collscan": "COLLSCAN" in stages}
+        result["plans"] = plans
+    return result
+
+@api_router.get("/stats")
+async def get_stats():
+    return {
+        **pipeline_stats,
+        "inflight_conversions": len(inflight_conversions),
+        "queued_jobs": job_queue.queue.qsize(),
+        "recent_generations": list(generation_timings),
+        "recent_streams": list(streaming_timings),
+        "llm_cache": llm_cache.snapshot(),
+        "llm_json": parse_stats.snapshot(),
+        "hot_courses": hot_courses.snapshot(),
+        "admission": admission.snapshot(),
+        "gemini": gemini_guard.snapshot(),
+        "youtube_metadata": youtube_metadata.snapshot() if youtube_metadata else None,
+        "related_index": related_index.snapshot(),
+        "visualizations": {**visualization_renderer.snapshot(), "cache": visualization_images.snapshot()},
+        "thumbnails": thumbnail_proxy.snapshot(),
+        "status_checks": status_checks.snapshot(),
+    }
 
-@api_router.post("/convert-youtube", response_model=Course)
-async def convert_youtube_to_course(input: YouTubeInput, background_tasks: BackgroundTasks):
+@api_router.post("/convert-youtube", response_model=Course, responses={202: {"model": ConversionJob}})
+async def convert_youtube_to_course(input: YouTubeInput):
     # Extract video ID from the URL
     video_id = extract_video_id(input.video_url)
     if not video_id:
         raise HTTPException(status_code=400, detail="Invalid YouTube URL")
     
     # Check if we've already processed this video
-    existing_course = await db.courses.find_one({"video_id": video_id})
-    if existing_course:
+    existing_course = await db.courses.find_one({"video_id": video_id}, {"_id": 0})
+    if existing_course and not input.regenerate:
         # Return the existing course
-        return Course(**existing_course)
+        return ORJSONResponse(existing_course)
     
-    # Fetch video metadata (title, description, thumbnail)
-    video_metadata = await fetch_video_metadata(video_id)
+    # Queue a generation (or regeneration) job and let the client poll it;
+    # concurrent submissions for the same video share one job
+    regenerate = existing_course is not None
+    job = await single_flight(
+        video_id, lambda: submit_conversion_job(video_id, input.bypass_cache, regenerate), inflight_submissions,
+    )
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(job),
+        headers={"Location": f"/api/jobs/{job.id}"},
+    )
+
+@api_router.post("/convert-youtube/batch")
+async def convert_youtube_batch(input: BatchConvertInput):
+    """Convert a list of videos, streaming one JSON status line per video."""
+    async def stream_statuses():
+        async for result in convert_batch(input.videos, input.bypass_cache):
+            yield json.dumps(result) + "\n"
     
-    # Process the video content and create a course
-    course = await process_course_content(video_id, video_metadata)
+    return StreamingResponse(stream_statuses(), media_type="application/x-ndjson")
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+def sse_error(detail: str, status: int, retry_after: Optional[int] = None) -> StreamingResponse:
+    """Refuse a stream with an "error" event, since EventSource hides the body and status of non-2xx responses."""
+    payload = {"detail": detail, "status": status}
+    if retry_after is not None:
+        payload["retry_after"] = retry_after
     
-    return course
+    async def events():
+        yield sse_event("error", payload)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
-@api_router.get("/courses/{course_id}", response_model=Course)
-async def get_course(course_id: str):
-    course = await db.courses.find_one({"id": course_id})
+@api_router.get("/convert-youtube/stream")
+async def stream_youtube_course(video_url: str, bypass_cache: bool = False):
+    """Convert a video, streaming sections as Server-Sent Events while they are generated.
+
+    Emits "section" events in course order, then "course" with the stored
+    course (or "error"), then "done" with time-to-first-section and total latency.
+    Requests that are refused get a single "error" event with the HTTP status
+    they would have had and, for a full queue, retry_after in seconds.
+    """
+    video_id = extract_video_id(video_url)
+    if not video_id:
+        return sse_error("Invalid YouTube URL", 400)
+    
+    existing_course = await db.courses.find_one({"video_id": video_id}, {"_id": 0})
+    if not existing_course and video_id not in inflight_conversions:
+        try:
+            admission.ensure_capacity()
+        except AdmissionRejected as e:
+            return sse_error(str(e), 429, e.retry_after)
+    
+    async def events():
+        started = time.perf_counter()
+        if existing_course:
+            yield sse_event("course", existing_course)
+            yield sse_event("done", {"total_ms": round((time.perf_counter() - started) * 1000, 2)})
+            return
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def generate():
+            try:
+                course = await single_flight(video_id, lambda: admission.run(lambda: convert_new_video(
+                    video_id, bypass_cache=bypass_cache, on_section=lambda section: queue.put_nowait(("section", section))
+                )))
+                queue.put_nowait(("course", course))
+            except AdmissionRejected as e:
+                queue.put_nowait(("error", {"detail": str(e), "status": 429, "retry_after": e.retry_after}))
+            except Exception as e:
+                logger.error(f"Streaming conversion of video {video_id} failed: {str(e)}")
+                queue.put_nowait(("error", {"detail": str(e)}))
+        
+        # Not cancelled if the client disconnects: the generation is paid for either way
+        asyncio.ensure_future(generate())
+        first_section_ms = None
+        sections_sent = 0
+        while True:
+            event, payload = await queue.get()
+            if event == "section":
+                sections_sent += 1
+                payload = {**payload, "order": sections_sent}
+                if first_section_ms is None:
+                    first_section_ms = round((time.perf_counter() - started) * 1000, 2)
+            yield sse_event(event, payload)
+            if event != "section":
+                break
+        
+        timings = {
+            "time_to_first_section_ms": first_section_ms,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            "sections_streamed": sections_sent,
+        }
+        streaming_timings.append({"video_id": video_id, **timings})
+        yield sse_event("done", timings)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # Let nginx pass events through as they are written
+        "X-Accel-Buffering": "no",
+    })
+
+@api_router.get("/jobs/{job_id}", response_model=ConversionJob)
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return ConversionJob(**job)
+
+# Read handlers serve stored course documents as-is: they were validated as
+# Course on write, so re-validating them through pydantic on every read only
+# costs CPU. response_model is kept for the API schema; returning a Response
+# bypasses it.
+
+@api_router.get("/courses/search")
+async def search_courses(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    page: int = Query(1, ge=1, le=50),
+):
+    """Full-text search over course titles, descriptions and sections, best match first.
+
+    Each hit carries a highlight of its best matching section, with the
+    section timestamp to jump to in the video.
+    """
+    projection = {
+        **COURSE_SUMMARY_PROJECTION,
+        "score": {"$meta": "textScore"},
+        "sections.id": 1, "sections.title": 1, "sections.content": 1,
+        "sections.timestamp": 1, "sections.order": 1,
+    }
+    # One extra hit tells whether there is a next page
+    hits = await db.courses.find({"$text": {"$search": q}}, projection).sort(
+        [("score", {"$meta": "textScore"})]
+    ).skip((page - 1) * limit).limit(limit + 1).to_list(limit + 1)
+    
+    terms = search_terms(q)
+    results = []
+    for hit in hits[:limit]:
+        sections = hit.pop("sections", [])
+        hit["score"] = round(hit["score"], 3)
+        hit["highlight"] = highlight(sections, terms)
+        results.append(hit)
+    return ORJSONResponse({"query": q, "page": page, "has_more": len(hits) > limit, "results": results})
+
+@api_router.get("/courses/{course_id}/related", response_model=List[CourseSummary])
+async def get_related_courses(course_id: str, limit: int = Query(6, ge=1, le=24)):
+    """Courses whose section text is most similar to this one, best match first."""
+    course = await db.courses.find_one({"id": course_id}, RELATED_PROJECTION)
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
-    return Course(**course)
+    
+    scores = dict(related_index.related(term_counts(course), limit, exclude=course_id))
+    related = await db.courses.find(
+        {"id": {"$in": list(scores)}}, COURSE_SUMMARY_PROJECTION
+    ).to_list(len(scores))
+    for summary in related:
+        summary["score"] = scores[summary["id"]]
+    related.sort(key=lambda summary: summary["score"], reverse=True)
+    return ORJSONResponse(related)
 
-@api_router.get("/courses", response_model=List[Course])
-async def get_all_courses():
-    courses = await db.courses.find().to_list(20)
-    return [Course(**course) for course in courses]
+@api_router.get("/courses/{course_id}", response_model=Course)
+async def get_course(course_id: str, if_none_match: Optional[str] = Header(None)):
+    # Popular courses are answered from the hot cache without a database round
+    # trip; its TTL bounds how long a regeneration on another worker goes unseen
+    cached = hot_courses.get(course_id)
+    if cached is None:
+        course = await db.courses.find_one({"id": course_id}, {"_id": 0})
+        if not course:
+            raise HTTPException(status_code=404, detail="Course not found")
+        cached = (course_etag(course), orjson.dumps(course))
+        hot_courses.put(course_id, cached)
+    
+    etag, body = cached
+    headers = {"ETag": etag, "Cache-Control": course_cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@api_router.get("/visualizations/{digest}/{variant}.png")
+async def get_visualization(digest: str, variant: str, if_none_match: Optional[str] = Header(None)):
+    """A stored rendering; the address changes whenever the picture would, so it caches forever."""
+    if variant not in VARIANT_WIDTHS:
+        raise HTTPException(status_code=404, detail="Unknown visualization size")
+    etag = f'"{digest}-{variant}"'
+    headers = {"ETag": etag, "Cache-Control": VISUALIZATION_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    key = f"{digest}/{variant}"
+    image = visualization_images.get(key)
+    if image is None:
+        image = await visualization_renderer.get(digest, variant)
+        if image is None:
+            raise HTTPException(status_code=404, detail="Visualization not found")
+        visualization_images.put(key, image)
+    return Response(content=image, media_type="image/png", headers=headers)
+
+@api_router.get("/thumbnails/{video_id}/{size}.{extension}")
+async def get_thumbnail(
+    video_id: str,
+    size: str,
+    extension: str,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    """A video thumbnail cropped to 16:9 and resized for the course cards, as JPEG or WebP."""
+    if not VIDEO_ID.match(video_id) or size not in THUMBNAIL_WIDTHS or extension not in THUMBNAIL_FORMATS:
+        raise HTTPException(status_code=404, detail="Unknown thumbnail")
+    try:
+        thumbnail = await thumbnail_proxy.get(video_id, f"{size}.{extension}")
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="Thumbnail upstream unavailable")
+    except BadSourceImage:
+        raise HTTPException(status_code=502, detail="Thumbnail upstream sent an unreadable image")
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Video has no thumbnail")
+    
+    headers = {
+        "ETag": thumbnail.etag,
+        "Last-Modified": http_date(thumbnail.modified),
+        "Cache-Control": thumbnail_cache_control,
+    }
+    # If-None-Match wins over If-Modified-Since when both are sent
+    if etag_matches(if_none_match, thumbnail.etag) or (
+        not if_none_match and not modified_since(if_modified_since, thumbnail.modified)
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(content=thumbnail.data, media_type=THUMBNAIL_FORMATS[extension][1], headers=headers)
+
+@api_router.get("/courses", response_model=Union[List[Course], List[CourseSummary]])
+async def get_all_courses(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    view: Literal["full", "summary"] = "full",
+):
+    """List courses newest first; the X-Next-Cursor header fetches the next page.
+
+    The summary view only returns the fields needed for course cards.
+    """
+    query = decode_course_cursor(cursor) if cursor else {}
+    projection = COURSE_SUMMARY_PROJECTION if view == "summary" else {"_id": 0}
+    courses = await db.courses.find(query, projection).sort(COURSE_LIST_SORT).limit(limit).to_list(limit)
+    headers = {}
+    if len(courses) == limit:
+        headers["X-Next-Cursor"] = encode_course_cursor(courses[-1])
+    return ORJSONResponse(courses, headers=headers)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # Include the router in the main app
 app.include_router(api_router)
+# Prometheus scrape target for the stage and Mongo histograms
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
 
 app.add_middleware(
     CORSMiddleware,
@@ -318,7 +1425,9 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+app.add_middleware(ServerTimingMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -327,6 +1436,114 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def required_indexes() -> Dict[str, List[IndexModel]]:
+    """Indexes every collection needs; reconciled at startup."""
+    return {
+        "courses": [
+            # Dedup lookups, and the cross-worker backstop against duplicate courses
+            IndexModel("video_id", unique=True),
+            IndexModel("id", unique=True),
+            # Newest-first listings and keyset pagination
+            IndexModel(COURSE_LIST_SORT),
+            # Relevance-ranked search over titles, descriptions and sections
+            text_index_model(),
+        ],
+        "status_checks": status_checks.index_models(),
+        "jobs": job_queue.index_models(),
+        "llm_cache": llm_cache.index_models(),
+        "transcripts": transcript_store.index_models(),
+        "course_windows": window_results.index_models(),
+        "visualizations": visualization_renderer.index_models(),
+    }
+
+# Result of the last reconciliation, reported by GET /api/indexes
+index_report: Dict[str, Dict[str, str]] = {}
+
+def hot_queries() -> Dict[str, Any]:
+    """Cursors for the queries on the request path that must use an index."""
+    probe = "0" * 11
+    return {
+        "course_by_video_id": db.courses.find({"video_id": probe}).limit(1),
+        "course_by_id": db.courses.find({"id": probe}).limit(1),
+        "course_listing": db.courses.find({}).sort(COURSE_LIST_SORT).limit(20),
+        "course_listing_page": db.courses.find(
+            decode_course_cursor(encode_course_cursor({"created_at": datetime.utcnow(), "id": probe}))
+        ).sort(COURSE_LIST_SORT).limit(20),
+        "courses_by_video_ids": db.courses.find({"video_id": {"$in": [probe]}}),
+        "course_search": db.courses.find({"$text": {"$search": "introduction"}}).limit(20),
+        "job_by_id": db.jobs.find({"id": probe}).limit(1),
+        "active_job_by_video_id": db.jobs.find({"video_id": probe, "status": {"$in": ["queued"]}}).limit(1),
+        "llm_cache_by_key": db.llm_cache.find({"key": probe}).limit(1),
+        "transcript_by_video_id": db.transcripts.find({"video_id": probe}).limit(1),
+        "window_results_by_video_id": db.course_windows.find({"video_id": probe}).limit(1),
+        "visualization_by_digest": db.visualizations.find({"digest": probe}).limit(1),
+        "status_checks_in_window": db.status_checks.find({"timestamp": {"$gte": datetime.utcnow()}}),
+    }
+
+@app.on_event("startup")
+async def ensure_indexes():
+    global index_report
+    # Driver errors come back as "degraded" entries; anything else must not stop startup either
+    try:
+        index_report = await reconcile_indexes(db, required_indexes())
+    except Exception as e:
+        logger.error(f"Index reconciliation failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_job_workers():
+    await job_queue.start()
+
+@app.on_event("startup")
+async def start_status_check_flusher():
+    await status_checks.start()
+
+async def load_related_index(batch_size: int = 500):
+    """Index every stored course, tokenizing off the event loop one batch at a time."""
+    loop = asyncio.get_running_loop()
+    
+    async def index_batch(batch: List[Dict]):
+        counts = await loop.run_in_executor(None, lambda: [(c["id"], term_counts(c)) for c in batch])
+        for course_id, course_counts in counts:
+            # Courses stored while loading are already in
+            if course_id not in related_index:
+                related_index.add(course_id, course_counts)
+    
+    try:
+        batch = []
+        async for course in db.courses.find({}, RELATED_PROJECTION).batch_size(batch_size):
+            batch.append(course)
+            if len(batch) == batch_size:
+                await index_batch(batch)
+                batch = []
+        await index_batch(batch)
+        await related_index.compact()
+        related_index.ready = True
+        logger.info(f"Related-course index loaded: {related_index.snapshot()}")
+    except Exception as e:
+        logger.error(f"Error loading related-course index: {str(e)}")
+
+@app.on_event("startup")
+async def open_thumbnail_cache():
+    # Opening scans the cache directory, so it waits for startup rather than import
+    try:
+        thumbnail_proxy.cache = await asyncio.get_running_loop().run_in_executor(
+            None, DiskLRUCache, thumbnail_cache_dir, thumbnail_cache_max_bytes,
+        )
+    except OSError as e:
+        logger.error(f"Thumbnail cache {thumbnail_cache_dir} unusable, thumbnails won't be cached: {str(e)}")
+
+@app.on_event("startup")
+async def start_related_index():
+    # Recommendations from the courses indexed so far are served while it loads
+    asyncio.ensure_future(load_related_index())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await job_queue.stop()
+    await status_checks.stop()
+    if youtube_metadata is not None:
+        await youtube_metadata.close()
+    await thumbnail_proxy.close()
     client.close()
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    visualization_renderer.close()
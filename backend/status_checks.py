@@ -0,0 +1,107 @@
+"""Status-check pings written in batches and read back as per-client summaries."""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import IndexModel
+
+logger = logging.getLogger(__name__)
+
+
+class StatusCheckBuffer:
+    """Buffer status checks in memory and write them with insert_many.
+
+    A batch is flushed once max_batch pings are waiting or flush_seconds after
+    the last flush, whichever comes first. At most max_pending pings are held;
+    past that (Mongo down or too slow to keep up) new pings are dropped and
+    counted rather than growing the buffer. Old pings are removed by the TTL
+    index on timestamp.
+    """
+
+    def __init__(self, collection, ttl_seconds: int, max_batch: int = 500, flush_seconds: float = 2.0,
+                 max_pending: int = 10000):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.max_batch = max_batch
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.pending: List[Dict] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"accepted": 0, "dropped": 0, "written": 0, "flushes": 0, "failed_flushes": 0}
+
+    def index_models(self) -> List[IndexModel]:
+        # Retention, and the time-window match of summaries
+        return [IndexModel("timestamp", expireAfterSeconds=self.ttl_seconds)]
+
+    async def start(self):
+        self.task = asyncio.ensure_future(self._flusher())
+
+    async def stop(self):
+        """Stop the flusher and write whatever is still buffered."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    def add(self, status_check: Dict) -> bool:
+        """Queue a ping for the next batch; False if the buffer is full and it was dropped."""
+        if len(self.pending) >= self.max_pending:
+            self.stats["dropped"] += 1
+            return False
+        self.pending.append(status_check)
+        self.stats["accepted"] += 1
+        if len(self.pending) >= self.max_batch:
+            self.wakeup.set()
+        return True
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write every buffered ping, max_batch per insert_many."""
+        while self.pending:
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+            except Exception as e:
+                self.stats["failed_flushes"] += 1
+                logger.error(f"Error writing {len(batch)} status checks: {str(e)}")
+                # Put the batch back for the next flush, as far as the bound allows
+                room = max(0, self.max_pending - len(self.pending))
+                self.stats["dropped"] += len(batch) - min(room, len(batch))
+                self.pending[:0] = batch[:room]
+                return
+            self.stats["written"] += len(batch)
+            self.stats["flushes"] += 1
+
+    async def summary(self, window_seconds: int, limit: int) -> List[Dict]:
+        """Ping count and first/last-seen times per client over the last window_seconds, latest first."""
+        # Buffered pings count too
+        await self.flush()
+        since = datetime.utcnow() - timedelta(seconds=window_seconds)
+        pipeline = [
+            {"$match": {"timestamp": {"$gte": since}}},
+            {"$group": {
+                "_id": "$client_name",
+                "count": {"$sum": 1},
+                "first_seen": {"$min": "$timestamp"},
+                "last_seen": {"$max": "$timestamp"},
+            }},
+            {"$sort": {"last_seen": -1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "client_name": "$_id", "count": 1, "first_seen": 1, "last_seen": 1}},
+        ]
+        return await self.collection.aggregate(pipeline).to_list(limit)
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "pending": len(self.pending), "max_pending": self.max_pending}
@@ -0,0 +1,267 @@
+"""Thumbnail proxy: video thumbnails fetched once, resized for the course cards and kept in an LRU disk cache."""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import httpx
+
+from http_cache import HotCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UPSTREAM_URL = "https://i.ytimg.com/vi"
+
+# Source images in order of preference; maxresdefault is missing for many older videos
+SOURCE_IMAGES = ("maxresdefault.jpg", "sddefault.jpg", "hqdefault.jpg")
+
+# Widths the cards and the course header are drawn at (1x and 2x), all cropped to 16:9
+THUMBNAIL_WIDTHS = {"sm": 320, "md": 480, "lg": 640}
+THUMBNAIL_FORMATS = {"jpg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+ASPECT_RATIO = 9 / 16
+
+VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+
+class BadSourceImage(Exception):
+    """The upstream answered with something that isn't a usable image."""
+
+
+class Thumbnail(NamedTuple):
+    data: bytes
+    etag: str
+    modified: float
+
+
+def render_thumbnails(source: bytes) -> Dict[str, bytes]:
+    """Every size and format of a thumbnail, keyed like "md.webp"."""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(source)).convert("RGB")
+    # Crop to 16:9, which also drops the letterbox bars of the 4:3 fallbacks
+    height = min(image.height, round(image.width * ASPECT_RATIO))
+    top = (image.height - height) // 2
+    image = image.crop((0, top, image.width, top + height))
+
+    variants = {}
+    for name, width in sorted(THUMBNAIL_WIDTHS.items(), key=lambda item: -item[1]):
+        image = image.resize((width, round(width * ASPECT_RATIO)), Image.Resampling.LANCZOS,
+                             reducing_gap=2.0)
+        for extension, (image_format, _) in THUMBNAIL_FORMATS.items():
+            buffer = io.BytesIO()
+            if image_format == "WEBP":
+                image.save(buffer, format=image_format, quality=78, method=4)
+            else:
+                image.save(buffer, format=image_format, quality=82, optimize=True, progressive=True)
+            variants[f"{name}.{extension}"] = buffer.getvalue()
+    return variants
+
+
+class DiskLRUCache:
+    """Files under a directory, evicted least recently used first past max_bytes.
+
+    Recency is kept in memory and mirrored to file access times, so the order
+    survives restarts; modification times stay the time of the write. Writes
+    go through a temporary file and a rename, so readers (including other
+    workers sharing the directory) never see a partial file. Each worker only
+    accounts for the files it knows about. Methods block and may be called
+    from several threads.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        self._load()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def _load(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = [(path.stat(), path) for path in self.directory.glob("*/*") if path.is_file()]
+        for stat, path in sorted(files, key=lambda entry: entry[0].st_atime):
+            if path.name.startswith("."):
+                # A write that never got renamed into place
+                path.unlink(missing_ok=True)
+                continue
+            self.entries[path.name] = stat.st_size
+            self.total_bytes += stat.st_size
+        self._evict()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Contents and modification time of a cached file."""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            modified = path.stat().st_mtime
+            os.utime(path, (time.time(), modified))
+        except FileNotFoundError:
+            # Evicted, possibly by another worker
+            with self.lock:
+                self._forget(key)
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = len(data)
+                self.total_bytes += len(data)
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+        return data, modified
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=path.parent, prefix=".")
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp, path)
+        with self.lock:
+            self._forget(key)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def _forget(self, key: str):
+        size = self.entries.pop(key, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self._path(key).unlink(missing_ok=True)
+            self.stats["evictions"] += 1
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "files": len(self.entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes}
+
+
+class ThumbnailProxy:
+    """Serve resized thumbnails, fetching each video's source image once.
+
+    The first request for any variant of a video downloads the source and
+    writes every size and format at once; concurrent requests for the same
+    video share that work. Videos without any thumbnail, or with a source
+    that can't be decoded, are remembered for a few minutes so they don't send
+    every request upstream. Without a disk cache (not opened yet, or the
+    directory is unusable) variants are rendered for each request.
+    """
+
+    def __init__(self, cache: Optional[DiskLRUCache] = None, upstream_url: str = DEFAULT_UPSTREAM_URL, timeout: float = 10.0,
+                 max_connections: int = 10, missing_ttl: float = 300,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.cache = cache
+        self.upstream_url = upstream_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        # transport lets tests and benchmarks point the proxy at a local stand-in
+        self.transport = transport
+        self.http: Optional[httpx.AsyncClient] = None
+        self.missing = HotCache(max_entries=10000, ttl_seconds=missing_ttl)
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"fetches": 0, "upstream_bytes": 0, "served_bytes": 0, "failures": 0}
+
+    def _client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                transport=self.transport,
+            )
+        return self.http
+
+    async def get(self, video_id: str, variant: str) -> Optional[Thumbnail]:
+        """A variant such as "md.webp", or None if the video has no thumbnail."""
+        key = f"{video_id}-{variant}"
+        cached = await self._cached(key)
+        if cached is None:
+            if self.missing.get(video_id) is not None:
+                return None
+            future = self.inflight.get(video_id)
+            if future is None:
+                future = self.inflight[video_id] = asyncio.ensure_future(self._fill(video_id))
+                future.add_done_callback(lambda _: self.inflight.pop(video_id, None))
+            variants = await asyncio.shield(future)
+            if variants is None:
+                return None
+            # Served from memory if the write failed or the file was already evicted
+            cached = await self._cached(key) or (variants[variant], time.time())
+        data, modified = cached
+        self.stats["served_bytes"] += len(data)
+        return Thumbnail(data, f'"{hashlib.blake2b(data, digest_size=8).hexdigest()}"', modified)
+
+    async def _fetch_source(self, video_id: str) -> Optional[bytes]:
+        for name in SOURCE_IMAGES:
+            self.stats["fetches"] += 1
+            response = await self._client().get(f"{self.upstream_url}/{video_id}/{name}")
+            if response.status_code == 404:
+                continue
+            response.raise_for_status()
+            self.stats["upstream_bytes"] += len(response.content)
+            return response.content
+        return None
+
+    async def _cached(self, key: str) -> Optional[Tuple[bytes, float]]:
+        if self.cache is None:
+            return None
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.cache.get, key)
+        except OSError as e:
+            logger.error(f"Error reading cached thumbnail {key}: {str(e)}")
+            return None
+
+    async def _fill(self, video_id: str) -> Optional[Dict[str, bytes]]:
+        """Every variant of a video's thumbnail, also written to the cache; None if it has none."""
+        loop = asyncio.get_running_loop()
+        try:
+            source = await self._fetch_source(video_id)
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error(f"Error fetching thumbnail for video {video_id}: {str(e)}")
+            raise
+        if source is None:
+            self.missing.put(video_id, True)
+            return None
+        try:
+            variants = await loop.run_in_executor(None, render_thumbnails, source)
+        except Exception as e:
+            self.stats["failures"] += 1
+            self.missing.put(video_id, True)
+            logger.error(f"Error decoding thumbnail for video {video_id}: {str(e)}")
+            raise BadSourceImage(str(e)) from e
+        if self.cache is not None:
+            try:
+                await loop.run_in_executor(None, self._store, video_id, variants)
+            except OSError as e:
+                # The variants are still served, just not kept
+                logger.error(f"Error caching thumbnail for video {video_id}: {str(e)}")
+        return variants
+
+    def _store(self, video_id: str, variants: Dict[str, bytes]):
+        for variant, data in variants.items():
+            self.cache.put(f"{video_id}-{variant}", data)
+
+    async def close(self):
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "inflight": len(self.inflight),
+                "cache": self.cache.snapshot() if self.cache is not None else None}
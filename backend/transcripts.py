@@ -0,0 +1,85 @@
+"""Persistent store of timestamped transcripts, packed as compressed parallel arrays."""
+import bisect
+import json
+import logging
+import re
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson.binary import Binary
+from pymongo import IndexModel
+
+from chunking import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+def pack_segments(segments: List[Dict]) -> bytes:
+    """Pack segments into zlib-compressed parallel arrays (offsets in milliseconds)."""
+    arrays = {
+        "start": [int(round(segment.get("start", 0.0) * 1000)) for segment in segments],
+        "duration": [int(round(segment.get("duration", 0.0) * 1000)) for segment in segments],
+        "text": [segment["text"] for segment in segments],
+    }
+    return zlib.compress(json.dumps(arrays, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def unpack_segments(data: bytes) -> List[Dict]:
+    arrays = json.loads(zlib.decompress(data).decode("utf-8"))
+    return [
+        {"text": text, "start": start / 1000, "duration": duration / 1000}
+        for start, duration, text in zip(arrays["start"], arrays["duration"], arrays["text"])
+    ]
+
+
+def parse_timestamp(label: Optional[str]) -> Optional[float]:
+    """Parse "SS", "MM:SS" or "H:MM:SS" into seconds; None if it isn't one."""
+    if not label or not re.fullmatch(r"\s*\d+(:\d{1,2}){0,2}\s*", str(label)):
+        return None
+    seconds = 0
+    for part in str(label).strip().split(":"):
+        seconds = seconds * 60 + int(part)
+    return float(seconds)
+
+
+def resolve_timestamp(label: Optional[str], starts: List[float]) -> Optional[str]:
+    """Snap a model-provided timestamp to the start of the segment containing it.
+
+    starts must be sorted. Labels past the end of the video resolve to the last
+    segment; labels that can't be parsed resolve to None.
+    """
+    seconds = parse_timestamp(label)
+    if seconds is None or not starts:
+        return None
+    index = max(0, bisect.bisect_right(starts, seconds) - 1)
+    return format_timestamp(starts[index])
+
+
+class TranscriptStore:
+    """Transcripts stored once per video in their own collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def index_models(self) -> List[IndexModel]:
+        return [IndexModel("video_id", unique=True)]
+
+    async def get(self, video_id: str) -> Optional[List[Dict]]:
+        doc = await self.collection.find_one({"video_id": video_id}, {"_id": 0, "segments": 1})
+        if doc is None:
+            return None
+        return unpack_segments(doc["segments"])
+
+    async def put(self, video_id: str, segments: List[Dict]):
+        packed = pack_segments(segments)
+        await self.collection.update_one(
+            {"video_id": video_id},
+            {"$set": {
+                "segments": Binary(packed),
+                "segment_count": len(segments),
+                "stored_bytes": len(packed),
+                "fetched_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
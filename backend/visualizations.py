@@ -0,0 +1,319 @@
+"""Course visualizations drawn with Pillow in a process pool and stored as pre-resized PNGs."""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import math
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson.binary import Binary
+from pymongo import IndexModel
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the drawing changes, so new renders get new addresses
+RENDERER_VERSION = 1
+
+# Stored variants by width; all share the 16:10 canvas
+VARIANT_WIDTHS = {"lg": 1600, "md": 800, "sm": 400}
+ASPECT_RATIO = 10 / 16
+# Drawn at twice the largest variant and scaled down, which antialiases lines and shapes
+SUPERSAMPLE = 2
+
+# Sections drawn before the rest are folded into a "+N more" node
+MAX_CONCEPT_NODES = 8
+MAX_FLOW_NODES = 20
+FLOW_TITLE = re.compile(r"flow|timeline|process|steps|sequence|roadmap", re.IGNORECASE)
+
+BACKGROUND = (30, 27, 75)
+NODE_FILL = (67, 56, 202)
+NODE_OUTLINE = (165, 180, 252)
+CENTER_FILL = (129, 140, 248)
+HIGHLIGHT_FILL = (245, 158, 11)
+EDGE = (99, 102, 241)
+TEXT = (238, 242, 255)
+DARK_TEXT = (30, 27, 75)
+
+FONT_FILES = ("DejaVuSans.ttf", "DejaVuSans-Bold.ttf", "Arial.ttf")
+
+Box = Tuple[float, float, float, float]
+
+
+def visualization_spec(visualization: Dict, sections: List[Dict]) -> Dict:
+    """Everything the drawing depends on, and nothing else."""
+    title = visualization.get("title", "")
+    nodes = [
+        {"order": section.get("order"), "title": section.get("title", "")}
+        for section in sorted(sections, key=lambda s: s.get("order", 0))
+    ]
+    related = str(visualization.get("related_section_id"))
+    highlight = next(
+        (s.get("order") for s in sections if related in (str(s.get("order")), s.get("id"))), None,
+    )
+    kind = "flow" if FLOW_TITLE.search(title) or len(nodes) > MAX_CONCEPT_NODES else "concept_map"
+    return {"version": RENDERER_VERSION, "kind": kind, "title": title, "nodes": nodes, "highlight": highlight}
+
+
+def spec_digest(spec: Dict) -> str:
+    """Address of a rendering; the drawing is deterministic, so equal specs give equal images."""
+    encoded = json.dumps(spec, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def _font(size: int):
+    from PIL import ImageFont
+
+    for name in FONT_FILES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+
+def _wrap(draw, text: str, font, width: float, max_lines: int) -> List[str]:
+    lines: List[str] = []
+    line = ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if not line or draw.textlength(candidate, font=font) <= width:
+            line = candidate
+        else:
+            lines.append(line)
+            line = word
+    if line:
+        lines.append(line)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] += "..."
+    # Words too long for the box are cut
+    for i, line in enumerate(lines):
+        while len(line) > 1 and draw.textlength(line, font=font) > width:
+            line = line[:-4] + "..." if len(line) > 4 else line[:-1]
+        lines[i] = line
+    return lines
+
+
+def _text_block(draw, box: Box, text: str, font, fill, max_lines: int = 3):
+    x0, y0, x1, y1 = box
+    padding = (x1 - x0) * 0.08
+    lines = _wrap(draw, text, font, x1 - x0 - 2 * padding, max_lines)
+    line_height = font.size * 1.25
+    y = (y0 + y1) / 2 - line_height * len(lines) / 2
+    for line in lines:
+        draw.text(((x0 + x1) / 2 - draw.textlength(line, font=font) / 2, y), line, font=font, fill=fill)
+        y += line_height
+
+
+def _node(draw, box: Box, text: str, font, highlighted: bool, badge: Optional[str] = None, badge_font=None):
+    radius = (box[3] - box[1]) * 0.18
+    fill = HIGHLIGHT_FILL if highlighted else NODE_FILL
+    draw.rounded_rectangle(box, radius=radius, fill=fill, outline=NODE_OUTLINE, width=max(2, int(radius / 6)))
+    _text_block(draw, box, text, font, DARK_TEXT if highlighted else TEXT)
+    if badge is not None:
+        r = radius * 0.9
+        cx, cy = box[0] + r * 0.6, box[1] + r * 0.6
+        draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=CENTER_FILL, outline=NODE_OUTLINE, width=2)
+        draw.text((cx - draw.textlength(badge, font=badge_font) / 2, cy - badge_font.size * 0.6), badge,
+                  font=badge_font, fill=DARK_TEXT)
+
+
+def _boundary(box: Box, toward: Tuple[float, float]) -> Tuple[float, float]:
+    """Where the line from the box's center toward a point leaves the box."""
+    x0, y0, x1, y1 = box
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    dx, dy = toward[0] - cx, toward[1] - cy
+    if not dx and not dy:
+        return cx, cy
+    scale = min((x1 - cx) / abs(dx) if dx else math.inf, (y1 - cy) / abs(dy) if dy else math.inf)
+    return cx + dx * scale, cy + dy * scale
+
+
+def _arrow(draw, start, end, width: int, head: float):
+    angle = math.atan2(end[1] - start[1], end[0] - start[0])
+    draw.line([start, (end[0] - head * 0.8 * math.cos(angle), end[1] - head * 0.8 * math.sin(angle))],
+              fill=EDGE, width=width)
+    draw.polygon([
+        end,
+        (end[0] - head * math.cos(angle - math.pi / 7), end[1] - head * math.sin(angle - math.pi / 7)),
+        (end[0] - head * math.cos(angle + math.pi / 7), end[1] - head * math.sin(angle + math.pi / 7)),
+    ], fill=EDGE)
+
+
+def _fold(nodes: List[Dict], limit: int) -> List[Dict]:
+    if len(nodes) <= limit:
+        return nodes
+    return nodes[:limit - 1] + [{"order": None, "title": f"+{len(nodes) - limit + 1} more sections"}]
+
+
+def _draw_concept_map(draw, spec: Dict, width: int, height: int):
+    """The visualization title in the middle, sections around it in reading order."""
+    nodes = _fold(spec["nodes"], MAX_CONCEPT_NODES)
+    cx, cy = width / 2, height / 2
+    node_w, node_h = width * 0.2, height * 0.14
+    rx, ry = width / 2 - node_w * 0.6 - width * 0.02, height / 2 - node_h * 0.6 - height * 0.03
+    boxes = []
+    for i in range(len(nodes)):
+        angle = -math.pi / 2 + 2 * math.pi * i / max(1, len(nodes))
+        x, y = cx + rx * math.cos(angle), cy + ry * math.sin(angle)
+        boxes.append((x - node_w / 2, y - node_h / 2, x + node_w / 2, y + node_h / 2))
+
+    line_width = max(2, width // 400)
+    for box in boxes:
+        draw.line([(cx, cy), ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)], fill=EDGE, width=line_width)
+
+    center = (cx - width * 0.17, cy - height * 0.12, cx + width * 0.17, cy + height * 0.12)
+    draw.ellipse(center, fill=CENTER_FILL, outline=NODE_OUTLINE, width=line_width)
+    _text_block(draw, center, spec["title"], _font(int(height * 0.045)), DARK_TEXT)
+
+    font, badge_font = _font(int(height * 0.03)), _font(int(height * 0.025))
+    for node, box in zip(nodes, boxes):
+        badge = str(node["order"]) if node["order"] is not None else None
+        _node(draw, box, node["title"], font, node["order"] == spec["highlight"], badge, badge_font)
+
+
+def _draw_flow(draw, spec: Dict, width: int, height: int):
+    """Sections as a left-to-right, top-to-bottom chain under a title band."""
+    nodes = _fold(spec["nodes"], MAX_FLOW_NODES)
+    header = height * 0.14
+    _text_block(draw, (0, 0, width, header), spec["title"], _font(int(height * 0.05)), TEXT, max_lines=1)
+
+    columns = min(len(nodes), 5 if len(nodes) > 12 else 4) or 1
+    rows = math.ceil(len(nodes) / columns)
+    margin = width * 0.03
+    cell_w = (width - 2 * margin) / columns
+    cell_h = (height - header - margin) / max(rows, 1)
+    node_w, node_h = cell_w * 0.78, min(cell_h * 0.64, height * 0.2)
+    boxes = []
+    for i in range(len(nodes)):
+        row, column = divmod(i, columns)
+        # Snake back on alternate rows so consecutive sections stay adjacent
+        if row % 2:
+            column = columns - 1 - column
+        x = margin + cell_w * (column + 0.5)
+        y = header + cell_h * (row + 0.5)
+        boxes.append((x - node_w / 2, y - node_h / 2, x + node_w / 2, y + node_h / 2))
+
+    line_width = max(2, width // 400)
+    for start_box, end_box in zip(boxes, boxes[1:]):
+        start_center = ((start_box[0] + start_box[2]) / 2, (start_box[1] + start_box[3]) / 2)
+        end_center = ((end_box[0] + end_box[2]) / 2, (end_box[1] + end_box[3]) / 2)
+        _arrow(draw, _boundary(start_box, end_center), _boundary(end_box, start_center),
+               line_width, height * 0.025)
+
+    font_size = int(min(height * 0.03, node_h * 0.2))
+    font, badge_font = _font(font_size), _font(int(font_size * 0.85))
+    for node, box in zip(nodes, boxes):
+        badge = str(node["order"]) if node["order"] is not None else None
+        _node(draw, box, node["title"], font, node["order"] == spec["highlight"], badge, badge_font)
+
+
+def render_variants(spec: Dict) -> Dict[str, bytes]:
+    """Draw a visualization and encode every variant as a palette PNG (runs in a worker process)."""
+    from PIL import Image, ImageDraw
+
+    width = max(VARIANT_WIDTHS.values()) * SUPERSAMPLE
+    height = int(width * ASPECT_RATIO)
+    image = Image.new("RGB", (width, height), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    if spec["kind"] == "flow":
+        _draw_flow(draw, spec, width, height)
+    else:
+        _draw_concept_map(draw, spec, width, height)
+
+    variants = {}
+    # Largest first, each scaled down from the previous one; halving is a cheap box reduce
+    for name, variant_width in sorted(VARIANT_WIDTHS.items(), key=lambda item: -item[1]):
+        if image.width % variant_width == 0:
+            image = image.reduce(image.width // variant_width)
+        else:
+            image = image.resize((variant_width, int(variant_width * ASPECT_RATIO)), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        # Flat diagram colors survive an adaptive palette, which roughly thirds the size
+        image.quantize(colors=128, method=Image.Quantize.FASTOCTREE).save(buffer, format="PNG", optimize=True)
+        variants[name] = buffer.getvalue()
+    return variants
+
+
+class VisualizationRenderer:
+    """Render visualizations in a process pool and store each rendering once.
+
+    A rendering is addressed by the digest of its spec, so courses that draw
+    the same thing share one stored copy and an already stored digest is never
+    drawn again. Concurrent requests for the same digest share one render.
+    """
+
+    def __init__(self, collection, max_workers: int = 2):
+        self.collection = collection
+        self.max_workers = max_workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"rendered": 0, "reused": 0, "failures": 0, "served": 0}
+
+    def index_models(self) -> List[IndexModel]:
+        return [IndexModel("digest", unique=True)]
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: the parent runs Motor's threads; started on first use
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.pool
+
+    async def render(self, spec: Dict) -> str:
+        """Digest of the stored rendering of a spec, drawing and storing it if needed."""
+        digest = spec_digest(spec)
+        future = self.inflight.get(digest)
+        if future is None:
+            future = self.inflight[digest] = asyncio.ensure_future(self._render(digest, spec))
+            future.add_done_callback(lambda _: self.inflight.pop(digest, None))
+        await asyncio.shield(future)
+        return digest
+
+    async def _render(self, digest: str, spec: Dict):
+        if await self.collection.find_one({"digest": digest}, {"_id": 1}):
+            self.stats["reused"] += 1
+            return
+        try:
+            variants = await asyncio.get_running_loop().run_in_executor(self._pool(), render_variants, spec)
+        except BrokenProcessPool:
+            # A worker died (out of memory, killed); start a fresh pool next time
+            self.stats["failures"] += 1
+            self.close()
+            raise
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        self.stats["rendered"] += 1
+        # Another worker may have stored the same digest meanwhile; its bytes are equivalent
+        await self.collection.update_one(
+            {"digest": digest},
+            {"$setOnInsert": {
+                "kind": spec["kind"],
+                "variants": {name: Binary(data) for name, data in variants.items()},
+                "stored_bytes": sum(len(data) for data in variants.values()),
+                "created_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        )
+
+    async def get(self, digest: str, variant: str) -> Optional[bytes]:
+        doc = await self.collection.find_one({"digest": digest}, {"_id": 0, f"variants.{variant}": 1})
+        data = doc.get("variants", {}).get(variant) if doc else None
+        if data is None:
+            return None
+        self.stats["served"] += 1
+        return bytes(data)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "inflight": len(self.inflight), "pool_started": self.pool is not None}
@@ -0,0 +1,1000 @@
+import requests
+import sys
+import json
+import time
+import argparse
+import random
+import string
+import statistics
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples (nearest-rank)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Summarize latency samples (seconds) as milliseconds."""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2),
+    }
+
+
+# Topic words for synthetic course text, so searches have something to discriminate on
+VOCABULARY = (
+    "algorithm array backpropagation calculus cell chemistry circuit climate compiler database derivative "
+    "economics electron energy enzyme evolution finance fraction gradient grammar gravity history integral "
+    "investment language lattice matrix molecule network neuron optimization photosynthesis physics poetry "
+    "probability protein quantum recursion regression renaissance statistics thermodynamics topology vector"
+).split()
+
+
+def synthetic_text(rng, chars):
+    words = []
+    length = 0
+    while length < chars:
+        word = rng.choice(VOCABULARY) if rng.random() < 0.3 else rng.choice(("the", "and", "of", "is", "we", "to"))
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:chars]
+
+
+def synthetic_course(index, sections=8, section_chars=1500):
+    """Build a stored-course document shaped like the generator's output"""
+    rng = random.Random(index)
+    section_ids = [str(uuid.uuid4()) for _ in range(sections)]
+    return {
+        "id": str(uuid.uuid4()),
+        "video_id": f"bench{index:06d}",
+        "title": f"Benchmark course {index}: {' and '.join(rng.sample(VOCABULARY, 2))}",
+        "description": "Synthetic course used for benchmarking. " * 4,
+        "thumbnail_url": f"https://img.youtube.com/vi/bench{index:06d}/maxresdefault.jpg",
+        "sections": [
+            {
+                "id": section_ids[order],
+                "title": f"Section {order + 1}: {rng.choice(VOCABULARY).capitalize()}",
+                "content": synthetic_text(rng, section_chars),
+                "timestamp": f"{order * 3:02d}:00",
+                "order": order + 1,
+            }
+            for order in range(sections)
+        ],
+        "visualizations": [
+            {
+                "id": str(uuid.uuid4()),
+                "title": "Concept Map",
+                "image_url": None,
+                "description": "A visual representation of the main concepts covered in this video.",
+                "related_section_id": "2",
+            }
+        ],
+        "created_at": datetime(2024, 1, 1) + timedelta(seconds=index),
+    }
+
+
+def seed_courses(mongo_url, db_name, count, batch_size=1000):
+    """Insert synthetic courses directly into the database the server uses"""
+    from pymongo import MongoClient
+
+    courses = MongoClient(mongo_url)[db_name].courses
+    existing = courses.count_documents({"video_id": {"$regex": "^bench"}})
+    for start in range(existing, count, batch_size):
+        courses.insert_many([synthetic_course(i) for i in range(start, min(count, start + batch_size))])
+    return courses.count_documents({})
+
+
+def load_server(**environ):
+    """Import the backend app in-process; environ overrides its .env settings."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "benchmark")
+    # load_dotenv() does not override variables that are already set
+    os.environ.update(environ)
+    import server
+    return server
+
+
+def bench_serialization(iterations=2000, sections=12, section_chars=3000):
+    """CPU cost per response of the validated path vs serving stored documents directly.
+
+    Runs in-process against the server's own models, without a database.
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from pydantic import TypeAdapter
+    server = load_server()
+
+    course = synthetic_course(0, sections=sections, section_chars=section_chars)
+    page = [synthetic_course(i, sections=sections, section_chars=section_chars) for i in range(20)]
+    course_adapter = TypeAdapter(server.Course)
+    page_adapter = TypeAdapter(list[server.Course])
+
+    def validated_course():
+        # Course(**doc) in the handler, then FastAPI validates and encodes the response_model
+        return JSONResponse(jsonable_encoder(course_adapter.validate_python(server.Course(**course)))).body
+
+    def validated_page():
+        return JSONResponse(jsonable_encoder(page_adapter.validate_python([server.Course(**c) for c in page]))).body
+
+    def timed(func):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return iterations / (time.perf_counter() - start)
+
+    results = {"benchmark": "serialization", "iterations": iterations, "sections": sections}
+    for name, before, after in (
+        ("get_course", validated_course, lambda: ORJSONResponse(course).body),
+        ("get_all_courses", validated_page, lambda: ORJSONResponse(page).body),
+    ):
+        print(f"\n🔍 Serializing {name} responses...")
+        before_rate, after_rate = timed(before), timed(after)
+        results[name] = {
+            "validated_per_sec": round(before_rate, 1),
+            "direct_per_sec": round(after_rate, 1),
+            "speedup": round(after_rate / before_rate, 2),
+        }
+    return results
+
+
+# Client libraries the server should only load when they are first used
+LAZY_MODULES = ("google.generativeai", "google.api_core", "youtube_transcript_api", "requests")
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import server
+elapsed = time.perf_counter() - start
+print(json.dumps({"import_s": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def bench_startup(runs=5, mongo_url="mongodb://localhost:27017", port=8765, timeout=60.0):
+    """Import time of the server module, and time from process launch to the first served request.
+
+    Each run starts a fresh interpreter, so nothing is cached in-process. The
+    first-request runs start uvicorn against the given Mongo, which startup
+    hooks (index reconciliation) need.
+    """
+    import subprocess
+
+    backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+    env = {**os.environ, "MONGO_URL": mongo_url, "DB_NAME": os.environ.get("DB_NAME", "benchmark")}
+
+    print(f"\n🔍 Importing server in {runs} fresh interpreters...")
+    imports, loaded = [], set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=backend_dir, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        imports.append(probe["import_s"])
+        loaded.update(probe["loaded"])
+
+    print(f"🔍 Timing launch to first request over {runs} uvicorn starts...")
+    first_requests = []
+    url = f"http://127.0.0.1:{port}/api/"
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+            cwd=backend_dir, env=env,
+        )
+        try:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if requests.get(url, timeout=1).status_code == 200:
+                        first_requests.append(time.perf_counter() - start)
+                        break
+                except requests.ConnectionError:
+                    pass
+                time.sleep(0.01)
+        finally:
+            process.terminate()
+            process.wait()
+
+    return {
+        "benchmark": "startup",
+        "runs": runs,
+        "import": summarize(imports),
+        "lazy_modules_loaded_at_import": sorted(loaded),
+        "time_to_first_request": summarize(first_requests),
+    }
+
+
+def bench_related(courses=100000, samples=200, k=6):
+    """Build the related-course index over a synthetic corpus and time top-k queries.
+
+    Runs in-process against the server's index, without a database.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    from recommendations import RelatedCourseIndex, term_counts
+
+    async def run():
+        index = RelatedCourseIndex()
+        print(f"\n🔍 Indexing {courses} synthetic courses...")
+        tokenize_s = add_s = 0.0
+        for i in range(courses):
+            course = synthetic_course(i, sections=8, section_chars=600)
+            start = time.perf_counter()
+            counts = term_counts(course)
+            tokenize_s += time.perf_counter() - start
+            start = time.perf_counter()
+            index.add(course["id"], counts)
+            if index.needs_compaction():
+                await index.compact()
+            add_s += time.perf_counter() - start
+        start = time.perf_counter()
+        await index.compact()
+        final_compaction_s = time.perf_counter() - start
+
+        print(f"🔍 Timing {samples} top-{k} queries...")
+        rng = random.Random(0)
+        latencies = []
+        for _ in range(samples):
+            course = synthetic_course(rng.randrange(courses), sections=8, section_chars=600)
+            counts = term_counts(course)
+            start = time.perf_counter()
+            index.related(counts, k, exclude=course["id"])
+            latencies.append(time.perf_counter() - start)
+        return {
+            "benchmark": "related",
+            "courses": courses,
+            "index": index.snapshot(),
+            "tokenize_s": round(tokenize_s, 2),
+            "add_and_compact_s": round(add_s, 2),
+            "final_compaction_s": round(final_compaction_s, 3),
+            "query_latency": summarize(latencies),
+        }
+
+    return asyncio.run(run())
+
+
+def bench_visualizations(renders=40, workers=2, sections=8):
+    """Render distinct synthetic visualizations through the renderer's process pool.
+
+    Reports per-render latency and how late a 5 ms event-loop ticker ran while
+    the pool was busy; the drawing should not show up in the loop lag.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    from mongomock_motor import AsyncMongoMockClient
+    from visualizations import VisualizationRenderer, visualization_spec
+
+    async def run():
+        renderer = VisualizationRenderer(AsyncMongoMockClient()["bench"]["visualizations"], max_workers=workers)
+        specs = []
+        for i in range(renders):
+            course = synthetic_course(i, sections=sections, section_chars=100)
+            title = "Concept Map" if i % 2 else "Learning timeline"
+            specs.append(visualization_spec({"title": title, "related_section_id": "2"}, course["sections"]))
+
+        # Start the pool outside the measurement
+        await renderer.render(specs[0])
+
+        lags = []
+        stop = asyncio.Event()
+
+        async def ticker():
+            while not stop.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - start - 0.005)
+
+        async def timed(spec):
+            start = time.perf_counter()
+            await renderer.render(spec)
+            return time.perf_counter() - start
+
+        ticking = asyncio.ensure_future(ticker())
+        print(f"\n🎨 Rendering {renders - 1} visualizations on {workers} worker process(es)...")
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(spec) for spec in specs[1:]))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticking
+        stored = await renderer.collection.find({}, {"_id": 0, "stored_bytes": 1}).to_list(None)
+        renderer.close()
+        return {
+            "benchmark": "visualizations",
+            "workers": workers,
+            "renders_per_sec": round((renders - 1) / elapsed, 2),
+            "render_latency": summarize(latencies),
+            "event_loop_lag": summarize(lags),
+            "mean_stored_bytes": round(statistics.mean(doc["stored_bytes"] for doc in stored)),
+            "renderer": renderer.snapshot(),
+        }
+
+    return asyncio.run(run())
+
+
+def stand_in_image_server(width=1280, height=720):
+    """Serve a generated JPEG at /vi/<id>/maxresdefault.jpg on a local port, like the thumbnail host.
+
+    Ids starting with "old" only have the 4:3 letterboxed hqdefault.jpg,
+    ids starting with "none" have no thumbnail at all, and ids starting with
+    "bad" get bytes that aren't an image. Returns the server and
+    its request counter; call shutdown() when done.
+    """
+    import io
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from PIL import Image, ImageDraw
+
+    def jpeg(size, letterbox=0):
+        image = Image.new("RGB", size, (20, 20, 20))
+        draw = ImageDraw.Draw(image)
+        for i in range(0, size[0], 40):
+            draw.rectangle((i, letterbox, i + 20, size[1] - letterbox), fill=(i % 255, 80, 200))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        return buffer.getvalue()
+
+    images = {"maxresdefault.jpg": jpeg((width, height)), "hqdefault.jpg": jpeg((480, 360), letterbox=45)}
+    requests_seen = {"count": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen["count"] += 1
+            _, _, video_id, name = self.path.split("/", 3)
+            if video_id.startswith("none") or (video_id.startswith("old") and name != "hqdefault.jpg"):
+                self.send_error(404)
+                return
+            body = b"<html>not an image</html>" if video_id.startswith("bad") else images.get(name)
+            if body is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests_seen, len(images["maxresdefault.jpg"])
+
+
+def bench_thumbnails(videos=50, samples=200, concurrency=20):
+    """Time the thumbnail proxy's cold fills, cache hits and revalidations against a local image server."""
+    import tempfile
+    import httpx
+
+    image_server, upstream, source_bytes = stand_in_image_server()
+    cache_dir = tempfile.mkdtemp(prefix="thumbnails-")
+    server = load_server(
+        THUMBNAIL_UPSTREAM_URL=f"http://127.0.0.1:{image_server.server_address[1]}/vi",
+        THUMBNAIL_CACHE_DIR=cache_dir,
+    )
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    async def run():
+        await server.open_thumbnail_cache()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench/api") as api:
+            async def timed(path, headers=None):
+                start = time.perf_counter()
+                response = await api.get(path, headers=headers)
+                return time.perf_counter() - start, response
+
+            print(f"\n🖼️  Cold fetches of {videos} thumbnails...")
+            cold = await asyncio.gather(*(timed(f"/thumbnails/bench{i:06d}/md.jpg") for i in range(videos)))
+
+            print(f"🖼️  {concurrency} concurrent first requests for one video...")
+            before = upstream["count"]
+            await asyncio.gather(*(api.get("/thumbnails/coalesce000/sm.webp") for _ in range(concurrency)))
+            coalesced_fetches = upstream["count"] - before
+
+            print(f"🖼️  {samples} warm requests and revalidations...")
+            rng = random.Random(0)
+            warm, revalidated = [], []
+            for _ in range(samples):
+                path = f"/thumbnails/bench{rng.randrange(videos):06d}/md.webp"
+                latency, response = await timed(path)
+                warm.append(latency)
+                latency, not_modified = await timed(path, {"If-None-Match": response.headers["ETag"]})
+                assert not_modified.status_code == 304, not_modified.status_code
+                revalidated.append(latency)
+
+            sizes = {}
+            for size in server.THUMBNAIL_WIDTHS:
+                for extension in server.THUMBNAIL_FORMATS:
+                    sizes[f"{size}.{extension}"] = len((await api.get(f"/thumbnails/bench000000/{size}.{extension}")).content)
+            fallback = await api.get("/thumbnails/old00000000/md.jpg")
+            missing = await api.get("/thumbnails/none0000000/md.jpg")
+            unreadable = [(await api.get("/thumbnails/bad00000000/md.jpg")).status_code for _ in range(2)]
+            await server.thumbnail_proxy.close()
+        return {
+            "benchmark": "thumbnails",
+            "source_bytes": source_bytes,
+            "variant_bytes": sizes,
+            "cold_latency": summarize([latency for latency, _ in cold]),
+            "cold_statuses": sorted({response.status_code for _, response in cold}),
+            "upstream_fetches_for_concurrent_first_requests": coalesced_fetches,
+            "warm_latency": summarize(warm),
+            "revalidation_latency": summarize(revalidated),
+            "fallback_status": fallback.status_code,
+            "missing_status": missing.status_code,
+            "unreadable_statuses": unreadable,
+            "proxy": server.thumbnail_proxy.snapshot(),
+        }
+
+    try:
+        return asyncio.run(run())
+    finally:
+        image_server.shutdown()
+
+
+class FakeBackend:
+    """Latency and failure injection shared by the fake upstreams"""
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+
+    def simulate(self, error):
+        # Runs on the server's I/O threads, like the real blocking clients
+        self.calls += 1
+        if self.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.error_rate:
+            self.errors += 1
+            raise error
+
+
+class FakeTranscriptApi(FakeBackend):
+    """Stand-in for YouTubeTranscriptApi producing transcripts of a fixed length
+
+    Each video's transcript is the same on every fetch until its entry in
+    revisions is bumped; every revision rewrites one caption.
+    """
+
+    def __init__(self, segments=600, latency=0.0, error_rate=0.0):
+        super().__init__(latency, error_rate)
+        self.segments = segments
+        self.revisions = {}
+
+    def get_transcript(self, video_id):
+        self.simulate(ConnectionError(f"injected transcript failure for {video_id}"))
+        words = "the lecturer explains how the model is trained and evaluated on new data".split()
+        rng = random.Random(video_id)
+        segments = [
+            {"text": " ".join(rng.choices(words, k=12)), "start": index * 5.0, "duration": 5.0}
+            for index in range(self.segments)
+        ]
+        for revision in range(self.revisions.get(video_id, 0)):
+            position = random.Random(f"{video_id}-{revision}").randrange(self.segments)
+            segments[position] = {**segments[position], "text": f"corrected caption number {revision}"}
+        return segments
+
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Stand-in for genai.GenerativeModel answering every window with a fixed-size course
+
+    A malformed_rate share of responses come back the way real ones sometimes
+    do: half cut off partway through, half with trailing commas and comments.
+    """
+
+    def __init__(self, backend, sections=4, section_chars=800, malformed_rate=0.0):
+        self.backend = backend
+        self.sections = sections
+        self.section_chars = section_chars
+        self.malformed_rate = malformed_rate
+
+    def generate_content(self, prompt, generation_config=None, request_options=None, stream=False):
+        from google.api_core import exceptions as google_exceptions
+
+        self.backend.simulate(google_exceptions.ServiceUnavailable("injected Gemini failure"))
+        # Distinct titles per prompt keep windows from being folded together
+        tag = uuid.uuid4().hex[:6]
+        text = json.dumps({
+            "sections": [
+                {
+                    "title": f"Topic {tag}-{order}",
+                    "content": ("generated course content " * (self.section_chars // 25 + 1))[:self.section_chars],
+                    "timestamp": f"{order:02d}:00",
+                    "order": order,
+                }
+                for order in range(1, self.sections + 1)
+            ],
+            "visualizations": [
+                {"title": "Concept Map", "description": "Main concepts", "related_section_id": "1"}
+            ],
+        })
+        if random.random() < self.malformed_rate:
+            if random.random() < 0.5:
+                text = text[:random.randint(len(text) // 4, len(text) - 2)]
+            else:
+                text = text.replace("}, {", "}, /* next */ {").replace("}]", "},]").replace(
+                    '"related_section_id": "1"', '"related_section_id": 1 // the first section\n')
+        if stream:
+            return iter([FakeGeminiResponse(text[i:i + 256]) for i in range(0, len(text), 256)])
+        return FakeGeminiResponse(text)
+
+
+def fake_youtube_data_api(latency=0.0):
+    """Handler for httpx.MockTransport answering videos.list like the YouTube Data API"""
+    import httpx
+
+    async def handler(request):
+        if latency:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+        items = [
+            {
+                "id": video_id,
+                "snippet": {
+                    "title": f"Benchmark video {video_id}",
+                    "description": "Synthetic video used for benchmarking. " * 4,
+                    "thumbnails": {"high": {"url": f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"}},
+                },
+                "contentDetails": {"duration": "PT50M"},
+            }
+            for video_id in request.url.params["id"].split(",")
+        ]
+        return httpx.Response(200, json={"items": items})
+
+    return handler
+
+
+def patch_mongomock():
+    """Work around mongomock's find_one_and_update when the projection drops _id.
+
+    It re-reads the updated document with the original filter, which misses
+    once the update changed a filtered field (as claiming a queued job does).
+    """
+    from mongomock.collection import Collection
+
+    find_and_modify = Collection._find_and_modify
+
+    def patched(self, query, projection=None, *args, **kwargs):
+        if isinstance(projection, dict) and projection.get("_id") == 0:
+            projection = {key: value for key, value in projection.items() if key != "_id"} or None
+            document = find_and_modify(self, query, projection, *args, **kwargs)
+            if document is not None:
+                document.pop("_id", None)
+            return document
+        return find_and_modify(self, query, projection, *args, **kwargs)
+
+    Collection._find_and_modify = patched
+
+
+async def run_load(worker, total, concurrency):
+    """Call worker(i) for i in range(total) with at most `concurrency` in flight.
+
+    Returns the results in completion order and the elapsed wall-clock time.
+    """
+    indexes = iter(range(total))
+    results = []
+
+    async def client():
+        for index in indexes:
+            results.append(await worker(index))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return results, time.perf_counter() - start
+
+
+def load_report(results, elapsed):
+    """Throughput, status counts and latency of (latency, status) results"""
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(results),
+        "requests_per_sec": round(len(results) / elapsed, 1) if elapsed else None,
+        "statuses": statuses,
+        "latency": summarize([latency for latency, _ in results]),
+    }
+
+
+async def bench_offline(args):
+    """Drive the in-process app against fake YouTube/Gemini backends and a local Mongo stand-in.
+
+    Nothing leaves the machine: transcripts and generations come from the fakes
+    (with injected latency and errors), and Mongo is mongomock unless
+    --mongo-url points at a real local server.
+    """
+    import httpx
+
+    random.seed(args.seed)
+    db_name = f"bench_{uuid.uuid4().hex[:8]}"
+    if args.mongo_url is None:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+
+        # Must be patched before the server creates its client at import time
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+        patch_mongomock()
+    server = load_server(
+        MONGO_URL=args.mongo_url or "mongodb://localhost:27017",
+        DB_NAME=db_name,
+        # The fakes are the only upstream; the quota would only measure itself
+        GEMINI_RPM="1000000",
+        GEMINI_TPM="1000000000",
+    )
+
+    # The in-process client would log every request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    transcripts = FakeTranscriptApi(args.transcript_segments, args.transcript_latency, args.error_rate)
+    gemini = FakeBackend(args.gemini_latency, args.error_rate)
+    model = FakeGenerativeModel(gemini, args.sections_per_window, malformed_rate=args.malformed_rate)
+    server.transcript_client = lambda: transcripts
+    server.gemini_model = lambda: model
+    server.has_gemini = True
+    server.youtube_metadata = server.YouTubeMetadataClient(
+        "bench-key", transport=httpx.MockTransport(fake_youtube_data_api(args.metadata_latency)))
+
+    await server.app.router.startup()
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench/api", timeout=None) as api:
+            async def convert(index):
+                start = time.perf_counter()
+                response = await api.post("/convert-youtube", json={
+                    "video_url": f"https://www.youtube.com/watch?v=bench{index:06d}",
+                    "regenerate": index in regenerating,
+                })
+                if response.status_code != 202:
+                    return time.perf_counter() - start, response.status_code
+                job_id = response.json()["id"]
+                while True:
+                    job = (await api.get(f"/jobs/{job_id}")).json()
+                    if job["status"] in ("stored", "failed"):
+                        return time.perf_counter() - start, job["status"]
+                    await asyncio.sleep(args.poll_interval)
+
+            async def timed_get(path, **params):
+                start = time.perf_counter()
+                response = await api.get(path, params=params)
+                return time.perf_counter() - start, response.status_code
+
+            regenerating = set()
+            print(f"\n🔍 Converting {args.videos} videos with {args.concurrency} clients...")
+            results, elapsed = await run_load(convert, args.videos, args.concurrency)
+            conversion_gemini_calls = gemini.calls
+
+            courses = (await api.get("/courses", params={"view": "summary", "limit": 100})).json()
+            course_ids = [course["id"] for course in courses]
+            if not course_ids:
+                raise RuntimeError("No course was stored; check the injected error rate")
+
+            print(f"🔍 Reading courses with {args.concurrency} clients ({args.requests} requests each)...")
+            list_results = await run_load(
+                lambda i: timed_get("/courses", limit=20), args.requests, args.concurrency)
+            get_results = await run_load(
+                lambda i: timed_get(f"/courses/{course_ids[i % len(course_ids)]}"), args.requests, args.concurrency)
+            
+            regeneration = None
+            if args.regenerate:
+                count = min(args.regenerate, args.videos)
+                regenerating.update(range(count))
+                for index in range(count):
+                    transcripts.revisions[f"bench{index:06d}"] = 1
+                calls_before = gemini.calls
+                print(f"🔍 Regenerating {count} courses after a one-caption transcript edit...")
+                regenerate_results = await run_load(convert, count, args.concurrency)
+                edited_calls = gemini.calls - calls_before
+                print(f"🔍 Regenerating {count} unchanged courses...")
+                calls_before = gemini.calls
+                unchanged_results = await run_load(convert, count, args.concurrency)
+                stats = (await api.get("/stats")).json()
+                regeneration = {
+                    "edited": load_report(*regenerate_results),
+                    "unchanged": load_report(*unchanged_results),
+                    "gemini_calls_per_conversion": round(conversion_gemini_calls / args.videos, 2),
+                    "gemini_calls_per_edited_regeneration": round(edited_calls / count, 2),
+                    "gemini_calls_per_unchanged_regeneration": round((gemini.calls - calls_before) / count, 2),
+                    "stats": {key: stats[key] for key in (
+                        "regenerations", "unchanged_regenerations", "reused_windows", "generated_windows",
+                    )},
+                }
+            llm_json = (await api.get("/stats")).json()["llm_json"]
+    finally:
+        await server.app.router.shutdown()
+
+    return {
+        "benchmark": "offline",
+        "config": {key: value for key, value in vars(args).items() if key not in ("scenario", "base_url")},
+        "convert_youtube": load_report(results, elapsed),
+        "list_courses": load_report(*list_results),
+        "get_course": load_report(*get_results),
+        "regeneration": regeneration,
+        "llm_json": llm_json,
+        "upstream_calls": {
+            "transcript": {"calls": transcripts.calls, "errors": transcripts.errors},
+            "gemini": {"calls": gemini.calls, "errors": gemini.errors},
+            "youtube_metadata": server.youtube_metadata.snapshot(),
+        },
+    }
+
+
+class CourseApiBenchmark:
+    def __init__(self, base_url="http://localhost:8001"):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api"
+        self.session = requests.Session()
+
+    def timed_get(self, endpoint, **kwargs):
+        """GET an endpoint and return (latency_seconds, response)"""
+        start = time.perf_counter()
+        response = self.session.get(f"{self.api_url}/{endpoint}", **kwargs)
+        return time.perf_counter() - start, response
+
+    def sample_latency(self, endpoint, samples, interval=0.01, **kwargs):
+        """Collect sequential latency samples for a GET endpoint"""
+        latencies = []
+        for _ in range(samples):
+            latency, response = self.timed_get(endpoint, **kwargs)
+            if response.status_code == 200:
+                latencies.append(latency)
+            time.sleep(interval)
+        return latencies
+
+    def bench_course_listing(self, samples, pages=50):
+        """Compare the full listing with the summary projection and deep keyset paging"""
+        results = {"benchmark": "course_listing"}
+        for name, params in (("full", {"view": "full", "limit": 20}),
+                             ("summary", {"view": "summary", "limit": 20})):
+            print(f"\n🔍 Sampling GET /api/courses ({name} view, {samples} requests)...")
+            latency, response = self.timed_get("courses", params=params)
+            results[name] = {
+                "payload_bytes": len(response.content),
+                "latency": summarize(self.sample_latency("courses", samples, params=params)),
+            }
+
+        # Walk pages with the cursor; latency should not grow with depth
+        print(f"🔍 Walking {pages} summary pages with the cursor...")
+        page_latencies = []
+        params = {"view": "summary", "limit": 20}
+        for _ in range(pages):
+            latency, response = self.timed_get("courses", params=params)
+            page_latencies.append(latency)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            params = {**params, "cursor": cursor}
+        results["cursor_pages"] = {
+            "first_page_ms": round(page_latencies[0] * 1000, 2),
+            "last_page_ms": round(page_latencies[-1] * 1000, 2),
+            "latency": summarize(page_latencies),
+        }
+        return results
+
+    def bench_read_throughput(self, duration=10.0, concurrency=8):
+        """Requests/sec of GET /api/courses/{id} and GET /api/courses against one server"""
+        _, response = self.timed_get("courses", params={"limit": 20})
+        course_ids = [course["id"] for course in response.json()]
+        if not course_ids:
+            raise RuntimeError("No stored courses to read; run course-listing first")
+
+        def hammer(endpoint_for):
+            session = requests.Session()
+            count, latencies = 0, []
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                session.get(f"{self.api_url}/{endpoint_for(count)}")
+                latencies.append(time.perf_counter() - start)
+                count += 1
+            return latencies
+
+        results = {"benchmark": "read_throughput", "concurrency": concurrency, "duration_s": duration}
+        for name, endpoint_for in (
+            ("get_course", lambda i: f"courses/{course_ids[i % len(course_ids)]}"),
+            ("get_all_courses", lambda i: "courses?limit=20"),
+        ):
+            print(f"\n🔍 Hammering {name} for {duration}s with {concurrency} clients...")
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                latencies = sum(pool.map(lambda _: hammer(endpoint_for), range(concurrency)), [])
+            results[name] = {
+                "requests_per_sec": round(len(latencies) / duration, 1),
+                "latency": summarize(latencies),
+            }
+        return results
+
+    def bench_search(self, samples, pages=5):
+        """Latency of GET /api/courses/search for common, rare, multi-term and phrase queries"""
+        queries = {
+            "single_term": "quantum",
+            "two_terms": "neuron gradient",
+            "phrase": '"matrix regression"',
+            "negated": "protein -enzyme",
+        }
+        results = {"benchmark": "search"}
+        for name, query in queries.items():
+            print(f"\n🔍 Sampling search for {query!r} ({samples} requests)...")
+            latency, response = self.timed_get("courses/search", params={"q": query})
+            results[name] = {
+                "query": query,
+                "hits_on_first_page": len(response.json().get("results", [])),
+                "latency": summarize(self.sample_latency("courses/search", samples, params={"q": query})),
+            }
+
+        # Deeper pages skip more ranked hits
+        print(f"🔍 Sampling search pages 1-{pages}...")
+        results["pages"] = {
+            page: summarize(self.sample_latency(
+                "courses/search", max(1, samples // pages), params={"q": "quantum", "page": page}))
+            for page in range(1, pages + 1)
+        }
+        return results
+
+    def convert(self, video_url, timeout=300):
+        """Submit a single conversion, wait for its job, and return (latency, final status)"""
+        start = time.perf_counter()
+        response = requests.post(f"{self.api_url}/convert-youtube", json={"video_url": video_url})
+        if response.status_code != 202:
+            return time.perf_counter() - start, str(response.status_code)
+        job_id = response.json()["id"]
+        while time.perf_counter() - start < timeout:
+            job = requests.get(f"{self.api_url}/jobs/{job_id}").json()
+            if job["status"] in ("stored", "failed"):
+                return time.perf_counter() - start, job["status"]
+            time.sleep(0.25)
+        return time.perf_counter() - start, "timeout"
+
+    def bench_courses_under_conversion_load(self, conversions, samples, video_ids=None):
+        """Measure GET /api/courses latency idle and while N conversions are in flight.
+
+        With the blocking transcript and Gemini calls moved off the event loop,
+        p99 of the listing should stay roughly flat between the two phases.
+        """
+        print(f"\n🔍 Sampling GET /api/courses idle ({samples} requests)...")
+        idle = self.sample_latency("courses", samples)
+
+        if not video_ids:
+            # Random ids miss the existing-course check and exercise the full pipeline
+            video_ids = ["".join(random.choices(string.ascii_letters + string.digits, k=11))
+                         for _ in range(conversions)]
+        urls = [f"https://www.youtube.com/watch?v={video_ids[i % len(video_ids)]}"
+                for i in range(conversions)]
+
+        print(f"🔍 Sampling GET /api/courses with {conversions} conversions in flight...")
+        with ThreadPoolExecutor(max_workers=conversions) as pool:
+            futures = [pool.submit(self.convert, url) for url in urls]
+            loaded = self.sample_latency("courses", samples)
+            conversion_results = [future.result() for future in futures]
+
+        return {
+            "benchmark": "courses_under_conversion_load",
+            "conversions": conversions,
+            "idle": summarize(idle),
+            "under_load": summarize(loaded),
+            "conversion_latency": summarize([latency for latency, _ in conversion_results]),
+            "conversion_statuses": sorted({status for _, status in conversion_results}),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="YouTube Course Generator API benchmarks")
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--samples", type=int, default=200,
+                        help="number of latency samples per phase")
+    scenarios = parser.add_subparsers(dest="scenario", required=True)
+
+    load = scenarios.add_parser("conversion-load", help="GET /api/courses latency while conversions run")
+    load.add_argument("--conversions", type=int, default=8,
+                      help="number of conversions kept in flight")
+    load.add_argument("--video-ids", nargs="*", default=None,
+                      help="video ids to convert (defaults to random ids)")
+
+    listing = scenarios.add_parser("course-listing", help="payload size and latency of course listings")
+    listing.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    listing.add_argument("--db-name", default="test_database")
+    listing.add_argument("--courses", type=int, default=100000,
+                         help="number of stored courses to seed before measuring")
+    search = scenarios.add_parser("search", help="query latency of course search over a seeded corpus")
+    search.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    search.add_argument("--db-name", default="test_database")
+    search.add_argument("--courses", type=int, default=100000,
+                        help="number of stored courses to seed before measuring")
+    throughput = scenarios.add_parser("read-throughput", help="requests/sec of the course read endpoints")
+    throughput.add_argument("--duration", type=float, default=10.0)
+    throughput.add_argument("--concurrency", type=int, default=8)
+
+    serialization = scenarios.add_parser("serialization", help="in-process response serialization cost")
+    serialization.add_argument("--iterations", type=int, default=2000)
+
+    startup = scenarios.add_parser("startup", help="server import time and time to first request")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    startup.add_argument("--port", type=int, default=8765)
+
+    related = scenarios.add_parser("related", help="in-process related-course index build and query time")
+    related.add_argument("--courses", type=int, default=100000)
+
+    visualizations = scenarios.add_parser("visualizations", help="process-pool visualization rendering")
+    visualizations.add_argument("--renders", type=int, default=40)
+    visualizations.add_argument("--workers", type=int, default=2)
+
+    thumbnails = scenarios.add_parser("thumbnails", help="thumbnail proxy against a local stand-in image server")
+    thumbnails.add_argument("--videos", type=int, default=50)
+
+    offline = scenarios.add_parser("offline", help="in-process load test against fake upstreams")
+    offline.add_argument("--videos", type=int, default=50, help="number of conversions to run")
+    offline.add_argument("--requests", type=int, default=2000, help="requests per read endpoint")
+    offline.add_argument("--concurrency", type=int, default=16)
+    offline.add_argument("--transcript-segments", type=int, default=600,
+                         help="5-second segments per fake transcript")
+    offline.add_argument("--transcript-latency", type=float, default=0.2, help="seconds per transcript fetch")
+    offline.add_argument("--gemini-latency", type=float, default=1.0, help="seconds per Gemini call")
+    offline.add_argument("--sections-per-window", type=int, default=4)
+    offline.add_argument("--metadata-latency", type=float, default=0.05,
+                         help="seconds per YouTube Data API call")
+    offline.add_argument("--error-rate", type=float, default=0.0,
+                         help="probability that a fake upstream call fails")
+    offline.add_argument("--mongo-url", default=None,
+                         help="local Mongo to use instead of the in-memory stand-in")
+    offline.add_argument("--malformed-rate", type=float, default=0.0,
+                         help="share of Gemini responses cut off or written with trailing commas and comments")
+    offline.add_argument("--regenerate", type=int, default=0,
+                         help="courses to regenerate after an edit to their transcripts")
+    offline.add_argument("--poll-interval", type=float, default=0.05)
+    offline.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    bench = CourseApiBenchmark(args.base_url)
+
+    print("=" * 50)
+    print("YouTube Course Generator API Benchmark")
+    print("=" * 50)
+
+    if args.scenario == "conversion-load":
+        result = bench.bench_courses_under_conversion_load(args.conversions, args.samples, args.video_ids)
+    elif args.scenario == "read-throughput":
+        result = bench.bench_read_throughput(args.duration, args.concurrency)
+    elif args.scenario == "serialization":
+        result = bench_serialization(args.iterations)
+    elif args.scenario == "search":
+        print(f"Seeding up to {args.courses} courses...")
+        stored = seed_courses(args.mongo_url, args.db_name, args.courses)
+        result = bench.bench_search(args.samples)
+        result["stored_courses"] = stored
+    elif args.scenario == "startup":
+        result = bench_startup(args.runs, args.mongo_url, args.port)
+    elif args.scenario == "related":
+        result = bench_related(args.courses, args.samples)
+    elif args.scenario == "visualizations":
+        result = bench_visualizations(args.renders, args.workers)
+    elif args.scenario == "thumbnails":
+        result = bench_thumbnails(args.videos, args.samples)
+    elif args.scenario == "offline":
+        result = asyncio.run(bench_offline(args))
+    else:
+        print(f"Seeding up to {args.courses} courses...")
+        stored = seed_courses(args.mongo_url, args.db_name, args.courses)
+        result = bench.bench_course_listing(args.samples)
+        result["stored_courses"] = stored
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,10 @@
 import requests
 import sys
 import json
+import uuid
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 class YouTubeCourseGeneratorTester:
     def __init__(self, base_url="https://81a81887-9ef8-490f-b5ed-b91803d55c4f.preview.emergentagent.com"):
@@ -57,15 +60,84 @@ class YouTubeCourseGeneratorTester:
             200
         )
 
+    def wait_for_job(self, job_id, timeout=180, interval=1.0):
+        """Poll a conversion job until it is stored or failed"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = requests.get(f"{self.api_url}/jobs/{job_id}").json()
+            if job["status"] in ("stored", "failed"):
+                return job
+            time.sleep(interval)
+        return None
+
     def test_convert_youtube(self, video_url):
         """Test converting a YouTube URL to a course"""
-        return self.run_test(
-            "Convert YouTube URL",
-            "POST",
-            "convert-youtube",
-            200,
-            data={"video_url": video_url}
-        )
+        self.tests_run += 1
+        print(f"\n🔍 Testing Convert YouTube URL...")
+
+        try:
+            response = requests.post(f"{self.api_url}/convert-youtube", json={"video_url": video_url})
+            if response.status_code == 200:
+                # Already converted earlier
+                self.tests_passed += 1
+                print(f"✅ Passed - Status: 200 (existing course)")
+                return True, response.json()
+            if response.status_code != 202:
+                print(f"❌ Failed - Expected 200 or 202, got {response.status_code}")
+                return False, None
+
+            job = response.json()
+            print(f"Queued job {job['id']}, polling...")
+            job = self.wait_for_job(job["id"])
+            if not job or job["status"] != "stored":
+                print(f"❌ Failed - Job did not complete: {job}")
+                return False, None
+            if "total" not in (job.get("timings") or {}):
+                print(f"❌ Failed - Job has no stage timings: {job.get('timings')}")
+                return False, None
+
+            course = requests.get(f"{self.api_url}/courses/{job['course_id']}").json()
+            self.tests_passed += 1
+            stages = ", ".join(f"{name} {timing['ms']:.0f}ms" for name, timing in job["timings"].items())
+            print(f"✅ Passed - Job stored course {job['course_id']} ({stages})")
+            return True, course
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False, None
+
+    def test_regenerate_course(self, video_url, course):
+        """Regenerate an existing course and check it keeps its id and never goes back a version"""
+        self.tests_run += 1
+        print(f"\n🔍 Testing Regenerate Course...")
+
+        try:
+            response = requests.post(f"{self.api_url}/convert-youtube",
+                                     json={"video_url": video_url, "regenerate": True})
+            if response.status_code != 202:
+                print(f"❌ Failed - Expected 202, got {response.status_code}")
+                return False
+            job = self.wait_for_job(response.json()["id"])
+            if not job or job["status"] != "stored" or job["course_id"] != course["id"]:
+                print(f"❌ Failed - Job did not update course {course['id']}: {job}")
+                return False
+
+            response = requests.get(f"{self.api_url}/courses/{course['id']}")
+            regenerated = response.json()
+            if regenerated.get("version", 1) < course.get("version", 1):
+                print(f"❌ Failed - version went from {course.get('version')} to {regenerated.get('version')}")
+                return False
+            if f"-v{regenerated.get('version', 1)}" not in response.headers.get("ETag", ""):
+                print(f"❌ Failed - ETag {response.headers.get('ETag')} does not carry the version")
+                return False
+
+            kept = {section["id"] for section in course["sections"]} & {section["id"] for section in regenerated["sections"]}
+            self.tests_passed += 1
+            print(f"✅ Passed - version {regenerated.get('version', 1)}, "
+                  f"{len(kept)}/{len(regenerated['sections'])} section ids kept")
+            return True
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
 
     def test_get_all_courses(self):
         """Test retrieving all courses"""
@@ -85,6 +157,59 @@ class YouTubeCourseGeneratorTester:
             200
         )
 
+    def test_visualization_images(self, course):
+        """Fetch a course's rendered visualizations and check they are cached for good"""
+        urls = [vis["image_url"] for vis in course.get("visualizations", []) if vis.get("image_url")]
+        self.tests_run += 1
+        print("\n🔍 Testing Visualization Images...")
+        if not urls:
+            print("❌ Failed - no visualization has an image_url")
+            return False
+
+        for url in urls:
+            response = requests.get(f"{self.base_url}{url}")
+            if response.status_code != 200 or response.headers.get("Content-Type") != "image/png":
+                print(f"❌ Failed - {url}: {response.status_code} {response.headers.get('Content-Type')}")
+                return False
+            if "immutable" not in response.headers.get("Cache-Control", ""):
+                print(f"❌ Failed - {url} is not cacheable for good: {response.headers.get('Cache-Control')}")
+                return False
+            revalidated = requests.get(f"{self.base_url}{url}", headers={"If-None-Match": response.headers["ETag"]})
+            if revalidated.status_code != 304:
+                print(f"❌ Failed - revalidating {url} returned {revalidated.status_code}, expected 304")
+                return False
+            smaller = requests.get(f"{self.base_url}{url.replace('/md.png', '/sm.png')}")
+            if smaller.status_code != 200 or len(smaller.content) >= len(response.content):
+                print(f"❌ Failed - small variant of {url} missing or not smaller")
+                return False
+
+        self.tests_passed += 1
+        print(f"✅ Passed - {len(urls)} visualization image(s) served with long-lived caching")
+        return True
+
+    def test_thumbnail_proxy(self, video_id):
+        """Fetch a resized thumbnail in both formats and revalidate it"""
+        self.tests_run += 1
+        print("\n🔍 Testing Thumbnail Proxy...")
+        url = f"{self.api_url}/thumbnails/{video_id}"
+        jpeg = requests.get(f"{url}/sm.jpg")
+        webp = requests.get(f"{url}/sm.webp")
+        if jpeg.status_code != 200 or webp.headers.get("Content-Type") != "image/webp":
+            print(f"❌ Failed - jpg: {jpeg.status_code}, webp: {webp.status_code} {webp.headers.get('Content-Type')}")
+            return False
+        for headers in ({"If-None-Match": jpeg.headers["ETag"]}, {"If-Modified-Since": jpeg.headers["Last-Modified"]}):
+            revalidated = requests.get(f"{url}/sm.jpg", headers=headers)
+            if revalidated.status_code != 304:
+                print(f"❌ Failed - revalidating with {list(headers)[0]} returned {revalidated.status_code}")
+                return False
+        if requests.get(f"{url}/huge.jpg").status_code != 404:
+            print("❌ Failed - unknown thumbnail size was not rejected")
+            return False
+
+        self.tests_passed += 1
+        print(f"✅ Passed - sm.jpg {len(jpeg.content)} bytes, sm.webp {len(webp.content)} bytes, revalidation works")
+        return True
+
     def test_invalid_youtube_url(self):
         """Test with an invalid YouTube URL"""
         return self.run_test(
@@ -95,6 +220,145 @@ class YouTubeCourseGeneratorTester:
             data={"video_url": "https://example.com/not-a-youtube-url"}
         )
 
+    def test_status_check_summary(self, pings=5):
+        """Post status checks for a new client and expect them counted in the summary"""
+        client_name = f"tester-{uuid.uuid4().hex[:8]}"
+        for _ in range(pings):
+            success, _ = self.run_test("Create Status Check", "POST", "status", 200, data={"client_name": client_name})
+            if not success:
+                return False
+
+        success, summary = self.run_test("Status Check Summary", "GET", "status?window_seconds=600", 200)
+        if not success:
+            return False
+        client = next((entry for entry in summary if entry["client_name"] == client_name), None)
+        if client is None or client["count"] != pings or client["last_seen"] < client["first_seen"]:
+            self.tests_passed -= 1
+            print(f"❌ Failed - expected {pings} pings for {client_name}, got {client}")
+            return False
+        print(f"✅ {client_name} seen {client['count']} times, last at {client['last_seen']}")
+        return True
+
+    def test_concurrent_conversion_dedup(self, concurrency=50):
+        """Fire concurrent conversions of one new video and expect a single pipeline run"""
+        self.tests_run += 1
+        print(f"\n🔍 Testing Concurrent Conversion Dedup ({concurrency} requests)...")
+
+        # A video id that has never been converted, so every request misses the lookup
+        video_id = uuid.uuid4().hex[:11]
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+
+        try:
+            stats_before = requests.get(f"{self.api_url}/stats").json()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                responses = list(pool.map(
+                    lambda _: requests.post(f"{self.api_url}/convert-youtube", json={"video_url": video_url}),
+                    range(concurrency)
+                ))
+            statuses = {response.status_code for response in responses}
+            job_ids = {response.json()["id"] for response in responses if response.status_code == 202}
+            # Requests that arrive after the job finished get the stored course directly
+            course_ids = {response.json()["id"] for response in responses if response.status_code == 200}
+            jobs = [self.wait_for_job(job_id) for job_id in job_ids]
+            course_ids |= {job["course_id"] for job in jobs if job and job["status"] == "stored"}
+            stats_after = requests.get(f"{self.api_url}/stats").json()
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
+        pipeline_runs = stats_after["pipeline_runs"] - stats_before["pipeline_runs"]
+
+        if statuses <= {200, 202} and len(job_ids) <= 1 and len(course_ids) == 1 and pipeline_runs == 1:
+            self.tests_passed += 1
+            print(f"✅ Passed - {concurrency} requests shared course {course_ids.pop()}")
+            return True
+        print(f"❌ Failed - statuses={sorted(statuses)}, jobs={len(job_ids)}, distinct courses={len(course_ids)}, pipeline runs={pipeline_runs}")
+        return False
+
+    def test_job_backlog_rejects_flood(self, submissions=150, concurrency=50):
+        """Flood submissions of distinct new videos and expect 429s once the job backlog is full"""
+        self.tests_run += 1
+        print(f"\n🔍 Testing Job Backlog Rejection ({submissions} submissions)...")
+
+        def submit(_):
+            video_url = f"https://www.youtube.com/watch?v={uuid.uuid4().hex[:11]}"
+            return requests.post(f"{self.api_url}/convert-youtube", json={"video_url": video_url})
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                responses = list(pool.map(submit, range(submissions)))
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
+        statuses = [response.status_code for response in responses]
+        rejected = [response for response in responses if response.status_code == 429]
+        # Let the accepted jobs drain so they don't load whatever runs next against this server
+        queued = [response.json()["id"] for response in responses if response.status_code == 202]
+        print(f"Waiting for {len(queued)} queued jobs to finish...")
+        unfinished = [job_id for job_id in queued if self.wait_for_job(job_id) is None]
+        if unfinished:
+            print(f"⚠️ {len(unfinished)} flooded jobs still running")
+        if set(statuses) <= {202, 429} and rejected and all(r.headers.get("Retry-After") for r in rejected):
+            self.tests_passed += 1
+            print(f"✅ Passed - {len(queued)} queued, {len(rejected)} rejected "
+                  f"(Retry-After {rejected[0].headers['Retry-After']}s)")
+            return True
+        print(f"❌ Failed - statuses {sorted(set(statuses))}, {len(rejected)} rejected with 429")
+        return False
+
+    def test_search_courses(self, query="introduction"):
+        """Search stored courses and check hits are ranked, with well-formed highlights"""
+        success, result = self.run_test(
+            "Search Courses",
+            "GET",
+            f"courses/search?q={query}",
+            200
+        )
+        if not success:
+            return False
+
+        hits = result["results"]
+        scores = [hit["score"] for hit in hits]
+        # A hit matching only on title or description has no section to highlight
+        malformed = [hit["id"] for hit in hits if hit["highlight"] and "snippet" not in hit["highlight"]]
+        if scores != sorted(scores, reverse=True) or any(score <= 0 for score in scores) or malformed:
+            self.tests_passed -= 1
+            print(f"❌ Failed - scores not ranked ({scores}) or malformed highlights: {malformed}")
+            return False
+        if hits:
+            best = hits[0]["highlight"]
+            where = f" @ {best['timestamp']} ({best['title']})" if best else " (title or description match)"
+            print(f"Top hit: {hits[0]['title']}{where}")
+        print(f"✅ {len(hits)} ranked hits for {query!r}")
+        return True
+
+    def test_hot_queries_use_indexes(self):
+        """Explain the hot queries server-side and fail on any collection scan"""
+        success, result = self.run_test(
+            "Hot Queries Use Indexes",
+            "GET",
+            "indexes?explain=true",
+            200
+        )
+        if not success:
+            return False
+
+        failed_indexes = {
+            f"{collection}.{name}": status
+            for collection, statuses in result["indexes"].items()
+            for name, status in statuses.items()
+            if status.startswith(("failed", "conflict", "degraded"))
+        }
+        collscans = [name for name, plan in result["plans"].items() if plan["collscan"]]
+        if failed_indexes or collscans:
+            # run_test counted it as passed on the status code alone
+            self.tests_passed -= 1
+            print(f"❌ Failed - index failures or conflicts: {failed_indexes}, COLLSCAN queries: {collscans}")
+            return False
+        print(f"✅ All {len(result['plans'])} hot queries use an index")
+        return True
+
 def main():
     # Setup
     tester = YouTubeCourseGeneratorTester()
@@ -123,6 +387,15 @@ def main():
         # Test getting the specific course
         tester.test_get_course_by_id(course_id)
         
+        # Test the rendered visualization images
+        tester.test_visualization_images(course_data)
+        
+        # Test the resized thumbnail proxy
+        tester.test_thumbnail_proxy(course_data['video_id'])
+        
+        # Test regenerating the course in place
+        tester.test_regenerate_course(test_video_url, course_data)
+        
         # Test getting all courses again (should include the new one)
         success, courses_after = tester.test_get_all_courses()
         if success and courses_after:
@@ -132,9 +405,25 @@ def main():
             else:
                 print(f"⚠️ Course count did not increase as expected")
     
+    # Test that the request-path queries are served by indexes
+    tester.test_hot_queries_use_indexes()
+    
+    # Test full-text search over the stored courses
+    tester.test_search_courses()
+    
     # Test with an invalid YouTube URL
     tester.test_invalid_youtube_url()
     
+    # Test batched status checks and their per-client summary
+    tester.test_status_check_summary()
+    
+    # Test that concurrent submissions of the same video are coalesced
+    tester.test_concurrent_conversion_dedup()
+    
+    # Test that a flood of new submissions is turned away once the job backlog is full.
+    # Runs last: it fills the backlog that the tests above need free.
+    tester.test_job_backlog_rejects_flood()
+    
     # Print results
     print("\n" + "=" * 50)
     print(f"📊 Tests passed: {tester.tests_passed}/{tester.tests_run}")
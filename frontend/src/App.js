@@ -6,18 +6,89 @@ import axios from "axios";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Video thumbnails go through the backend proxy, resized for the cards, with WebP where supported
+const THUMBNAIL_WIDTHS = { sm: 320, md: 480, lg: 640 };
+
+const thumbnailSrcSet = (videoId, extension) =>
+  Object.entries(THUMBNAIL_WIDTHS)
+    .map(([size, width]) => `${API}/thumbnails/${videoId}/${size}.${extension} ${width}w`)
+    .join(", ");
+
+const Thumbnail = ({ course, className, sizes = "(min-width: 768px) 33vw, 100vw" }) => (
+  <picture>
+    <source type="image/webp" srcSet={thumbnailSrcSet(course.video_id, "webp")} sizes={sizes} />
+    <img
+      src={`${API}/thumbnails/${course.video_id}/md.jpg`}
+      srcSet={thumbnailSrcSet(course.video_id, "jpg")}
+      sizes={sizes}
+      alt={course.title}
+      loading="lazy"
+      className={className}
+    />
+  </picture>
+);
+
+// Rendered visualizations are served by the backend in several widths
+const VISUALIZATION_WIDTHS = { sm: 400, md: 800, lg: 1600 };
+const VISUALIZATION_PATH = /^(\/api\/visualizations\/[^/]+\/)\w+\.png$/;
+
+const visualizationSrc = (imageUrl) =>
+  imageUrl.startsWith("/") ? `${BACKEND_URL}${imageUrl}` : imageUrl;
+
+const visualizationSrcSet = (imageUrl) => {
+  const match = imageUrl.match(VISUALIZATION_PATH);
+  if (!match) return undefined;
+  return Object.entries(VISUALIZATION_WIDTHS)
+    .map(([variant, width]) => `${BACKEND_URL}${match[1]}${variant}.png ${width}w`)
+    .join(", ");
+};
+
+// Same pattern the backend uses to pull the video id out of a URL
+const YOUTUBE_URL = /^(https?:\/\/)?(www\.)?(youtube|youtu|youtube-nocookie|learnfromvideo)\.(com|be)\/(watch\?v=|embed\/|v\/|.+\?v=)?([^&=%?]{11})/;
+
+// Convert a video over Server-Sent Events, reporting sections as they are generated.
+// Refused requests arrive as an "error" event carrying the HTTP status and, when
+// the conversion queue is full, retry_after in seconds.
+const streamCourse = (videoUrl, onSection) => new Promise((resolve, reject) => {
+  const params = new URLSearchParams({ video_url: videoUrl });
+  const source = new EventSource(`${API}/convert-youtube/stream?${params}`);
+  let finished = false;
+
+  source.addEventListener("section", (event) => onSection(JSON.parse(event.data)));
+  source.addEventListener("course", (event) => {
+    finished = true;
+    source.close();
+    resolve(JSON.parse(event.data));
+  });
+  source.addEventListener("error", (event) => {
+    if (finished) return;
+    finished = true;
+    source.close();
+    // Server-sent "error" events carry a detail; connection errors don't
+    const payload = event.data ? JSON.parse(event.data) : {};
+    const error = new Error(payload.detail || "Lost connection while generating the course");
+    error.status = payload.status;
+    error.retryAfter = payload.retry_after;
+    reject(error);
+  });
+});
+
 const Home = () => {
   const [inputUrl, setInputUrl] = useState("");
   const [loading, setLoading] = useState(false);
+  const [streamedSections, setStreamedSections] = useState([]);
   const [error, setError] = useState(null);
   const [course, setCourse] = useState(null);
   const [recentCourses, setRecentCourses] = useState([]);
+  const [relatedCourses, setRelatedCourses] = useState([]);
 
   // Fetch recent courses on load
   useEffect(() => {
     const fetchRecentCourses = async () => {
       try {
-        const response = await axios.get(`${API}/courses`);
+        const response = await axios.get(`${API}/courses`, {
+          params: { view: "summary", limit: 6 }
+        });
         setRecentCourses(response.data);
       } catch (err) {
         console.error("Error fetching recent courses:", err);
@@ -27,6 +98,26 @@ const Home = () => {
     fetchRecentCourses();
   }, []);
 
+  // Fetch courses related to the one being shown
+  useEffect(() => {
+    setRelatedCourses([]);
+    if (!course) {
+      return;
+    }
+    const fetchRelatedCourses = async () => {
+      try {
+        const response = await axios.get(`${API}/courses/${course.id}/related`, {
+          params: { limit: 3 }
+        });
+        setRelatedCourses(response.data);
+      } catch (err) {
+        console.error("Error fetching related courses:", err);
+      }
+    };
+
+    fetchRelatedCourses();
+  }, [course?.id]);
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -36,34 +127,51 @@ const Home = () => {
       return;
     }
     
-    // Simple URL validation
-    if (!inputUrl.includes('youtube.com/watch') && !inputUrl.includes('youtu.be') && !inputUrl.includes('learnfromvideo.com/watch')) {
+    // Same check as the backend, so a URL it would refuse never opens a stream
+    if (!YOUTUBE_URL.test(inputUrl)) {
       setError("Please enter a valid YouTube or LearnFromVideo URL");
       return;
     }
     
     setLoading(true);
     setError(null);
+    setCourse(null);
+    setStreamedSections([]);
     
     try {
-      const response = await axios.post(`${API}/convert-youtube`, {
-        video_url: inputUrl
+      // Sections show up while the rest of the course is still being generated
+      const newCourse = await streamCourse(inputUrl, (section) => {
+        setStreamedSections(prevSections => [...prevSections, section]);
       });
       
-      setCourse(response.data);
+      setCourse(newCourse);
       setLoading(false);
+      setStreamedSections([]);
       
       // Add to recent courses if not already there
-      if (!recentCourses.find(c => c.id === response.data.id)) {
-        setRecentCourses(prevCourses => [response.data, ...prevCourses.slice(0, 4)]);
+      if (!recentCourses.find(c => c.id === newCourse.id)) {
+        setRecentCourses(prevCourses => [newCourse, ...prevCourses.slice(0, 4)]);
       }
     } catch (err) {
       setLoading(false);
-      setError(err.response?.data?.detail || "An error occurred while processing the video");
+      setStreamedSections([]);
+      setError(err.retryAfter
+        ? `The converter is busy right now. Please try again in ${err.retryAfter} seconds.`
+        : err.message || "An error occurred while processing the video");
       console.error("Error:", err);
     }
   };
 
+  // Recent course cards only carry summary fields; load the full course on click
+  const openCourse = async (courseId) => {
+    try {
+      const response = await axios.get(`${API}/courses/${courseId}`);
+      setCourse(response.data);
+    } catch (err) {
+      setError(err.response?.data?.detail || "Could not load the course");
+    }
+  };
+
   const handleExampleUrl = () => {
     setInputUrl("https://www.youtube.com/watch?v=dQw4w9WgXcQ");
   };
@@ -147,6 +255,21 @@ const Home = () => {
           </div>
         </section>
 
+        {/* Sections streamed in while the course is generated */}
+        {loading && streamedSections.length > 0 && (
+          <section className="mb-16 bg-white/10 backdrop-blur-sm rounded-xl p-6">
+            <h3 className="text-xl font-semibold mb-4">Generating course content...</h3>
+            <div className="space-y-4">
+              {streamedSections.map(section => (
+                <div key={section.order} className="p-4 bg-indigo-800/30 rounded-lg">
+                  <h4 className="font-bold text-lg">{section.title}</h4>
+                  <p className="text-indigo-200">{section.content}</p>
+                </div>
+              ))}
+            </div>
+          </section>
+        )}
+
         {/* Course Display Section */}
         {course && (
           <section className="mb-16 bg-white/10 backdrop-blur-sm rounded-xl p-6">
@@ -163,11 +286,7 @@ const Home = () => {
               </div>
               <div className="flex flex-col md:flex-row gap-6">
                 <div className="w-full md:w-1/3">
-                  <img 
-                    src={course.thumbnail_url} 
-                    alt={course.title} 
-                    className="w-full h-auto rounded-lg"
-                  />
+                  <Thumbnail course={course} className="w-full h-auto rounded-lg" />
                   <div className="mt-4 p-4 bg-indigo-800/30 rounded-lg">
                     <h3 className="font-semibold mb-2">Course Overview</h3>
                     <p className="text-indigo-200 text-sm">{course.description}</p>
@@ -196,7 +315,14 @@ const Home = () => {
                     <div key={vis.id} className="p-4 bg-indigo-800/30 rounded-lg">
                       <h4 className="font-bold text-lg mb-2">{vis.title}</h4>
                       {vis.image_url ? (
-                        <img src={vis.image_url} alt={vis.title} className="w-full h-auto rounded mb-2" />
+                        <img
+                          src={visualizationSrc(vis.image_url)}
+                          srcSet={visualizationSrcSet(vis.image_url)}
+                          sizes="(min-width: 768px) 50vw, 100vw"
+                          alt={vis.title}
+                          loading="lazy"
+                          className="w-full h-auto rounded mb-2"
+                        />
                       ) : (
                         <div className="bg-indigo-700/50 p-4 rounded mb-2 flex items-center justify-center h-40">
                           <span className="text-indigo-300">Visualization will appear here</span>
@@ -211,6 +337,28 @@ const Home = () => {
           </section>
         )}
 
+        {/* Related Courses Section */}
+        {course && relatedCourses.length > 0 && (
+          <section className="mb-16">
+            <h2 className="text-2xl font-bold mb-6">Related Courses</h2>
+            <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
+              {relatedCourses.map(relatedCourse => (
+                <div 
+                  key={relatedCourse.id} 
+                  className="bg-white/10 backdrop-blur-sm rounded-lg overflow-hidden hover:bg-white/15 transition-all"
+                  onClick={() => openCourse(relatedCourse.id)}
+                >
+                  <Thumbnail course={relatedCourse} className="w-full h-48 object-cover" />
+                  <div className="p-4">
+                    <h3 className="font-bold text-lg mb-2 line-clamp-1">{relatedCourse.title}</h3>
+                    <p className="text-indigo-200 text-sm line-clamp-2">{relatedCourse.description}</p>
+                  </div>
+                </div>
+              ))}
+            </div>
+          </section>
+        )}
+
         {/* Recent Courses Section */}
         {recentCourses.length > 0 && !course && (
           <section>
@@ -220,13 +368,9 @@ const Home = () => {
                 <div 
                   key={recentCourse.id} 
                   className="bg-white/10 backdrop-blur-sm rounded-lg overflow-hidden hover:bg-white/15 transition-all"
-                  onClick={() => setCourse(recentCourse)}
+                  onClick={() => openCourse(recentCourse.id)}
                 >
-                  <img 
-                    src={recentCourse.thumbnail_url} 
-                    alt={recentCourse.title} 
-                    className="w-full h-48 object-cover"
-                  />
+                  <Thumbnail course={recentCourse} className="w-full h-48 object-cover" />
                   <div className="p-4">
                     <h3 className="font-bold text-lg mb-2 line-clamp-1">{recentCourse.title}</h3>
                     <p className="text-indigo-200 text-sm line-clamp-2 mb-3">{recentCourse.description}</p>
@@ -0,0 +1,156 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from external_integrations import gemini
+from external_integrations.gemini import CircuitBreaker, CircuitOpenError, GeminiGuard, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(gemini, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_token_bucket_waits_for_refill(clock, monkeypatch):
+    slept = []
+
+    async def sleep(delay):
+        slept.append(delay)
+        clock.now += delay
+
+    monkeypatch.setattr(gemini.asyncio, "sleep", sleep)
+    bucket = TokenBucket(rate_per_minute=60)
+
+    async def scenario():
+        # A full minute's worth is available at once, then one unit per second
+        assert await bucket.acquire(60) == 0
+        assert await bucket.acquire(2) == pytest.approx(2.0)
+        clock.now += 0.5
+        return await bucket.acquire(1)
+
+    assert asyncio.run(scenario()) == pytest.approx(0.5)
+    assert sum(slept) == pytest.approx(2.5)
+
+
+def test_token_bucket_caps_oversized_requests(clock):
+    bucket = TokenBucket(rate_per_minute=10)
+    # More than the bucket can ever hold is charged as a full bucket instead of waiting forever
+    assert asyncio.run(bucket.acquire(1000)) == 0
+    assert bucket.snapshot()["available"] == 0
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_in == pytest.approx(20)
+
+    # After reset_seconds a single trial goes through; others are still refused
+    clock.now += 20
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    assert breaker.snapshot() == {"opened": 1, "rejected": 2, "state": "closed", "consecutive_failures": 0}
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_trial_is_released():
+    guard = GeminiGuard(failure_threshold=1, reset_seconds=0)
+    guard.breaker.record_failure()
+    assert guard.breaker.state == CircuitBreaker.OPEN
+
+    async def hang():
+        await asyncio.Event().wait()
+
+    async def ok():
+        return "ok"
+
+    async def scenario():
+        trial = asyncio.ensure_future(guard.call(hang))
+        await asyncio.sleep(0)
+        assert guard.breaker.trial_in_flight
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert not guard.breaker.trial_in_flight
+        # The next call becomes the trial instead of being refused forever
+        return await guard.call(ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_trial_cancelled_while_throttled_is_released():
+    guard = GeminiGuard(requests_per_minute=1, failure_threshold=1, reset_seconds=0)
+
+    async def ok():
+        return "ok"
+
+    async def scenario():
+        # Uses up the request quota for the next minute
+        await guard.call(ok)
+        guard.breaker.record_failure()
+        trial = asyncio.ensure_future(guard.call(ok))
+        await asyncio.sleep(0.01)
+        assert guard.breaker.trial_in_flight
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(scenario())
+    assert not guard.breaker.trial_in_flight
+    assert guard.breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(gemini.asyncio, "sleep", no_sleep)
+    guard = GeminiGuard(failure_threshold=5, max_retries=2)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    assert asyncio.run(guard.call(flaky)) == "ok"
+    assert guard.stats["retries"] == 2
+    assert guard.breaker.state == CircuitBreaker.CLOSED
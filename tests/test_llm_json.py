@@ -0,0 +1,104 @@
+from llm_json import CourseStreamParser, ParseStats, merge_continuation, parse_course, parse_tolerant
+
+
+def validate_section(element, position):
+    if not isinstance(element.get("title"), str):
+        return None
+    return {"title": element["title"], "content": element.get("content", ""), "order": element.get("order", position)}
+
+
+def validate_visualization(element):
+    if "related_section_id" not in element:
+        return None
+    return {"title": element.get("title", ""), "related_section_id": str(element["related_section_id"])}
+
+
+def test_clean_response_needs_no_repairs():
+    value, complete, repairs = parse_tolerant('{"sections": [{"title": "A"}], "visualizations": []}')
+    assert value == {"sections": [{"title": "A"}], "visualizations": []}
+    assert complete
+    assert repairs == []
+
+
+def test_truncated_response_keeps_complete_sections():
+    text = '{"sections": [{"title": "A", "content": "first"}, {"title": "B", "content": "cut of'
+    parsed = parse_course(text, validate_section, validate_visualization)
+    assert not parsed.complete
+    assert [section["title"] for section in parsed.sections] == ["A"]
+    assert ParseStats().record(parsed) == "partial"
+
+
+def test_trailing_commas_are_repaired():
+    value, complete, repairs = parse_tolerant('{"sections": [{"title": "A",}, {"title": "B"},],}')
+    assert value == {"sections": [{"title": "A"}, {"title": "B"}]}
+    assert complete
+    assert set(repairs) == {"trailing comma"}
+
+
+def test_comments_are_skipped():
+    text = '{\n  // the outline\n  "sections": [/* first */ {"title": "A", "order": 1 // one\n}]\n}'
+    value, complete, repairs = parse_tolerant(text)
+    assert value == {"sections": [{"title": "A", "order": 1}]}
+    assert complete
+    assert set(repairs) == {"comment"}
+
+
+def test_code_fence_around_the_object_is_ignored():
+    value, complete, repairs = parse_tolerant('```json\n{"sections": []}\n```')
+    assert value == {"sections": []}
+    assert complete
+    assert repairs == []
+
+
+def test_repaired_response_is_counted_as_repaired():
+    parsed = parse_course('{"sections": [{"title": "A"},], "visualizations": [],}', validate_section,
+                          validate_visualization)
+    assert not parsed.clean
+    assert ParseStats().record(parsed) == "repaired"
+
+
+def test_unreadable_response_has_no_sections():
+    parsed = parse_course("I could not produce a course for this video.", validate_section, validate_visualization)
+    assert parsed.sections == []
+    assert ParseStats().record(parsed) == "failed"
+
+
+def test_invalid_elements_are_dropped_and_counted():
+    text = '{"sections": [{"title": "A"}, {"content": "no title"}], "visualizations": [{"title": "chart"}]}'
+    parsed = parse_course(text, validate_section, validate_visualization)
+    assert [section["title"] for section in parsed.sections] == ["A"]
+    assert parsed.visualizations == []
+    assert parsed.invalid == 2
+
+
+def test_continuation_is_merged_after_the_sections_so_far():
+    content = {
+        "sections": [{"title": "Intro", "content": "", "order": 1}, {"title": "Setup", "content": "", "order": 2}],
+        "visualizations": [{"title": "Overview", "related_section_id": "1"}],
+    }
+    # The model numbered its answer from 1 again and repeated a section
+    more = parse_course(
+        '{"sections": [{"title": "setup ", "order": 1}, {"title": "Usage", "order": 2}, {"title": "Wrap-up", "order": 3}],'
+        ' "visualizations": [{"title": "Flow", "related_section_id": 2}, {"title": "Stale", "related_section_id": 1}]}',
+        validate_section, validate_visualization,
+    )
+    merged = merge_continuation(content, more)
+    assert [(section["title"], section["order"]) for section in merged["sections"]] == [
+        ("Intro", 1), ("Setup", 2), ("Usage", 3), ("Wrap-up", 4),
+    ]
+    # Visualizations follow their section's new number; those of repeated sections are dropped
+    assert merged["visualizations"] == [
+        {"title": "Overview", "related_section_id": "1"},
+        {"title": "Flow", "related_section_id": "3"},
+    ]
+    assert len(content["sections"]) == 2
+
+
+def test_stream_parser_emits_sections_as_they_complete():
+    parser = CourseStreamParser()
+    chunks = ['{"sections": [{"title": "A", "con', 'tent": "x"}, {"title": "B",', ' "content": "y",}], ',
+              '"visualizations": [{"title": "V", "related_section_id": "1"}]}']
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    assert [(kind, element["title"]) for kind, element in events] == [
+        ("sections", "A"), ("sections", "B"), ("visualizations", "V"),
+    ]